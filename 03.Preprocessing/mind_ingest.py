@@ -0,0 +1,450 @@
+import io
+import os
+import re
+import sys
+import csv
+import shutil
+import hashlib
+import string
+import argparse
+from itertools import islice
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# The tables are written with the POC's own columnar writer, so the two cannot drift apart
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "06.POC Application"))
+from Shared.ColumnarStore import TOKEN_COLUMNS, VECTOR_COLUMN, manifest_path, read_manifest, write_manifest, write_table
+
+NEWS_COLUMNS = ["News ID", "Category", "SubCategory", "Title", "Abstract", "URL", "Title Entities", "Abstract Entities"]
+BEHAVIORS_COLUMNS = ["Impression ID", "User ID", "Timestamp", "History", "Impressions"]
+MIND_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# Output layout, readable by the POC's Shared/ColumnarStore.load_table:
+#   <output>/news/                      one columnar table
+#   <output>/behaviors/part-00000/ ...  one columnar table per chunk of behaviors.tsv
+# A manifest.json is written last in every directory, so a directory without one is unfinished.
+PARTITION_DIRECTORY = "part-{number:05d}"
+
+WIKIDATA_ID = re.compile(r'"WikidataId":\s*"([^"]+)"')
+PUNCTUATION = "[{}]".format(string.punctuation)
+
+# Stands for "never read" in the per-article first read times
+NEVER = np.iinfo(np.int64).max
+
+
+def _split_tokens(column):
+    # Flat token array plus the row each token belongs to
+    tokens = column.fillna("").astype(str).str.split()
+    lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    flat = np.concatenate(tokens.to_numpy()).astype(object) if lengths.sum() else np.empty(0, dtype=object)
+
+    return flat, np.repeat(np.arange(len(column)), lengths)
+
+
+def _join_tokens(news_ids, codes, owners, n_rows):
+    # Space-separated News IDs of every row, from codes sorted by owner
+    joined = pd.Series(news_ids[codes]).groupby(owners).agg(" ".join)
+
+    return joined.reindex(np.arange(n_rows), fill_value="").to_numpy(dtype=object)
+
+
+def _offsets(owners, n_rows):
+
+    return np.concatenate(([0], np.cumsum(np.bincount(owners, minlength=n_rows)))).astype(np.int64)
+
+
+def _mean_vectors(owners, codes, vectors, n_rows):
+    # Mean of vectors[codes] per owner row; rows without any code get NaN and has_vector False
+    counts = np.bincount(owners, minlength=n_rows)
+    membership = sp.csr_matrix(
+        (np.ones(len(codes), dtype=np.float32), (owners, codes)),
+        shape=(n_rows, len(vectors))
+    )
+    means = np.asarray(membership @ vectors, dtype=np.float32) / np.maximum(counts, 1)[:, None]
+    means[counts == 0] = np.nan
+
+    return means, counts > 0
+
+
+def _finished_manifest(directory):
+    # The manifest of a finished table, or None if the directory is missing or unfinished
+    return read_manifest(directory) if os.path.exists(manifest_path(directory)) else None
+
+
+def load_entity_embeddings(path, chunk_size=100_000):
+    """
+    Loads MIND's entity_embedding.vec as (pd.Index of Wikidata IDs, float32 matrix), chunk by chunk.
+    """
+    ids, blocks = [], []
+    chunks = pd.read_csv(path, sep="\t", header=None, index_col=0, quoting=csv.QUOTE_NONE, chunksize=chunk_size)
+    for chunk in chunks:
+        chunk = chunk.dropna(axis=1, how="all")
+        ids.append(chunk.index.astype(str).to_numpy(dtype=object))
+        blocks.append(chunk.to_numpy(dtype=np.float32))
+
+    return pd.Index(np.concatenate(ids)), np.concatenate(blocks)
+
+
+def _split_category_words(categories):
+    # 'foodanddrink' -> 'food and drink', looked up once per distinct category
+    import wordninja
+
+    unique = pd.unique(categories)
+    split = {category: " ".join(wordninja.split(category)) for category in unique}
+
+    return categories.map(split)
+
+
+def _clean_news_chunk(chunk):
+    # Notebook cleaning of one chunk, except for the vectors (see clean_news)
+    chunk = chunk.copy()
+
+    chunk["Category"] = _split_category_words(chunk["Category"])
+    chunk["SubCategory"] = _split_category_words(chunk["SubCategory"])
+    for column in ["Category", "SubCategory", "Title", "Abstract"]:
+        chunk[column] = chunk[column].str.lower()
+
+    content = chunk["Category"] + " " + chunk["SubCategory"] + " " + chunk["Title"] + " " + chunk["Abstract"]
+    chunk["Content"] = content.str.replace(PUNCTUATION, "", regex=True)
+    chunk["Content_WC"] = chunk["Content"].str.split().str.len()
+
+    # Wikidata IDs of the title and abstract entities, in order (duplicates count twice in the mean)
+    chunk["Wikidata IDs"] = (
+        chunk["Title Entities"].str.findall(WIKIDATA_ID).str.join(" ")
+        + " " + chunk["Abstract Entities"].str.findall(WIKIDATA_ID).str.join(" ")
+    )
+
+    return chunk.drop(columns=["Title Entities", "Abstract Entities"])
+
+
+def _impute_vectors(vectors, has_vector, keys):
+    # Fill missing vectors with the mean vector of the articles sharing the same keys
+    missing = np.flatnonzero(~has_vector)
+    if len(missing) == 0 or not has_vector.any():
+        return
+
+    means = pd.DataFrame(vectors[has_vector]).groupby([key[has_vector] for key in keys]).mean()
+    lookup = pd.MultiIndex.from_arrays([key[missing] for key in keys]) if len(keys) > 1 else pd.Index(keys[0][missing])
+    positions = means.index.get_indexer(lookup)
+
+    found = positions >= 0
+    vectors[missing[found]] = means.to_numpy(dtype=np.float32)[positions[found]]
+    has_vector[missing[found]] = True
+
+
+def clean_news(news_path, entity_path, chunk_size=100_000):
+    """
+    Cleans MIND's news.tsv as the preprocessing notebook does, reading it chunk by chunk.
+
+    Rows with a missing field and duplicate rows are dropped, categories are split into words
+    ('foodanddrink' -> 'food and drink'), text is lowercased and 'Content' is the category,
+    subcategory, title and abstract without punctuation. 'Average Vector' is the mean entity
+    embedding of the title and abstract entities; articles without any known entity get the mean of
+    their (Category, SubCategory), then of their Category.
+
+    The notebook's stop word filter compared whole texts to stop words and never removed anything,
+    so it is left out.
+
+    Returns:
+      (news DataFrame without 'Average Vector', (n_news, d) float32 vectors, has_vector)
+    """
+    entity_ids, entity_vectors = load_entity_embeddings(entity_path, chunk_size)
+
+    seen_hashes = np.empty(0, dtype=np.uint64)
+    cleaned, vector_blocks, known_blocks = [], [], []
+    chunks = pd.read_csv(
+        news_path, sep="\t", header=None, names=NEWS_COLUMNS,
+        usecols=[column for column in NEWS_COLUMNS if column != "URL"], chunksize=chunk_size
+    )
+    for chunk in chunks:
+        chunk = chunk.dropna()
+
+        # Duplicates within the chunk and with earlier chunks
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, seen_hashes)
+        seen_hashes = np.union1d(seen_hashes, hashes[keep])
+
+        chunk = _clean_news_chunk(chunk[keep]).reset_index(drop=True)
+
+        entities, owners = _split_tokens(chunk["Wikidata IDs"])
+        codes = entity_ids.get_indexer(entities)
+        vectors, has_vector = _mean_vectors(owners[codes >= 0], codes[codes >= 0], entity_vectors, len(chunk))
+
+        cleaned.append(chunk.drop(columns=["Wikidata IDs"]))
+        vector_blocks.append(vectors)
+        known_blocks.append(has_vector)
+
+    news = pd.concat(cleaned, ignore_index=True)
+    vectors = np.concatenate(vector_blocks)
+    has_vector = np.concatenate(known_blocks)
+
+    _impute_vectors(vectors, has_vector, [news["Category"].to_numpy(), news["SubCategory"].to_numpy()])
+    _impute_vectors(vectors, has_vector, [news["Category"].to_numpy()])
+
+    return news, vectors, has_vector
+
+
+def _read_lines(path, start, chunk_size):
+    # Up to chunk_size raw lines from byte offset `start`, and the offset after them
+    with open(path, "rb") as file:
+        file.seek(start)
+        lines = list(islice(file, chunk_size))
+
+        return lines, file.tell()
+
+
+def _parse_impressions(column, news_index):
+    # News codes, click labels (1, 0, or -1 when unlabelled) and owning row of every shown article
+    tokens, owners = _split_tokens(column)
+    parts = pd.Series(tokens, dtype=object).str.rsplit("-", n=1, expand=True)
+
+    if parts.shape[1] > 1:
+        news_ids = parts[0].where(parts[1].notna(), pd.Series(tokens)).to_numpy(dtype=object)
+        labels = pd.to_numeric(parts[1], errors="coerce").fillna(-1).to_numpy(dtype=np.int8)
+    else:
+        news_ids = tokens
+        labels = np.full(len(tokens), -1, dtype=np.int8)
+
+    codes = news_index.get_indexer(news_ids)
+    known = codes >= 0
+
+    return codes[known].astype(np.int32), labels[known], owners[known]
+
+
+def clean_behaviors_chunk(chunk, news_index, vectors, has_vector):
+    """
+    Cleans one chunk of behaviors as the preprocessing notebook does, on token arrays.
+
+    History keeps each article once (first read first); History and Impressions only keep articles of
+    the cleaned news; Impressions only keeps clicked articles (all of them when unlabelled), while every
+    shown article and its click label is kept separately. 'Average Vector' is the mean vector of the
+    distinct articles of History and Impressions that have one (has_vector).
+
+    Returns:
+      dict with the table, vectors, has_vector, token CSR columns, the shown articles with their labels,
+      and the first History read time of every article (NEVER when not read in this chunk).
+    """
+    n_rows, n_news = len(chunk), len(news_index)
+    news_ids = news_index.to_numpy(dtype=object)
+    timestamps = pd.to_datetime(chunk["Timestamp"], format=MIND_TIMESTAMP_FORMAT).reset_index(drop=True)
+
+    # History: known articles, each once per row in order of first appearance
+    history, history_owners = _split_tokens(chunk["History"])
+    history_codes = news_index.get_indexer(history)
+    known = history_codes >= 0
+    history_codes, history_owners = history_codes[known], history_owners[known]
+    _, first = np.unique(history_owners.astype(np.int64) * n_news + history_codes, return_index=True)
+    first = np.sort(first)
+    history_codes, history_owners = history_codes[first].astype(np.int32), history_owners[first]
+
+    shown_codes, shown_labels, shown_owners = _parse_impressions(chunk["Impressions"], news_index)
+    clicked = shown_labels != 0
+    impression_codes, impression_owners = shown_codes[clicked], shown_owners[clicked]
+
+    # History & Impressions: the history followed by the clicks of every row
+    combined = np.concatenate([history_owners, impression_owners])
+    order = np.argsort(combined, kind="stable")
+    combined_codes = np.concatenate([history_codes, impression_codes])[order]
+    combined_owners = combined[order]
+
+    distinct = np.unique(combined_owners.astype(np.int64) * n_news + combined_codes)
+    vector_rows, vector_codes = np.divmod(distinct, n_news)
+    with_vector = has_vector[vector_codes]
+    row_vectors, row_has_vector = _mean_vectors(vector_rows[with_vector], vector_codes[with_vector], vectors, n_rows)
+
+    table = pd.DataFrame({
+        "User ID": chunk["User ID"].to_numpy(dtype=object),
+        "Timestamp": timestamps,
+        "History": _join_tokens(news_ids, history_codes, history_owners, n_rows),
+        "Impressions": _join_tokens(news_ids, impression_codes, impression_owners, n_rows),
+        "History & Impressions": _join_tokens(news_ids, combined_codes, combined_owners, n_rows),
+    })
+
+    first_read = np.full(n_news, NEVER, dtype=np.int64)
+    np.minimum.at(first_read, history_codes, timestamps.to_numpy(dtype="datetime64[ns]").astype(np.int64)[history_owners])
+
+    return {
+        "table": table,
+        "vectors": row_vectors,
+        "has_vector": row_has_vector,
+        "tokens": {
+            "History": (news_ids, _offsets(history_owners, n_rows), history_codes),
+            "Impressions": (news_ids, _offsets(impression_owners, n_rows), impression_codes.astype(np.int32)),
+            "History & Impressions": (news_ids, _offsets(combined_owners, n_rows), combined_codes.astype(np.int32)),
+        },
+        "shown": (_offsets(shown_owners, n_rows), shown_codes, shown_labels),
+        "first_read": first_read,
+    }
+
+
+def _news_fingerprint(news, vectors, has_vector):
+    # Partitions store news codes and mean vectors, so they are only reusable with the same news IDs in
+    # the same order and the same article vectors
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(news["News ID"], index=False).to_numpy().tobytes())
+    digest.update(np.ascontiguousarray(vectors).tobytes())
+    digest.update(np.ascontiguousarray(has_vector).tobytes())
+
+    return digest.hexdigest()
+
+
+def _completed_partitions(directory, chunk_size, fingerprint):
+    # Manifests of the leading partitions that can be reused as they are
+    manifests = []
+    while True:
+        manifest = _finished_manifest(os.path.join(directory, PARTITION_DIRECTORY.format(number=len(manifests))))
+        expected_start = manifests[-1]["source_stop"] if manifests else 0
+        if (
+            manifest is None
+            or manifest["chunk_size"] != chunk_size
+            or manifest["news_fingerprint"] != fingerprint
+            or manifest["source_start"] != expected_start
+        ):
+            return manifests
+        manifests.append(manifest)
+
+
+def ingest_behaviors(behaviors_path, news, vectors, has_vector, output_directory, chunk_size=100_000, resume=True):
+    """
+    Cleans MIND's behaviors.tsv into one columnar partition per chunk of chunk_size lines.
+
+    Each partition records the byte range of behaviors.tsv it came from, so a rerun skips the
+    partitions that are already written and carries on from the first missing one. Only one
+    chunk is held in memory, plus the row hashes used to drop duplicate rows across partitions.
+
+    Returns:
+      (partition names, first History read time of every article as int64 ns, NEVER if never read)
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    if os.path.exists(manifest_path(output_directory)):
+        os.remove(manifest_path(output_directory))
+
+    news_index = pd.Index(news["News ID"])
+    fingerprint = _news_fingerprint(news, vectors, has_vector)
+    completed = _completed_partitions(output_directory, chunk_size, fingerprint) if resume else []
+
+    # Partitions after the reusable ones are stale
+    for name in os.listdir(output_directory):
+        if name.startswith("part-") and int(name.split("-")[1]) >= len(completed):
+            shutil.rmtree(os.path.join(output_directory, name))
+
+    first_read = np.full(len(news), NEVER, dtype=np.int64)
+    seen_hashes = np.empty(0, dtype=np.uint64)
+    for number in range(len(completed)):
+        directory = os.path.join(output_directory, PARTITION_DIRECTORY.format(number=number))
+        first_read = np.minimum(first_read, np.load(os.path.join(directory, "first_read.npy")))
+        seen_hashes = np.union1d(seen_hashes, np.load(os.path.join(directory, "row_hashes.npy")))
+
+    partitions = [PARTITION_DIRECTORY.format(number=number) for number in range(len(completed))]
+    start = completed[-1]["source_stop"] if completed else 0
+    size = os.path.getsize(behaviors_path)
+
+    while start < size:
+        lines, stop = _read_lines(behaviors_path, start, chunk_size)
+        chunk = pd.read_csv(io.BytesIO(b"".join(lines)), sep="\t", header=None, names=BEHAVIORS_COLUMNS)
+
+        # Drop rows repeated within the chunk or seen in an earlier partition
+        hashes = pd.util.hash_pandas_object(chunk[BEHAVIORS_COLUMNS[1:]], index=False).to_numpy()
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, seen_hashes)
+        seen_hashes = np.union1d(seen_hashes, hashes[keep])
+
+        cleaned = clean_behaviors_chunk(chunk[keep], news_index, vectors, has_vector)
+        first_read = np.minimum(first_read, cleaned["first_read"])
+
+        shown_offsets, shown_codes, shown_labels = cleaned["shown"]
+        name = PARTITION_DIRECTORY.format(number=len(partitions))
+        write_table(
+            os.path.join(output_directory, name),
+            cleaned["table"],
+            vectors=cleaned["vectors"],
+            has_vector=cleaned["has_vector"],
+            tokens=cleaned["tokens"],
+            arrays={
+                "shown_offsets": shown_offsets,
+                "shown_values": shown_codes,
+                "shown_labels": shown_labels,
+                "first_read": cleaned["first_read"],
+                "row_hashes": np.unique(hashes[keep]),
+            },
+            metadata={
+                "source_start": start,
+                "source_stop": stop,
+                "chunk_size": chunk_size,
+                "news_fingerprint": fingerprint,
+            }
+        )
+        partitions.append(name)
+        start = stop
+        print(f"{name}: {len(cleaned['table'])} behaviors ({stop / size:.0%} of {os.path.basename(behaviors_path)})")
+
+    return partitions, first_read
+
+
+def release_dates(first_read):
+    """'Release Date' of every article: its first History read, or the earliest release date if never read."""
+    dates = pd.to_datetime(np.where(first_read == NEVER, np.iinfo(np.int64).min, first_read).astype("datetime64[ns]"))
+
+    return dates.fillna(dates.min())
+
+
+def ingest(raw_directory, output_directory, chunk_size=100_000, resume=True):
+    """
+    Ingests a raw MIND split (news.tsv, behaviors.tsv, entity_embedding.vec) into partitioned columnar
+    tables with the columns of the notebook's Clean/<version>/news.pkl and behaviors.pkl.
+
+    Writing to 01.Dataset/<size>/Clean/<version>/Columnar makes the POC load the result instead of
+    the pickles. Memory is bounded by chunk_size and the news catalogue, not by the number of behaviors,
+    so MIND-large ingests on a single machine.
+
+    Parameters:
+      raw_directory (str): Folder of the raw split.
+      output_directory (str): Folder receiving news/ and behaviors/.
+      chunk_size (int): Lines per chunk of the TSV files (one behaviors partition per chunk).
+      resume (bool): Reuse the behaviors partitions written by an earlier, interrupted run.
+    """
+    news, vectors, has_vector = clean_news(
+        os.path.join(raw_directory, "news.tsv"), os.path.join(raw_directory, "entity_embedding.vec"), chunk_size
+    )
+
+    behaviors_directory = os.path.join(output_directory, "behaviors")
+    partitions, first_read = ingest_behaviors(
+        os.path.join(raw_directory, "behaviors.tsv"), news, vectors, has_vector, behaviors_directory,
+        chunk_size=chunk_size, resume=resume
+    )
+
+    # Behaviors are complete once their partition list is written
+    manifests = [read_manifest(os.path.join(behaviors_directory, name)) for name in partitions]
+    write_manifest(behaviors_directory, {
+        "rows": sum(manifest["rows"] for manifest in manifests),
+        "columns": manifests[0]["columns"] if manifests else [],
+        "vector_column": VECTOR_COLUMN,
+        "token_columns": list(TOKEN_COLUMNS),
+        "partitions": partitions,
+    })
+
+    news["Release Date"] = release_dates(first_read)
+    columns = ["News ID", "Category", "SubCategory", "Title", "Abstract", "Content", "Content_WC"]
+    write_table(
+        os.path.join(output_directory, "news"),
+        news[columns + ["Release Date"]],
+        vectors=vectors,
+        has_vector=has_vector,
+        # Same column order as the notebook's news.pkl
+        columns=columns + [VECTOR_COLUMN, "Release Date"]
+    )
+
+    return news, partitions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a raw MIND split into partitioned columnar tables.")
+    parser.add_argument("raw_directory", help="Folder with news.tsv, behaviors.tsv and entity_embedding.vec")
+    parser.add_argument("output_directory", help="e.g. 01.Dataset/Large/Clean/Train/Columnar")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="TSV lines per chunk / behaviors partition")
+    parser.add_argument("--no-resume", action="store_true", help="Rewrite every behaviors partition")
+    args = parser.parse_args()
+
+    news, partitions = ingest(args.raw_directory, args.output_directory, args.chunk_size, resume=not args.no_resume)
+
+    print(f"Ingested {len(news)} articles and {len(partitions)} behaviors partitions into {args.output_directory}")
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from synthetic_mind import scale_sizes, write_workspace
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POC_DIRECTORY = os.path.join(REPOSITORY, "06.POC Application")
+MODELS_DIRECTORY = os.path.join(REPOSITORY, "Models")
+
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+PERCENTILES = (50, 90, 99)
+
+# Metrics compared with the baseline; lower is better for all of them
+COMPARED_METRICS = ("cold_ms", "p50_ms", "p99_ms", "peak_rss_mb")
+
+
+def _frequency_categorical(paths):
+    # Stores are built on the first request, from the processed parquet files, then reused
+    from categorical_frequency_model import build_user_aggregates, frequency_categorical_recommender
+    stores = {}
+
+    def recommend(request):
+        if not stores:
+            stores["user"], stores["category"] = build_user_aggregates(
+                pd.read_parquet(paths["processed_behaviors"]), pd.read_parquet(paths["processed_news"])
+            )
+        return frequency_categorical_recommender(
+            request["user_id"], n_recommendations=request["k"],
+            user_store=stores["user"], category_store=stores["category"]
+        )
+
+    return recommend
+
+
+def _pure_content(paths):
+    from FewArticlesRead.PureContentEmbeddingsRecommender import pure_content_embeddings_recommender
+
+    def recommend(request):
+        return pure_content_embeddings_recommender(request["read_articles"], request["timestamp"], articles_k=request["k"])
+
+    return recommend
+
+
+def _collaborative(paths):
+    from EnoughArticlesRead.FetchSimilarUsers import fetch_similar_users
+    from EnoughArticlesRead.CollaborativeRecommender import collaborative_recommender
+    from EnoughArticlesRead.CombinedEmbeddingsRecommender import combined_embeddings_recommender
+
+    def recommend(request):
+        similar_users_timestamps = fetch_similar_users(request["read_articles"], request["timestamp"])
+        recommended_article_ids = collaborative_recommender(request["read_articles"], request["timestamp"], similar_users_timestamps)
+        return combined_embeddings_recommender(request["read_articles"], request["timestamp"], recommended_article_ids, k=request["k"])
+
+    return recommend
+
+
+def _candidate_pipeline(paths):
+    # Without co-read: its index is built from every session's article pairs, which needs a prebuilt file at large scales.
+    # The news ANN index is prebuilt by prebuild_indexes, as a deployment would
+    from CandidatePipeline import CandidatePipeline, DEFAULT_QUOTAS
+    pipeline = CandidatePipeline(quotas={name: quota for name, quota in DEFAULT_QUOTAS.items() if name != "co-read"})
+
+    def recommend(request):
+        return pipeline.recommend(request["read_articles"], request["timestamp"], k=request["k"])
+
+    return recommend
+
+
+def _popularity_category(paths):
+    from NoArticlesRead.PopularityCategoryRecommender import popularity_category_recommender
+
+    def recommend(request):
+        return popularity_category_recommender(request["timestamp"], request["categories"], request["read_articles"], k=request["k"])
+
+    return recommend
+
+
+# Benchmark name -> (factory of a recommend(request) function, minimum history length of its requests)
+BENCHMARKS = {
+    "frequency_categorical": (_frequency_categorical, 0),
+    "pure_content": (_pure_content, 1),
+    "collaborative": (_collaborative, 5),
+    "candidate_pipeline": (_candidate_pipeline, 1),
+    "popularity_category": (_popularity_category, 0),
+}
+
+
+def sample_requests(paths, n_requests, min_history=0, k=5, seed=0):
+    """
+    n_requests interactions drawn from the workspace's behaviors, as request dicts with the user_id,
+    timestamp, read_articles (the history), categories (two chosen at random) and k.
+    """
+    rng = np.random.default_rng(seed)
+    behaviors = pd.read_parquet(paths["processed_behaviors"], columns=["user_id", "time", "history"])
+    histories = behaviors["history"].fillna("").str.split()
+    candidates = np.flatnonzero(histories.str.len().to_numpy() >= min_history)
+    categories = pd.read_parquet(paths["processed_news"], columns=["category"])["category"].unique()
+
+    rows = rng.choice(candidates, min(n_requests, len(candidates)), replace=len(candidates) < n_requests)
+
+    return [
+        {
+            "user_id": behaviors["user_id"].iat[row],
+            "timestamp": behaviors["time"].iat[row],
+            "read_articles": histories.iat[row],
+            "categories": rng.choice(categories, min(2, len(categories)), replace=False).tolist(),
+            "k": k,
+        }
+        for row in rows
+    ]
+
+
+def _peak_rss_mb():
+    # VmHWM is this process's own peak; ru_maxrss survives fork + exec, so it can be the parent's peak
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def prebuild_indexes(paths):
+    """
+    Builds the indexes a deployment prebuilds offline (the news ANN index of the candidate pipeline)
+    in the workspace, unless they are already there. Run in its own process, so no benchmark's cold
+    start or peak RSS includes it.
+    """
+    os.chdir(paths["poc"])
+    sys.path[:0] = [POC_DIRECTORY, MODELS_DIRECTORY]
+    from Shared.EmbeddingMatrix import get_news_embeddings
+    from Shared.NewsAnnIndex import NewsAnnIndex, news_ann_index_available, news_ann_index_path
+
+    if not news_ann_index_available():
+        NewsAnnIndex.build(get_news_embeddings()).save(news_ann_index_path())
+
+
+def run_benchmark(name, paths, requests):
+    """
+    Times one benchmark in the current process, which should be fresh: the first request is cold (it
+    loads the datasets and builds the indexes), the others are warm.
+
+    Returns:
+      dict with import_ms, cold_ms, p50/p90/p99/mean_ms of the warm requests and peak_rss_mb.
+    """
+    os.chdir(paths["poc"])
+    sys.path[:0] = [POC_DIRECTORY, MODELS_DIRECTORY]
+
+    started = time.perf_counter()
+    recommend = BENCHMARKS[name][0](paths)
+    imported = time.perf_counter()
+    recommend(requests[0])
+    cold = time.perf_counter()
+
+    latencies = []
+    for request in requests[1:]:
+        request_started = time.perf_counter()
+        recommend(request)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+
+    latencies = np.array(latencies) if latencies else np.full(1, np.nan)
+
+    return {
+        "import_ms": (imported - started) * 1000,
+        "cold_ms": (cold - imported) * 1000,
+        **{f"p{percentile}_ms": float(np.percentile(latencies, percentile)) for percentile in PERCENTILES},
+        "mean_ms": float(latencies.mean()),
+        "requests": len(requests),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_suite(scales=DEFAULT_SCALES, names=tuple(BENCHMARKS), workspace="benchmark_workspace", n_requests=200, seed=0):
+    """
+    Runs every benchmark at every scale, each in a fresh spawned process so cold times and peak RSS are
+    its own. Synthetic workspaces are generated once per (scale, seed) and reused by later runs.
+
+    Returns:
+      {"seed", "scales": {n_impressions: {benchmark: metrics}}}, as run_benchmark's metrics.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {"seed": seed, "scales": {}}
+
+    for scale in scales:
+        paths = write_workspace(os.path.join(os.path.abspath(workspace), f"mind_{scale}"), scale, seed=seed)
+        results["scales"][str(scale)] = {}
+
+        if "candidate_pipeline" in names:
+            with context.Pool(1) as pool:
+                pool.apply(prebuild_indexes, (paths,))
+
+        for name in names:
+            requests = sample_requests(paths, n_requests + 1, min_history=BENCHMARKS[name][1], seed=seed)
+            with context.Pool(1) as pool:
+                metrics = pool.apply(run_benchmark, (name, paths, requests))
+
+            results["scales"][str(scale)][name] = metrics
+            print(f"{scale:>10} {name:<22} cold {metrics['cold_ms']:9.1f} ms  p50 {metrics['p50_ms']:8.2f} ms  "
+                  f"p99 {metrics['p99_ms']:8.2f} ms  peak RSS {metrics['peak_rss_mb'] or float('nan'):8.1f} MB")
+
+    return results
+
+
+def scaling_curves(results, metric="p50_ms"):
+    """
+    One row per benchmark and one column per scale of `metric`, plus the growth exponent between the
+    smallest and largest scale: metric ~ n_impressions ** exponent (0 flat, 1 linear).
+    """
+    curves = pd.DataFrame({
+        int(scale): {name: metrics[metric] for name, metrics in benchmarks.items()}
+        for scale, benchmarks in results["scales"].items()
+    }).sort_index(axis=1)
+
+    if curves.shape[1] > 1:
+        smallest, largest = curves.columns[0], curves.columns[-1]
+        curves["exponent"] = np.log(curves[largest] / curves[smallest]) / np.log(largest / smallest)
+
+    return curves
+
+
+def find_regressions(results, baseline, tolerance=1.25):
+    """
+    (scale, benchmark, metric, baseline value, value) of every metric over tolerance times its baseline,
+    for the scales and benchmarks both runs have.
+    """
+    regressions = []
+    for scale, benchmarks in results["scales"].items():
+        for name, metrics in benchmarks.items():
+            reference = baseline.get("scales", {}).get(scale, {}).get(name)
+            if reference is None:
+                continue
+
+            for metric in COMPARED_METRICS:
+                value, expected = metrics.get(metric), reference.get(metric)
+                if value is not None and expected is not None and value > tolerance * expected:
+                    regressions.append((int(scale), name, metric, expected, value))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every recommender on synthetic MIND-shaped data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="Impressions per dataset, e.g. 10000 to 10000000")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--requests", type=int, default=200, help="Warm requests timed per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workspace", default="benchmark_workspace", help="Folder of the generated datasets")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results to flag regressions against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="A metric regresses above tolerance x its baseline")
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        n_news, n_users, _ = scale_sizes(scale)
+        print(f"Scale {scale}: {n_users} users, {n_news} articles")
+
+    results = run_suite(args.scales, args.benchmarks, args.workspace, args.requests, args.seed)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    for metric in ("cold_ms", "p50_ms", "p99_ms", "peak_rss_mb"):
+        print(f"\n{metric} by impressions")
+        print(scaling_curves(results, metric).round(2).to_string())
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+
+        for scale, name, metric, expected, value in regressions:
+            print(f"REGRESSION {scale} {name} {metric}: {expected:.2f} -> {value:.2f}")
+        if regressions:
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
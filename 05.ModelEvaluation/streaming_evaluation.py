@@ -0,0 +1,331 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+BEHAVIORS_COLUMNS = ["Impression ID", "User ID", "Timestamp", "History", "Impressions"]
+MIND_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# A (User ID, Timestamp) key as JSON ('["U1", "2019-11-11 09:05:58"]') or as the repr of a Python list or
+# tuple written by the notebooks ("['U1', '2019-11-11 09:05:58']", "('U1', Timestamp('2019-11-11 09:05:58'))")
+KEY_PATTERN = r"""^[\[(]\s*['"]([^'"]*)['"]\s*,\s*(?:Timestamp\()?['"]([^'"]*)['"]\)?\s*[\])]$"""
+
+
+class Predictions:
+    """
+    One model's recommendations as a compact matrix instead of a dict of Python lists.
+
+    keys: pd.Index of '["User ID", "Timestamp"]' strings, the key format of the prediction JSON files
+    rows: (n_keys, max_k) int32 matrix of article codes in ranked order, padded with -1
+    """
+
+    def __init__(self, keys, rows):
+
+        self.keys = pd.Index(keys)
+        self.rows = rows
+
+    @classmethod
+    def from_dict(cls, predictions, vocabulary):
+        """
+        Encodes a {key: [News IDs]} dict against the article vocabulary (unknown IDs become -1).
+
+        Keys may use any of the formats of KEY_PATTERN and are stored as JSON keys. Ranked entries may
+        also be [News ID, score] pairs, as in the notebooks' cosine similarity files.
+        """
+        keys = normalize_keys(list(predictions))
+        values = [[entry[0] if isinstance(entry, (list, tuple)) else entry for entry in value] for value in predictions.values()]
+        lengths = np.array([len(value) for value in values], dtype=np.int64)
+        rows = np.full((len(keys), int(lengths.max(initial=0))), -1, dtype=np.int32)
+
+        if lengths.sum():
+            codes = vocabulary.get_indexer(np.concatenate(values).astype(object))
+            columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            rows[np.repeat(np.arange(len(keys)), lengths), columns] = codes
+
+        return cls(keys, rows)
+
+
+def normalize_keys(keys):
+    """The '["User ID", "Timestamp"]' JSON form of prediction keys written in any KEY_PATTERN format."""
+    parts = pd.Series(keys, dtype=object).astype(str).str.extract(KEY_PATTERN)
+    unparsed = parts[0].isna().to_numpy()
+    if unparsed.any():
+        raise ValueError(f"Unrecognized prediction key {keys[np.flatnonzero(unparsed)[0]]!r}; expected e.g. '[\"U1\", \"2019-11-11 09:05:58\"]'")
+
+    return ('["' + parts[0] + '", "' + parts[1] + '"]').to_numpy(dtype=object)
+
+
+def interaction_keys(user_ids, timestamps):
+    """The '["User ID", "Timestamp"]' keys of the prediction files, for a whole column at once."""
+    return '["' + pd.Series(user_ids).astype(str).to_numpy(dtype=object) + '", "' + pd.Series(pd.to_datetime(timestamps)).astype(str).to_numpy(dtype=object) + '"]'
+
+
+def load_predictions(path, vocabulary):
+    """
+    Loads a prediction file as Predictions.
+
+    Parameters:
+      path (str): A {key: [News IDs]} .json file as used in the evaluation notebook (keys and entries in
+        any format Predictions.from_dict reads), or a .jsonl file
+        of {"user_id", "timestamp", "news_ids"} records as written by the POC ScoringRunner.
+      vocabulary (pd.Index): News IDs; article codes are positions in it.
+    """
+    if path.endswith(".jsonl"):
+        predictions = {}
+        with open(path) as file:
+            for line in file:
+                record = json.loads(line)
+                predictions[json.dumps([record["user_id"], record["timestamp"]])] = record["news_ids"]
+    else:
+        with open(path) as file:
+            predictions = json.load(file)
+
+    return Predictions.from_dict(predictions, vocabulary)
+
+
+def read_behaviors(path, chunk_size=100_000):
+    """
+    Yields the behaviors ground truth in chunks with columns User ID, Timestamp, History, Impressions.
+
+    A raw MIND behaviors.tsv is streamed, and keeps its 'N123-1 N456-0' click labels (needed for AUC).
+    A cleaned behaviors.pkl only holds clicked articles and has to be unpickled whole before slicing.
+    """
+    if path.endswith(".tsv"):
+        chunks = pd.read_csv(path, sep="\t", header=None, names=BEHAVIORS_COLUMNS, chunksize=chunk_size)
+        for chunk in chunks:
+            chunk["Timestamp"] = pd.to_datetime(chunk["Timestamp"], format=MIND_TIMESTAMP_FORMAT)
+            yield chunk
+    else:
+        behaviors = pd.read_pickle(path)
+        for start in range(0, len(behaviors), chunk_size):
+            yield behaviors.iloc[start:start + chunk_size]
+
+
+def _split_tokens(column):
+    # Flat token array plus the number of tokens of each row
+    tokens = column.fillna("").astype(str).str.split()
+    lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    flat = np.concatenate(tokens.to_numpy()) if lengths.sum() else np.empty(0, dtype=object)
+
+    return flat.astype(object), lengths
+
+
+def _parse_impressions(column, vocabulary):
+    # Article codes, click labels and owning row of every shown article; unlabelled tokens count as clicked
+    tokens, lengths = _split_tokens(column)
+    parts = pd.Series(tokens, dtype=object).str.rsplit("-", n=1, expand=True)
+    labelled = parts[1].notna().to_numpy() if parts.shape[1] > 1 else np.zeros(len(tokens), dtype=bool)
+
+    news_ids = np.where(labelled, parts[0].to_numpy(dtype=object), tokens) if len(tokens) else tokens
+    clicked = ~labelled | (parts[1].to_numpy(dtype=object) == "1") if labelled.any() else np.ones(len(tokens), dtype=bool)
+
+    return vocabulary.get_indexer(news_ids), clicked, labelled, np.repeat(np.arange(len(lengths)), lengths)
+
+
+class StreamingEvaluator:
+    """
+    Accumulates HR@k, MRR, nDCG@k, AUC, coverage and novelty for several models over chunks of behaviors.
+
+    Each chunk is parsed once and scored against every model with array operations; only running
+    sums, per-article recommendation counts and per-article read counts are kept between chunks,
+    so memory is bounded by the chunk size, not by the split.
+
+    Metrics, over the interactions a model has predictions for and at least one clicked article:
+      HR@k: share of interactions with a clicked article among the top k
+      MRR: mean of 1 / rank of the first clicked article in the recommendation list (0 if none)
+      nDCG@k: binary-relevance DCG of the top k over the ideal DCG of min(clicks, k) hits
+      AUC: per impression with clicked and non-clicked articles (labelled tsv only), probability that a
+        clicked article ranks above a skipped one; recommended articles score by rank, the rest tie last
+      Coverage: share of the catalogue recommended at least once
+      Novelty: mean -log2 popularity of recommended articles, popularity being the (add-one smoothed)
+        share of interactions whose history or clicks contain the article
+    """
+
+    def __init__(self, models, vocabulary, ks=(5, 10)):
+
+        self.models = models
+        self.vocabulary = vocabulary
+        self.ks = tuple(ks)
+
+        self.interactions = 0
+        self.read_counts = np.zeros(len(vocabulary), dtype=np.int64)
+        metrics = ["mrr", "auc"] + [f"hr@{k}" for k in self.ks] + [f"ndcg@{k}" for k in self.ks]
+        self.sums = {name: {"interactions": 0, "auc_impressions": 0, **dict.fromkeys(metrics, 0.0)} for name in models}
+        self.recommended_counts = {name: np.zeros(len(vocabulary), dtype=np.int64) for name in models}
+        self.matched = dict.fromkeys(models, 0)
+
+    def update(self, chunk):
+        """Adds one chunk of behaviors (User ID, Timestamp, History, Impressions) to every model's totals."""
+        n_articles = len(self.vocabulary)
+        codes, clicked, labelled, owners = _parse_impressions(chunk["Impressions"], self.vocabulary)
+        known = codes >= 0
+
+        # Popularity for novelty: every interaction counts an article once, from its history or clicks
+        history, history_lengths = _split_tokens(chunk["History"])
+        history_codes = self.vocabulary.get_indexer(history)
+        history_owners = np.repeat(np.arange(len(chunk)), history_lengths)
+        seen = np.concatenate([
+            history_owners[history_codes >= 0].astype(np.int64) * n_articles + history_codes[history_codes >= 0],
+            owners[known & clicked].astype(np.int64) * n_articles + codes[known & clicked],
+        ])
+        np.add.at(self.read_counts, np.unique(seen) % n_articles, 1)
+        self.interactions += len(chunk)
+
+        # (row, article) pairs of clicks, sorted for membership tests
+        click_keys = np.unique(owners[known & clicked].astype(np.int64) * n_articles + codes[known & clicked])
+        click_counts = np.bincount(click_keys // n_articles, minlength=len(chunk))
+
+        keys = interaction_keys(chunk["User ID"], chunk["Timestamp"])
+        for name, predictions in self.models.items():
+            positions = predictions.keys.get_indexer(keys)
+            self.matched[name] += int((positions >= 0).sum())
+            chunk_rows = np.flatnonzero((positions >= 0) & (click_counts > 0))
+            if len(chunk_rows) == 0:
+                continue
+
+            recommended = predictions.rows[positions[chunk_rows]]
+            self._update_model(name, chunk_rows, recommended, click_keys, click_counts, codes, clicked, labelled, owners)
+
+    def _update_model(self, name, chunk_rows, recommended, click_keys, click_counts, codes, clicked, labelled, owners):
+
+        sums = self.sums[name]
+        n_articles = len(self.vocabulary)
+        n_recommended = recommended.shape[1]
+
+        valid = recommended >= 0
+        recommendation_keys = chunk_rows[:, None].astype(np.int64) * n_articles + recommended
+        hits = valid & np.isin(recommendation_keys, click_keys)
+
+        sums["interactions"] += len(chunk_rows)
+        np.add.at(self.recommended_counts[name], recommended[valid], 1)
+
+        # Every prediction list of the chunk may be empty, which leaves nothing to take the argmax of
+        if n_recommended:
+            any_hit = hits.any(axis=1)
+            sums["mrr"] += float((any_hit / (hits.argmax(axis=1) + 1)).sum())
+
+        discounts = 1 / np.log2(np.arange(2, n_recommended + 2))
+        ideal = np.concatenate(([0], np.cumsum(1 / np.log2(np.arange(2, max(self.ks) + 2)))))
+        for k in self.ks:
+            sums[f"hr@{k}"] += float(hits[:, :k].any(axis=1).sum())
+            dcg = hits[:, :k] @ discounts[:min(k, n_recommended)]
+            sums[f"ndcg@{k}"] += float((dcg / ideal[np.minimum(click_counts[chunk_rows], k)]).sum())
+
+        # AUC over labelled impressions: score = n_recommended - rank for recommended articles, 0 otherwise
+        shown = labelled & (codes >= 0)
+        row_of = np.full(len(click_counts), -1, dtype=np.int64)
+        row_of[chunk_rows] = np.arange(len(chunk_rows))
+        shown &= row_of[owners] >= 0
+        if not shown.any():
+            return
+
+        order = np.argsort(recommendation_keys[valid], kind="stable")
+        sorted_keys = recommendation_keys[valid][order]
+        sorted_scores = (n_recommended - np.nonzero(valid)[1])[order]
+
+        shown_keys = owners[shown].astype(np.int64) * n_articles + codes[shown]
+        scores = np.zeros(len(shown_keys), dtype=np.int64)
+        if len(sorted_keys):
+            found = np.minimum(np.searchsorted(sorted_keys, shown_keys), len(sorted_keys) - 1)
+            matched = sorted_keys[found] == shown_keys
+            scores[matched] = sorted_scores[found[matched]]
+
+        # Per impression, count clicked and skipped articles at each score level, then compare levels
+        groups = row_of[owners[shown]]
+        levels = n_recommended + 1
+        cells = groups * levels + scores
+        positives = np.bincount(cells[clicked[shown]], minlength=len(chunk_rows) * levels).reshape(-1, levels)
+        negatives = np.bincount(cells[~clicked[shown]], minlength=len(chunk_rows) * levels).reshape(-1, levels)
+
+        below = np.cumsum(negatives, axis=1) - negatives
+        wins = (positives * (below + 0.5 * negatives)).sum(axis=1)
+        pairs = positives.sum(axis=1) * negatives.sum(axis=1)
+
+        sums["auc"] += float((wins[pairs > 0] / pairs[pairs > 0]).sum())
+        sums["auc_impressions"] += int((pairs > 0).sum())
+
+    def results(self):
+        """
+        DataFrame with one row per model and one column per metric.
+
+        Raises ValueError if a model's prediction keys matched none of the behaviors, which would
+        otherwise report zero for every metric.
+        """
+        for name, matched in self.matched.items():
+            if matched == 0 and len(self.models[name].keys):
+                raise ValueError(
+                    f"None of the {len(self.models[name].keys)} prediction keys of {name!r} "
+                    f"(e.g. {self.models[name].keys[0]!r}) match a behaviors interaction"
+                )
+
+        popularity = (self.read_counts + 1) / (self.interactions + 1)
+        self_information = -np.log2(popularity)
+
+        rows = []
+        for name, sums in self.sums.items():
+            n = max(sums["interactions"], 1)
+            recommended_counts = self.recommended_counts[name]
+
+            row = {"Model": name, "Interactions": sums["interactions"]}
+            for k in self.ks:
+                row[f"HR@{k}"] = sums[f"hr@{k}"] / n
+            row["MRR"] = sums["mrr"] / n
+            for k in self.ks:
+                row[f"nDCG@{k}"] = sums[f"ndcg@{k}"] / n
+            row["AUC"] = sums["auc"] / sums["auc_impressions"] if sums["auc_impressions"] else np.nan
+            row["Coverage"] = np.count_nonzero(recommended_counts) / len(self.vocabulary)
+            row["Novelty"] = (recommended_counts @ self_information) / max(recommended_counts.sum(), 1)
+            rows.append(row)
+
+        return pd.DataFrame(rows).set_index("Model")
+
+
+def evaluate_models(prediction_paths, behaviors_path, news_path, ks=(5, 10), chunk_size=100_000):
+    """
+    Evaluates several prediction files in one pass over the behaviors.
+
+    Parameters:
+      prediction_paths (dict): Model name -> prediction .json / .jsonl file.
+      behaviors_path (str): Raw MIND behaviors.tsv (streamed, labelled) or cleaned behaviors.pkl.
+      news_path (str): news.pkl or news.tsv defining the article catalogue.
+      ks (tuple): Cut-offs for HR@k and nDCG@k.
+      chunk_size (int): Behaviors rows per chunk.
+
+    Returns:
+      DataFrame of metrics, one row per model.
+    """
+    if news_path.endswith(".tsv"):
+        news_ids = pd.read_csv(news_path, sep="\t", header=None, usecols=[0])[0]
+    else:
+        news_ids = pd.read_pickle(news_path)["News ID"]
+    vocabulary = pd.Index(news_ids.unique())
+
+    models = {name: load_predictions(path, vocabulary) for name, path in prediction_paths.items()}
+    evaluator = StreamingEvaluator(models, vocabulary, ks=ks)
+
+    for chunk in read_behaviors(behaviors_path, chunk_size=chunk_size):
+        evaluator.update(chunk)
+
+    return evaluator.results()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate recommendation files against MIND behaviors in one streaming pass.")
+    parser.add_argument("behaviors", help="behaviors.tsv (raw, with click labels) or cleaned behaviors.pkl")
+    parser.add_argument("news", help="news.pkl or news.tsv")
+    parser.add_argument("predictions", nargs="+", help="name=path of each prediction .json/.jsonl file")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--output", help="Write the metrics table to this CSV file")
+    args = parser.parse_args()
+
+    prediction_paths = dict(
+        argument.split("=", 1) if "=" in argument else (os.path.splitext(os.path.basename(argument))[0], argument)
+        for argument in args.predictions
+    )
+    metrics = evaluate_models(prediction_paths, args.behaviors, args.news, ks=args.k, chunk_size=args.chunk_size)
+
+    print(metrics.round(4).to_string())
+    if args.output:
+        metrics.to_csv(args.output)
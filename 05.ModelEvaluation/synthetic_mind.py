@@ -0,0 +1,565 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+NEWS_COLUMNS = ["News ID", "Category", "SubCategory", "Title", "Abstract", "URL", "Title Entities", "Abstract Entities"]
+BEHAVIORS_COLUMNS = ["Impression ID", "User ID", "Timestamp", "History", "Impressions"]
+MIND_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# MIND categories, their cleaned name (as split by the preprocessing notebook) and share of the MIND-small catalogue
+CATEGORIES = {
+    "news": ("news", 0.305),
+    "sports": ("sports", 0.300),
+    "finance": ("finance", 0.059),
+    "foodanddrink": ("food and drink", 0.052),
+    "lifestyle": ("lifestyle", 0.050),
+    "travel": ("travel", 0.048),
+    "video": ("video", 0.044),
+    "weather": ("weather", 0.041),
+    "health": ("health", 0.030),
+    "autos": ("autos", 0.030),
+    "tv": ("tv", 0.017),
+    "music": ("music", 0.013),
+    "movies": ("movies", 0.012),
+    "entertainment": ("entertainment", 0.011),
+    "kids": ("kids", 0.0003),
+    "middleeast": ("middle east", 0.0001),
+    "northamerica": ("north america", 0.0001),
+}
+WORDS = np.array(
+    "the a new first says after over how why what more year week state city police court game team season"
+    " win coach trump house school health study market stock price home family day night world report fire"
+    " storm snow car fans star show music movie dog food recipe best top million watch photos video life"
+    " time back big old live man woman people could just".split()
+)
+
+# MIND-small: 156,965 impressions of 50,000 users over 51,282 articles, in the week from 11/09/2019
+MIND_SMALL_IMPRESSIONS = 156_965
+MIND_SMALL_NEWS = 51_282
+IMPRESSIONS_PER_USER = 3.1
+WINDOW_START = pd.Timestamp("2019-11-09")
+WINDOW_DAYS = 6
+HISTORY_DAYS = 28
+PRE_WINDOW_SHARE = 0.6
+
+# Per-user and per-impression distributions (lognormal history lengths, Poisson shown and clicked counts)
+MEDIAN_HISTORY = 19
+HISTORY_SIGMA = 0.9
+MAX_HISTORY = 400
+EMPTY_HISTORY_SHARE = 0.025
+FAVOURITE_SHARE = 0.75
+MEAN_SHOWN = 37
+MEAN_CLICKS = 1.5
+FRESH_HOURS = 36
+HOURLY_ACTIVITY = 1 + 0.6 * np.sin((np.arange(24) - 9) / 24 * 2 * np.pi)
+
+CHUNK_SIZE = 20_000
+MANIFEST_FILE = "synthetic_mind.json"
+
+
+def scale_sizes(n_impressions):
+    """
+    (articles, users, entities) of a MIND-shaped dataset with n_impressions.
+
+    Users keep MIND's ~3.1 impressions each; the catalogue grows sublinearly from MIND-small's size
+    (n_impressions ** 0.4), which lands close to MIND-large's catalogue at its scale.
+    """
+    n_news = max(1_000, round(MIND_SMALL_NEWS * (n_impressions / MIND_SMALL_IMPRESSIONS) ** 0.4))
+    n_users = max(1, round(n_impressions / IMPRESSIONS_PER_USER))
+
+    return n_news, n_users, max(len(CATEGORIES), n_news // 2)
+
+
+def _distinct_ids(rng, prefix, n):
+    # Random distinct IDs like MIND's 'N12345' / 'U12345'
+    numbers = rng.choice(np.arange(1, 10 * n + 1), n, replace=False)
+
+    return np.char.add(prefix, numbers.astype(str)).astype(object)
+
+
+def _weighted_sample(rng, cumulative, lows, highs):
+    # One position per (low, high) range, drawn with the weights whose running sum is `cumulative`
+    before = np.where(lows > 0, cumulative[np.maximum(lows - 1, 0)], 0)
+    targets = before + rng.random(len(lows)) * (cumulative[highs - 1] - before)
+
+    return np.clip(np.searchsorted(cumulative, targets, side="right"), lows, highs - 1)
+
+
+def _keep_first(owners, codes, n_codes):
+    # Drops repeated (owner, code) pairs, keeping the first of each in order
+    _, first = np.unique(owners.astype(np.int64) * n_codes + codes, return_index=True)
+    first.sort()
+
+    return owners[first], codes[first]
+
+
+def _offsets(owners, n_rows):
+
+    return np.concatenate(([0], np.cumsum(np.bincount(owners, minlength=n_rows))))
+
+
+def _join_tokens(ids, owners, codes, n_rows):
+    # Space-joined IDs of every row, '' for rows without any
+    joined = np.full(n_rows, "", dtype=object)
+    if len(codes):
+        order = np.argsort(owners, kind="stable")
+        owners, tokens = owners[order], ids[codes[order]]
+
+        # One string for everything, rows separated by newlines, then split back into rows
+        last = np.r_[owners[1:] != owners[:-1], True]
+        separators = np.where(last, "\n", " ").astype(object)
+        text = "".join((tokens + separators).tolist())
+        joined[owners[last]] = text.split("\n")[:-1]
+
+    return joined
+
+
+def _row_sums(owners, codes, vectors, n_rows):
+    # Sum of vectors[codes] per owner, without materializing every token's vector at once
+    sums = np.zeros((n_rows, vectors.shape[1]), dtype=np.float32)
+    order = np.argsort(owners, kind="stable")
+    owners, codes = owners[order], codes[order]
+
+    for start in range(0, len(codes), CHUNK_SIZE * 10):
+        block_owners = owners[start:start + CHUNK_SIZE * 10]
+        starts = np.flatnonzero(np.r_[True, block_owners[1:] != block_owners[:-1]])
+        sums[block_owners[starts]] += np.add.reduceat(vectors[codes[start:start + CHUNK_SIZE * 10]], starts, axis=0)
+
+    return sums
+
+
+class SyntheticMind:
+    """
+    A seeded, MIND-shaped dataset held as integer codes, rendered on demand in MIND's raw format
+    (news.tsv, behaviors.tsv, entity_embedding.vec), the preprocessing notebook's Clean format (news.pkl,
+    behaviors.pkl, as read by the POC) or the processed parquet format of the Models.
+
+    The distributions follow MIND: categories with MIND-small's shares, heavy-tailed article popularity
+    and user activity, lognormal history lengths (some users without history), histories drawn mostly
+    from each user's favourite categories among articles published before the behaviors window, and
+    ~37 shown / ~1.5 clicked articles per impression among articles published in the last FRESH_HOURS,
+    with clicks favouring the user's categories. Timestamps span six days with a daily cycle. Article
+    vectors are the mean of their entities' vectors, which cluster by category.
+
+    The same seed always gives the same dataset. Shown (non-clicked) articles are regenerated chunk by
+    chunk when rendering the raw format, so only clicks are kept in memory.
+    """
+
+    def __init__(self, n_impressions, seed=0, dimensions=100):
+
+        self.n_impressions = int(n_impressions)
+        self.seed = seed
+        self.dimensions = dimensions
+        self.n_news, self.n_users, self.n_entities = scale_sizes(self.n_impressions)
+
+        rng = np.random.default_rng(seed)
+        self._generate_catalogue(rng)
+        self._generate_users(rng)
+        self._generate_impressions(rng)
+
+    def _generate_catalogue(self, rng):
+
+        names = list(CATEGORIES)
+        n_categories = len(names)
+        shares = np.array([share for _, share in CATEGORIES.values()])
+        self.shares = shares / shares.sum()
+        self.raw_categories = np.array(names, dtype=object)
+        self.clean_categories = np.array([clean for clean, _ in CATEGORIES.values()], dtype=object)
+
+        # Articles in publication order; every category has articles before and during the window
+        n_before = max(n_categories, int(self.n_news * PRE_WINDOW_SHARE))
+        self.categories = rng.choice(n_categories, self.n_news, p=self.shares)
+        self.categories[:n_categories] = np.arange(n_categories)
+        self.categories[n_before:n_before + n_categories] = np.arange(n_categories)[:self.n_news - n_before]
+        offsets = np.where(
+            np.arange(self.n_news) < n_before,
+            -rng.random(self.n_news) * HISTORY_DAYS,
+            rng.random(self.n_news) * WINDOW_DAYS
+        ) * 86_400
+        order = np.lexsort((np.arange(self.n_news), offsets))
+        self.categories, offsets = self.categories[order], offsets[order]
+        self.published_seconds = offsets
+        self.n_before = int(np.count_nonzero(offsets < 0))
+
+        self.news_ids = _distinct_ids(rng, "N", self.n_news)
+        self.subcategories = np.minimum(rng.geometric(0.35, self.n_news) - 1, 7)
+        self.popularity = (rng.pareto(1.2, self.n_news) + 1).astype(np.float64)
+
+        # Entities cluster around their category; articles average their entities' vectors
+        centers = rng.normal(size=(n_categories, self.dimensions)).astype(np.float32)
+        entity_categories = rng.choice(n_categories, self.n_entities, p=self.shares)
+        entity_categories[:n_categories] = np.arange(n_categories)
+        self.entity_ids = _distinct_ids(rng, "Q", self.n_entities)
+        self.entity_vectors = (centers[entity_categories] + 0.5 * rng.normal(size=(self.n_entities, self.dimensions))).astype(np.float32)
+
+        entity_order = np.argsort(entity_categories, kind="stable")
+        entity_offsets = _offsets(entity_categories, n_categories)
+        entity_counts = rng.poisson(1.5, self.n_news)
+        entity_counts[rng.random(self.n_news) < 0.1] = 0
+        owners = np.repeat(np.arange(self.n_news), entity_counts)
+        same_category = self.categories[owners]
+        lows, highs = entity_offsets[same_category], entity_offsets[same_category + 1]
+        picked = entity_order[lows + (rng.random(len(owners)) * (highs - lows)).astype(np.int64)]
+        anywhere = rng.random(len(owners)) >= 0.8
+        picked[anywhere] = rng.integers(0, self.n_entities, int(anywhere.sum()))
+        self.entity_owners, self.article_entities = _keep_first(owners, picked, self.n_entities)
+
+        counts = np.bincount(self.entity_owners, minlength=self.n_news)
+        sums = _row_sums(self.entity_owners, self.article_entities, self.entity_vectors, self.n_news)
+        self.vectors = sums / np.maximum(counts, 1)[:, None]
+
+        # Articles without entities get their category's mean vector, as the preprocessing imputes them
+        with_entities = counts > 0
+        category_sums = _row_sums(self.categories[with_entities], np.flatnonzero(with_entities), self.vectors, n_categories)
+        category_counts = np.bincount(self.categories[with_entities], minlength=n_categories)
+        category_means = category_sums / np.maximum(category_counts, 1)[:, None]
+        self.vectors[~with_entities] = category_means[self.categories[~with_entities]]
+
+        # Popularity-weighted pools of pre-window articles per category, for drawing histories
+        pool = np.lexsort((np.arange(self.n_before), self.categories[:self.n_before]))
+        self.pool = pool
+        self.pool_offsets = _offsets(self.categories[pool], n_categories)
+        self.pool_cumulative = np.cumsum(self.popularity[pool])
+        self.cumulative_popularity = np.cumsum(self.popularity)
+
+    def _generate_users(self, rng):
+
+        n_categories = len(self.raw_categories)
+        self.user_ids = _distinct_ids(rng, "U", self.n_users)
+        self.favourites = rng.choice(n_categories, (self.n_users, 3), p=self.shares)
+        self.activity = rng.lognormal(0, 1.2, self.n_users)
+
+        lengths = np.minimum(rng.lognormal(np.log(MEDIAN_HISTORY), HISTORY_SIGMA, self.n_users).astype(np.int64), MAX_HISTORY)
+        lengths[rng.random(self.n_users) < EMPTY_HISTORY_SHARE] = 0
+
+        # Mostly the user's favourite categories, otherwise any category; popular articles more often
+        owners = np.repeat(np.arange(self.n_users), lengths)
+        categories = np.where(
+            rng.random(len(owners)) < FAVOURITE_SHARE,
+            self.favourites[owners, rng.integers(0, 3, len(owners))],
+            rng.choice(n_categories, len(owners), p=self.shares)
+        )
+        lows, highs = self.pool_offsets[categories], self.pool_offsets[categories + 1]
+        empty = lows == highs
+        lows[empty], highs[empty] = 0, len(self.pool)
+        articles = self.pool[_weighted_sample(rng, self.pool_cumulative, lows, highs)]
+
+        # Each article once per history, oldest first
+        owners, articles = _keep_first(owners, articles, self.n_news)
+        order = np.lexsort((articles, owners))
+        self.history_owners, self.history_articles = owners[order], articles[order].astype(np.int32)
+        self.history_offsets = _offsets(self.history_owners, self.n_users)
+
+    def _generate_impressions(self, rng):
+
+        # Every user has an impression (as far as there are enough), the rest go to active users
+        n_first = min(self.n_users, self.n_impressions)
+        users = np.concatenate([
+            rng.permutation(self.n_users)[:n_first],
+            rng.choice(self.n_users, self.n_impressions - n_first, p=self.activity / self.activity.sum())
+        ])
+        self.impression_users = rng.permutation(users)
+
+        days = rng.integers(0, WINDOW_DAYS, self.n_impressions)
+        hours = rng.choice(24, self.n_impressions, p=HOURLY_ACTIVITY / HOURLY_ACTIVITY.sum())
+        self.impression_seconds = days * 86_400 + hours * 3_600 + rng.integers(0, 3_600, self.n_impressions)
+
+        clicked_owners, clicked_articles = [], []
+        for start in range(0, self.n_impressions, CHUNK_SIZE):
+            offsets, shown, labels = self.shown_articles(start)
+            owners = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)) + start
+            clicked_owners.append(owners[labels == 1])
+            clicked_articles.append(shown[labels == 1])
+
+        self.click_owners = np.concatenate(clicked_owners)
+        self.click_articles = np.concatenate(clicked_articles).astype(np.int32)
+
+    def shown_articles(self, start):
+        """
+        Articles shown in impressions start to start + CHUNK_SIZE, CSR style: (offsets, article codes,
+        click labels), regenerated identically from the seed on every call.
+        """
+        rng = np.random.default_rng([self.seed, start])
+        seconds = self.impression_seconds[start:start + CHUNK_SIZE]
+        users = self.impression_users[start:start + CHUNK_SIZE]
+        n_rows = len(seconds)
+
+        # Popularity-weighted among articles published in the FRESH_HOURS before the impression
+        counts = np.clip(rng.poisson(MEAN_SHOWN - 1, n_rows) + 1, 2, 299)
+        owners = np.repeat(np.arange(n_rows), counts)
+        highs = np.maximum(np.searchsorted(self.published_seconds, seconds, side="right"), 1)
+        lows = np.searchsorted(self.published_seconds, seconds - FRESH_HOURS * 3_600)
+        narrow = highs - lows < 2 * MEAN_SHOWN
+        lows[narrow] = np.maximum(highs[narrow] - 2 * MEAN_SHOWN, 0)
+        shown = _weighted_sample(rng, self.cumulative_popularity, lows[owners], highs[owners])
+        owners, shown = _keep_first(owners, shown, self.n_news)
+
+        # Clicks go to the best scored shown articles, favourite categories scoring higher
+        n_clicks = np.minimum(rng.poisson(MEAN_CLICKS - 1, n_rows) + 1, np.bincount(owners, minlength=n_rows))
+        favourite = (self.favourites[users[owners]] == self.categories[shown][:, None]).any(axis=1)
+        scores = rng.random(len(shown)) + 0.5 * favourite
+        order = np.lexsort((-scores, owners))
+        offsets = _offsets(owners, n_rows)
+        ranks = np.empty(len(shown), dtype=np.int64)
+        ranks[order] = np.arange(len(shown)) - offsets[owners[order]]
+        labels = (ranks < n_clicks[owners]).astype(np.int8)
+
+        return offsets, shown, labels
+
+    def timestamps(self, start=0, stop=None):
+
+        return WINDOW_START + pd.to_timedelta(self.impression_seconds[start:stop], unit="s")
+
+    def release_dates(self):
+
+        return WINDOW_START + pd.to_timedelta(self.published_seconds, unit="s")
+
+    def _texts(self):
+        # Titles and abstracts of random words, the same on every call
+        rng = np.random.default_rng([self.seed, self.n_impressions])
+        titles = [" ".join(words).capitalize() for words in rng.choice(WORDS, (self.n_news, 8))]
+        abstracts = [" ".join(words).capitalize() + "." for words in rng.choice(WORDS, (self.n_news, 20))]
+
+        return pd.Series(titles, dtype=object), pd.Series(abstracts, dtype=object)
+
+    def _histories(self, users):
+        # (owner, article code) of the history of every row, for rows of the given users
+        lengths = np.diff(self.history_offsets)[users]
+        owners = np.repeat(np.arange(len(users)), lengths)
+        positions = np.repeat(self.history_offsets[users] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+        return owners, self.history_articles[positions]
+
+    def raw_news(self):
+        """news.tsv of MIND, as a DataFrame with NEWS_COLUMNS."""
+        subcategories = np.char.add(self.raw_categories[self.categories].astype(str), self.subcategories.astype(str))
+
+        titles, abstracts = self._texts()
+
+        entities = pd.Series(
+            '{"Label": "' + pd.Series(self.entity_ids[self.article_entities], dtype=object)
+            + '", "Type": "P", "WikidataId": "' + self.entity_ids[self.article_entities]
+            + '", "Confidence": 1.0, "OccurrenceOffsets": [0], "SurfaceForms": []}',
+            dtype=object
+        ).groupby(self.entity_owners).agg(", ".join)
+        title_entities = np.full(self.n_news, "[]", dtype=object)
+        title_entities[entities.index.to_numpy()] = "[" + entities.to_numpy(dtype=object) + "]"
+
+        return pd.DataFrame({
+            "News ID": self.news_ids,
+            "Category": self.raw_categories[self.categories],
+            "SubCategory": subcategories.astype(object),
+            "Title": titles,
+            "Abstract": abstracts,
+            "URL": "https://assets.msn.com/labs/mind/" + self.news_ids + ".html",
+            "Title Entities": title_entities,
+            "Abstract Entities": "[]",
+        })
+
+    def raw_behaviors(self, start=0, stop=None):
+        """behaviors.tsv rows start to stop of MIND, with 'N1-1 N2-0' click labels; Timestamp is a datetime column."""
+        stop = self.n_impressions if stop is None else min(stop, self.n_impressions)
+        chunks = []
+        for chunk_start in range(start - start % CHUNK_SIZE, stop, CHUNK_SIZE):
+            offsets, shown, labels = self.shown_articles(chunk_start)
+            n_rows = len(offsets) - 1
+            owners = np.repeat(np.arange(n_rows), np.diff(offsets))
+            users = self.impression_users[chunk_start:chunk_start + n_rows]
+
+            history_owners, history_articles = self._histories(users)
+
+            labelled = pd.Series(self.news_ids[shown], dtype=object) + np.where(labels == 1, "-1", "-0")
+            chunks.append(pd.DataFrame({
+                "Impression ID": np.arange(chunk_start, chunk_start + n_rows) + 1,
+                "User ID": self.user_ids[users],
+                "Timestamp": self.timestamps(chunk_start, chunk_start + n_rows),
+                "History": _join_tokens(self.news_ids, history_owners, history_articles, n_rows),
+                "Impressions": labelled.groupby(owners, sort=True).agg(" ".join).to_numpy(dtype=object),
+            }))
+
+        behaviors = pd.concat(chunks, ignore_index=True)
+
+        return behaviors.iloc[start % CHUNK_SIZE:start % CHUNK_SIZE + stop - start].reset_index(drop=True)
+
+    def entity_embeddings(self):
+        """entity_embedding.vec of MIND: Wikidata ID then the vector, tab separated."""
+        return pd.DataFrame(self.entity_vectors, index=pd.Index(self.entity_ids, name="Wikidata ID"))
+
+    def clean_news(self):
+        """news.pkl of the preprocessing notebook (the columns the POC reads, plus Content)."""
+        titles, abstracts = self._texts()
+        category = pd.Series(self.clean_categories[self.categories], dtype=object)
+        subcategory = category + " " + self.subcategories.astype(str)
+        title, abstract = titles.str.lower(), abstracts.str.lower().str.rstrip(".")
+        content = category + " " + subcategory + " " + title + " " + abstract
+
+        return pd.DataFrame({
+            "News ID": self.news_ids,
+            "Category": category,
+            "SubCategory": subcategory,
+            "Title": title,
+            "Abstract": abstract,
+            "Content": content,
+            "Content_WC": content.str.split().str.len(),
+            "Average Vector": list(self.vectors),
+            "Release Date": self.release_dates(),
+        })
+
+    def _clicks(self, start, n_rows):
+        # (owner, article code) of the clicks of rows start to start + n_rows, owners counted from start
+        low, high = np.searchsorted(self.click_owners, [start, start + n_rows])
+
+        return self.click_owners[low:high] - start, self.click_articles[low:high]
+
+    def clean_behaviors(self):
+        """behaviors.pkl of the preprocessing notebook: History, clicked Impressions and their mean vector."""
+        chunks = []
+        for start in range(0, self.n_impressions, CHUNK_SIZE):
+            users = self.impression_users[start:start + CHUNK_SIZE]
+            n_rows = len(users)
+            history_owners, history_articles = self._histories(users)
+            click_owners, click_articles = self._clicks(start, n_rows)
+
+            # History followed by the clicks of every row; the vector averages distinct articles
+            combined_owners = np.concatenate([history_owners, click_owners])
+            order = np.argsort(combined_owners, kind="stable")
+            combined_owners = combined_owners[order]
+            combined_articles = np.concatenate([history_articles, click_articles])[order]
+
+            owners, articles = _keep_first(combined_owners, combined_articles, self.n_news)
+            vectors = _row_sums(owners, articles, self.vectors, n_rows) / np.maximum(np.bincount(owners, minlength=n_rows), 1)[:, None]
+
+            chunks.append(pd.DataFrame({
+                "User ID": self.user_ids[users],
+                "Timestamp": self.timestamps(start, start + n_rows),
+                "History": _join_tokens(self.news_ids, history_owners, history_articles, n_rows),
+                "Impressions": _join_tokens(self.news_ids, click_owners, click_articles, n_rows),
+                "History & Impressions": _join_tokens(self.news_ids, combined_owners, combined_articles, n_rows),
+                "Average Vector": list(vectors),
+            }))
+
+        return pd.concat(chunks, ignore_index=True)
+
+    def processed_news(self):
+        """processed_news_train.parquet as read by the Models."""
+        news = self.clean_news()
+
+        return pd.DataFrame({
+            "news_id": news["News ID"],
+            "category": news["Category"],
+            "subcategory": news["SubCategory"],
+            "title": news["Title"],
+            "abstract": news["Abstract"],
+            "content": news["Content"],
+            "url": "https://assets.msn.com/labs/mind/" + news["News ID"] + ".html",
+        })
+
+    def processed_behaviors(self):
+        """processed_behaviours_train.parquet as read by the Models."""
+        chunks = []
+        for start in range(0, self.n_impressions, CHUNK_SIZE):
+            users = self.impression_users[start:start + CHUNK_SIZE]
+            n_rows = len(users)
+            history_owners, history_articles = self._histories(users)
+            click_owners, click_articles = self._clicks(start, n_rows)
+
+            chunks.append(pd.DataFrame({
+                "impression_id": np.arange(start, start + n_rows) + 1,
+                "user_id": self.user_ids[users],
+                "time": self.timestamps(start, start + n_rows),
+                "history": _join_tokens(self.news_ids, history_owners, history_articles, n_rows),
+                "impressions": _join_tokens(self.news_ids, click_owners, click_articles, n_rows),
+            }))
+
+        return pd.concat(chunks, ignore_index=True)
+
+    def write_raw(self, directory):
+        """Writes news.tsv, behaviors.tsv and entity_embedding.vec as MIND ships them (readable by mind_ingest.py)."""
+        os.makedirs(directory, exist_ok=True)
+        self.raw_news().to_csv(os.path.join(directory, "news.tsv"), sep="\t", header=False, index=False)
+        self.entity_embeddings().to_csv(os.path.join(directory, "entity_embedding.vec"), sep="\t", header=False, float_format="%.6f")
+
+        behaviors_path = os.path.join(directory, "behaviors.tsv")
+        with open(behaviors_path, "w") as file:
+            for start in range(0, self.n_impressions, CHUNK_SIZE):
+                behaviors = self.raw_behaviors(start, start + CHUNK_SIZE)
+                behaviors["Timestamp"] = behaviors["Timestamp"].dt.strftime(MIND_TIMESTAMP_FORMAT)
+                behaviors.to_csv(file, sep="\t", header=False, index=False)
+
+
+def workspace_paths(directory):
+    """
+    Where write_workspace puts each file, laid out like the repository so the code runs unchanged:
+    the POC, started from directory/poc, finds ../01.Dataset/Small/Clean/Train/news.pkl and behaviors.pkl.
+    """
+    clean = os.path.join(directory, "01.Dataset", "Small", "Clean", "Train")
+
+    return {
+        "poc": os.path.join(directory, "poc"),
+        "news": os.path.join(clean, "news.pkl"),
+        "behaviors": os.path.join(clean, "behaviors.pkl"),
+        "processed_news": os.path.join(directory, "processed_news_train.parquet"),
+        "processed_behaviors": os.path.join(directory, "processed_behaviours_train.parquet"),
+        "raw": os.path.join(directory, "Raw"),
+        "manifest": os.path.join(directory, MANIFEST_FILE),
+    }
+
+
+def write_workspace(directory, n_impressions, seed=0, dimensions=100, raw=False):
+    """
+    Generates a SyntheticMind dataset and writes it in every format the repository reads.
+
+    A workspace already holding the same (n_impressions, seed, dimensions) is reused as is, so
+    repeated benchmark runs only pay for generation once. The manifest is written last.
+
+    Parameters:
+      directory (str): Folder of the workspace (see workspace_paths).
+      n_impressions (int): Number of behaviors rows; users and articles scale with it (see scale_sizes).
+      seed (int): Seed of every random draw.
+      dimensions (int): Size of the entity and article vectors (100 in MIND).
+      raw (bool): Also write the raw MIND files to directory/Raw.
+
+    Returns:
+      dict of paths, as workspace_paths.
+    """
+    paths = workspace_paths(directory)
+    settings = {"n_impressions": int(n_impressions), "seed": seed, "dimensions": dimensions, "raw": raw}
+
+    if os.path.exists(paths["manifest"]):
+        with open(paths["manifest"]) as file:
+            if json.load(file) == settings:
+                return paths
+        os.remove(paths["manifest"])
+
+    dataset = SyntheticMind(n_impressions, seed=seed, dimensions=dimensions)
+    os.makedirs(os.path.dirname(paths["news"]), exist_ok=True)
+    os.makedirs(paths["poc"], exist_ok=True)
+
+    dataset.clean_news().to_pickle(paths["news"])
+    dataset.clean_behaviors().to_pickle(paths["behaviors"])
+    dataset.processed_news().to_parquet(paths["processed_news"], index=False)
+    dataset.processed_behaviors().to_parquet(paths["processed_behaviors"], index=False)
+    if raw:
+        dataset.write_raw(paths["raw"])
+
+    with open(paths["manifest"], "w") as file:
+        json.dump(settings, file)
+
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a seeded, MIND-shaped synthetic dataset.")
+    parser.add_argument("directory", help="Workspace folder (see workspace_paths)")
+    parser.add_argument("--impressions", type=int, default=100_000, help="Behaviors rows, e.g. 10000 to 10000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dimensions", type=int, default=100, help="Size of the article vectors")
+    parser.add_argument("--raw", action="store_true", help="Also write news.tsv, behaviors.tsv and entity_embedding.vec")
+    args = parser.parse_args()
+
+    paths = write_workspace(args.directory, args.impressions, seed=args.seed, dimensions=args.dimensions, raw=args.raw)
+
+    n_news, n_users, _ = scale_sizes(args.impressions)
+    print(f"Wrote {args.impressions} impressions of {n_users} users over {n_news} articles to {args.directory}")
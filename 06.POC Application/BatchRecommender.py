@@ -0,0 +1,313 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from Shared import Tracing
+from Shared.DataStore import get_derived, get_news, get_tokens
+from Shared.EmbeddingMatrix import get_news_embeddings, top_k_rows
+from Shared.TimeIndex import get_release_date_index, get_release_ordered_embeddings
+from Shared.QuantizedMatrix import get_quantized_news_embeddings, rerank, shortlist_size
+from Shared.Vocabulary import get_news_encoding, get_user_vocabulary
+from EnoughArticlesRead.HistoryIndex import get_history_index
+from EnoughArticlesRead.CoReadIndex import get_co_read_index
+from EnoughArticlesRead.SimilarUsersIndex import get_user_index
+from NoArticlesRead.PopularityCounter import get_popularity_counter
+from CandidatePipeline import CandidatePipeline, DEFAULT_BUDGET
+
+
+def _scatter(mask, row_lists, value):
+    '''Sets mask[i, j] = value for every j in row_lists[i], in one fancy-indexing assignment.'''
+    lengths = [len(rows) for rows in row_lists]
+    if sum(lengths) == 0:
+        return
+
+    mask[np.repeat(np.arange(len(row_lists)), lengths), np.concatenate(row_lists)] = value
+
+
+def _read_rows(user_ids, timestamps, n_articles):
+    '''Rows of the articles in the 'History' of each (User ID, Timestamp) interaction.'''
+    history_index = get_history_index('History')
+    positions = history_index.positions(list(zip(user_ids, timestamps)))
+
+    read_rows = []
+    for position in positions:
+        rows = history_index.rows_at([position])
+        read_rows.append(np.unique(rows[rows < n_articles]))
+
+    return read_rows
+
+
+def _profiles(embeddings, read_rows, sessions=None):
+    '''Unit average vector of each user's read articles; users without any get a zero row.
+
+    Users with a session (see ProfileStore) take its running profile instead of averaging their rows.
+    '''
+    profiles = np.zeros((len(read_rows), embeddings.vectors.shape[1]), dtype=np.float32)
+    lengths = np.array([len(rows) for rows in read_rows])
+
+    if sessions is not None:
+        for i, session in enumerate(sessions):
+            profile = session.profile() if session is not None else None
+            if profile is not None:
+                profiles[i] = profile
+                lengths[i] = 0
+    has_profile = lengths > 0
+
+    if has_profile.any():
+        rows = np.concatenate([read_rows[i] for i in np.flatnonzero(has_profile)])
+        raw_vectors = embeddings.vectors[rows] * embeddings.norms[rows, None]
+
+        # Sum each user's slice of raw vectors at once
+        starts = np.concatenate(([0], np.cumsum(lengths[has_profile])[:-1]))
+        averages = np.add.reduceat(raw_vectors, starts, axis=0) / lengths[has_profile, None]
+        norms = np.linalg.norm(averages, axis=1, keepdims=True)
+        profiles[has_profile] = averages / np.where(norms > 0, norms, 1)
+        has_profile[has_profile] = norms[:, 0] > 0
+
+    if sessions is not None:
+        has_profile |= profiles.any(axis=1)
+
+    return profiles, has_profile
+
+
+@Tracing.traced('content_scoring')
+def score_content(read_rows, timestamps, k, filter_release_date=True, precision='float32', shortlist=4, sessions=None):
+    '''Pure content recommendations for a batch of read sets (embedding rows), one matmul for all of them.
+
+    precision: 'float32' scores the exact embeddings; 'int8' or 'float16' scores a quantized copy
+        and re-ranks the best shortlist * k articles on the exact ones
+    sessions: optional SessionProfile (or None) per read set, whose running profile is used as is
+    '''
+    if filter_release_date:
+        # Rows in release-date order, so only those released by the latest interaction are scored
+        release_date_index = get_release_date_index()
+        ends = release_date_index.ends(timestamps)
+        n_scored = int(ends.max()) if len(ends) else 0
+        excluded_rows = [release_date_index.ranks[rows] for rows in read_rows]
+    else:
+        excluded_rows = read_rows
+
+    # Exact embeddings, or quantized codes with their exact rows left on disk
+    if precision == 'float32':
+        embeddings = get_news_embeddings()
+        profiles, has_profile = _profiles(embeddings, read_rows, sessions)
+        scored = get_release_ordered_embeddings() if filter_release_date else embeddings
+    else:
+        # Profiles come from the memory-mapped exact rows, in the quantized matrix's own row order
+        scored = get_quantized_news_embeddings(precision, release_ordered=filter_release_date)
+        profiles, has_profile = _profiles(scored, excluded_rows, sessions)
+
+    if not filter_release_date:
+        n_scored = len(scored.ids)
+
+    # User matrix x item matrix
+    scores = profiles @ scored.vectors[:n_scored].T if precision == 'float32' else scored.scores(profiles, 0, n_scored)
+    Tracing.record(batch_size=len(read_rows), candidates=n_scored * len(read_rows))
+
+    # Exclude articles in user history and, optionally, articles released after the interaction
+    _scatter(scores, [rows[rows < n_scored] for rows in excluded_rows], -np.inf)
+    if filter_release_date:
+        scores[np.arange(n_scored)[None, :] >= ends[:, None]] = -np.inf
+
+    scores[~has_profile] = -np.inf
+
+    if precision == 'float32':
+        return [scored.ids[top].tolist() for top in top_k_rows(scores, k)]
+
+    # Shortlist on the approximate scores, then re-rank it exactly
+    n_candidates = min(shortlist_size(k, shortlist), n_scored)
+    candidate_rows = np.empty((len(scores), 0), dtype=np.int64)
+    if n_candidates:
+        candidate_rows = np.argpartition(-scores, n_candidates - 1, axis=1)[:, :n_candidates]
+    coarse_scores = np.take_along_axis(scores, candidate_rows, axis=1)
+
+    return [scored.ids[rows].tolist() for rows in rerank(profiles, candidate_rows, coarse_scores, scored.vectors, k)]
+
+
+def score_collaborative(read_rows, k, similar_user_k=5, method='exact', exclude_user_ids=None, sessions=None):
+    '''Similar users' articles re-ranked by embedding similarity, for a batch of read sets (embedding rows).'''
+    embeddings = get_news_embeddings()
+    profiles, has_profile = _profiles(embeddings, read_rows, sessions)
+
+    # Similar interactions of other users, for every user with a profile at once
+    user_index = get_user_index(method)
+    similar_rows = [np.empty(0, dtype=np.int64) for _ in read_rows]
+    with Tracing.stage('similar_user_search', batch_size=len(read_rows)) as span:
+        if has_profile.any():
+            exclude = None if exclude_user_ids is None else exclude_user_ids[has_profile]
+            found = user_index.query_rows_batch(profiles[has_profile], similar_user_k, exclude_user_ids=exclude)
+            for i, rows in zip(np.flatnonzero(has_profile), found):
+                similar_rows[i] = rows
+        span.record(candidates=sum(len(rows) for rows in similar_rows))
+
+    # Articles those interactions saw, looked up in one pass over the history index
+    history_index = get_history_index()
+    with Tracing.stage('history_expansion', batch_size=len(read_rows)) as span:
+        similar_keys = [key for rows in similar_rows for key in user_index.keys_at(rows)]
+        positions = history_index.positions(similar_keys)
+        splits = np.cumsum([len(rows) for rows in similar_rows])[:-1]
+
+        # Only candidates that were not read already can be recommended
+        candidate_rows = []
+        for user_positions, rows_read, user_has_profile in zip(np.split(positions, splits), read_rows, has_profile):
+            rows = history_index.rows_at(user_positions)
+            rows = np.setdiff1d(rows[rows < len(embeddings.ids)], rows_read)
+            candidate_rows.append(rows if user_has_profile else rows[:0])
+        span.record(candidates=sum(len(rows) for rows in candidate_rows))
+
+    # Only the candidates are scored: padded to the longest list, padding keeps a -inf score so it is never returned
+    with Tracing.stage('cosine_scoring', batch_size=len(read_rows)):
+        lengths = np.array([len(rows) for rows in candidate_rows])
+        padded_rows = np.zeros((len(read_rows), lengths.max(initial=0)), dtype=np.int64)
+        padded_scores = np.full(padded_rows.shape, -np.inf, dtype=np.float32)
+        filled = np.arange(padded_rows.shape[1])[None, :] < lengths[:, None]
+        if filled.any():
+            padded_rows[filled] = np.concatenate(candidate_rows)
+        padded_scores[filled] = 0
+
+        found = rerank(profiles, padded_rows, padded_scores, embeddings.vectors, k)
+
+    return [embeddings.ids[rows].tolist() for rows in found]
+
+
+@Tracing.traced('co_read_candidates')
+def score_co_read(read_rows, k, n_candidates=100, sessions=None):
+    '''Co-read articles (precomputed neighbours of the read ones) re-ranked by embedding similarity, for a batch of read sets.'''
+    embeddings = get_news_embeddings()
+    profiles, has_profile = _profiles(embeddings, read_rows, sessions)
+    co_read_index = get_co_read_index()
+
+    # Candidates padded to n_candidates per user; padding keeps a -inf score so it is never returned
+    candidate_rows = np.zeros((len(read_rows), n_candidates), dtype=np.int64)
+    candidate_scores = np.full(candidate_rows.shape, -np.inf, dtype=np.float32)
+    for i in np.flatnonzero(has_profile):
+        rows, _ = co_read_index.candidates(read_rows[i], n=n_candidates)
+        rows = rows[rows < len(embeddings.ids)]
+        candidate_rows[i, :len(rows)] = rows
+        candidate_scores[i, :len(rows)] = 0
+    Tracing.record(batch_size=len(read_rows), candidates=int(np.isfinite(candidate_scores).sum()))
+
+    return [embeddings.ids[rows].tolist() for rows in rerank(profiles, candidate_rows, candidate_scores, embeddings.vectors, k)]
+
+
+def _content_batch(user_ids, timestamps, k, filter_release_date=True, precision='float32', shortlist=4):
+
+    # The news count comes from the dataset: a quantized run never builds the float32 embeddings
+    read_rows = _read_rows(user_ids, timestamps, len(get_news()))
+
+    return score_content(read_rows, timestamps, k, filter_release_date=filter_release_date, precision=precision, shortlist=shortlist)
+
+
+def _collaborative_batch(user_ids, timestamps, k, similar_user_k=5, method='exact'):
+
+    read_rows = _read_rows(user_ids, timestamps, len(get_news_embeddings().ids))
+
+    # Like the notebooks, a user's own other impressions don't count as similar users
+    return score_collaborative(read_rows, k, similar_user_k=similar_user_k, method=method, exclude_user_ids=user_ids)
+
+
+def _co_read_batch(user_ids, timestamps, k, n_candidates=100):
+
+    read_rows = _read_rows(user_ids, timestamps, len(get_news_embeddings().ids))
+
+    return score_co_read(read_rows, k, n_candidates=n_candidates)
+
+
+def _pipeline_batch(user_ids, timestamps, k, quotas=None, budget=DEFAULT_BUDGET, reranker='cosine'):
+
+    embeddings = get_news_embeddings()
+    read_rows = _read_rows(user_ids, timestamps, len(embeddings.ids))
+    pipeline = CandidatePipeline(quotas=quotas, budget=budget, reranker=reranker)
+
+    return [embeddings.ids[pipeline.recommend_rows(rows, timestamp, k)].tolist() for rows, timestamp in zip(read_rows, timestamps)]
+
+
+def _build_user_reads(news, behaviors):
+    # Unique article rows ever read by each user, CSR style
+    vocabulary, offsets, values = get_tokens(behaviors, 'History', news['News ID'].to_numpy())
+    users = get_user_vocabulary()
+    user_codes = users.encode(behaviors['User ID'])
+
+    pairs = np.unique(np.repeat(user_codes, np.diff(offsets)).astype(np.int64) * len(vocabulary) + values)
+    pair_users, pair_rows = np.divmod(pairs, len(vocabulary))
+    user_offsets = np.concatenate(([0], np.cumsum(np.bincount(pair_users[pair_users >= 0], minlength=len(users)))))
+
+    return users, user_offsets, pair_rows[pair_users >= 0]
+
+
+def _frequency_batch(user_ids, timestamps, k, categories=None, recency_weeks=2):
+
+    news_encoding = get_news_encoding()
+    category_codes = news_encoding.category_codes
+    popularity_counter = get_popularity_counter()
+    users, user_offsets, user_rows = get_derived('user_reads', _build_user_reads, depends_on=('news', 'behaviors'))
+
+    # Popularity over the two weeks before each interaction, computed once per distinct window of buckets
+    window_counts = {}
+    user_positions = users.encode(user_ids)
+    recommendations = []
+
+    for user_position, timestamp in zip(user_positions, timestamps):
+        start = timestamp - timedelta(weeks=recency_weeks)
+        window = (popularity_counter.bucket_number(start), popularity_counter.bucket_number(timestamp))
+        if window not in window_counts:
+            window_counts[window] = popularity_counter.counts(start, timestamp)
+        counts = window_counts[window]
+
+        allowed = counts > 0
+        if user_position >= 0:
+            # User's favorite three categories, by number of distinct articles read
+            read = user_rows[user_offsets[user_position]:user_offsets[user_position + 1]]
+            read = read[read < len(news_encoding.news)]
+            read_categories = category_codes[read]
+            category_counts = np.bincount(read_categories[read_categories >= 0], minlength=len(news_encoding.categories))
+            top_categories = np.argsort(-category_counts, kind='stable')[:3]
+            top_categories = top_categories[category_counts[top_categories] > 0]
+
+            allowed &= np.isin(category_codes, top_categories)
+            allowed[read] = False
+        else:
+            # Users with no history get the categories they selected
+            allowed &= news_encoding.in_categories(categories or [])
+
+        top = top_k_rows(np.where(allowed, counts, -np.inf)[None, :], k)[0]
+        recommendations.append(news_encoding.news.decode(top))
+
+    return recommendations
+
+
+BATCH_MODELS = {
+    'frequency': _frequency_batch,
+    'content': _content_batch,
+    'collaborative': _collaborative_batch,
+    'co-read': _co_read_batch,
+    'pipeline': _pipeline_batch,
+}
+
+
+def recommend_batch(user_ids_timestamps, model='content', k=5, batch_size=256, **options):
+    '''Recommends k News IDs for every (User ID, Timestamp) interaction in one go.
+
+    model: 'frequency' (popular articles in the user's top categories), 'content' (average
+        embedding of the history vs. every article), 'collaborative' (similar users' articles
+        re-ranked by embedding similarity), 'co-read' (articles often read with the history,
+        re-ranked by embedding similarity) or 'pipeline' (a candidate budget from several cheap
+        generators, re-ranked; see CandidatePipeline)
+    batch_size: interactions scored per user-matrix x item-matrix product, which bounds memory
+    options: passed to the model, e.g. similar_user_k or method for 'collaborative', n_candidates for 'co-read',
+        quotas, budget and reranker for 'pipeline',
+        filter_release_date, precision and shortlist for 'content', categories for 'frequency'
+
+    Returns a dict {(User ID, Timestamp): [News IDs]}.
+    '''
+    recommend = BATCH_MODELS[model]
+    user_ids_timestamps = list(user_ids_timestamps)
+    recommendations = {}
+
+    for start in range(0, len(user_ids_timestamps), batch_size):
+        batch = user_ids_timestamps[start:start + batch_size]
+        user_ids = np.array([user_id for user_id, _ in batch], dtype=object)
+        timestamps = pd.to_datetime(pd.Series([timestamp for _, timestamp in batch]))
+
+        recommendations.update(zip(batch, recommend(user_ids, timestamps, k, **options)))
+
+    return recommendations
@@ -0,0 +1,352 @@
+import time
+import argparse
+import weakref
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from Shared import Tracing
+from Shared.DataStore import get_derived
+from Shared.EmbeddingMatrix import get_news_embeddings, top_k_indices
+from Shared.NewsAnnIndex import get_news_ann_index, news_ann_index_available
+from Shared.TimeIndex import get_release_date_index
+from Shared.Vocabulary import get_news_encoding
+from EnoughArticlesRead.CoReadIndex import co_read_index_available, get_co_read_index
+from NoArticlesRead.PopularityCounter import PopularityWindow, get_popularity_counter
+
+# Candidates asked of each generator, and how many of their merged union are re-ranked.
+# co-read and embedding-ann are only used by default when their indexes were prebuilt (see default_quotas).
+DEFAULT_QUOTAS = {'co-read': 100, 'embedding-ann': 100, 'category': 50, 'popularity': 50}
+DEFAULT_BUDGET = 200
+
+# Reciprocal rank fusion constant: a candidate ranked r by a generator gets 1 / (RRF_K + r) from it
+RRF_K = 60
+
+# Popularity rankings kept per counter, next to its sliding two-week window; a counter replaced
+# after a dataset change takes both with it
+POPULAR_WINDOWS_CACHED = 64
+_popular_cache = weakref.WeakKeyDictionary()
+_popular_lock = threading.Lock()
+
+
+class CategoryIndex:
+    '''News rows grouped by category, each group sorted by release date, CSR style.
+
+    The newest articles of a category released by any timestamp are then the end of one slice,
+    found with a binary search, so they cost the same however large the catalog is.
+    '''
+
+    def __init__(self, category_codes, release_dates, n_categories):
+
+        times = np.asarray(release_dates, dtype='datetime64[ns]')
+        known = np.flatnonzero((category_codes >= 0) & ~np.isnat(times))
+
+        self.order = known[np.lexsort((times[known], category_codes[known]))]
+        self.times = times[self.order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(category_codes[known], minlength=n_categories))))
+
+    def newest(self, category_codes, timestamp, n):
+        '''Up to n rows released by timestamp in the given categories, newest first.'''
+        timestamp = pd.Timestamp(timestamp).to_datetime64()
+        slices = []
+        for code in np.unique(category_codes):
+            start, end = self.offsets[code], self.offsets[code + 1]
+            end = start + int(np.searchsorted(self.times[start:end], timestamp, side='right'))
+            slices.append(np.arange(max(start, end - n), end))
+
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+
+        positions = np.concatenate(slices)
+        newest = positions[np.argsort(self.times[positions], kind='stable')[::-1][:n]]
+
+        return self.order[newest]
+
+
+def get_category_index():
+    '''Shared category index over news.pkl, rebuilt only when it changes.'''
+    def builder(news):
+        news_encoding = get_news_encoding()
+        return CategoryIndex(news_encoding.category_codes, news['Release Date'], len(news_encoding.categories))
+
+    return get_derived('category_index', builder)
+
+
+def _popular_rows(popularity_counter, end_bucket, n):
+    # The window only depends on the bucket of its end, so its ranking is shared by every request in
+    # that bucket. Only complete buckets are counted, so adds to the current bucket do not make it stale.
+    # A new bucket slides the counter's window by one bucket rather than recounting two weeks of reads.
+    key = (end_bucket, n)
+
+    with _popular_lock:
+        state = _popular_cache.get(popularity_counter)
+        if state is None:
+            state = _popular_cache[popularity_counter] = {
+                'window': PopularityWindow(popularity_counter.n_articles, pd.Timedelta(weeks=2)),
+                'rankings': OrderedDict(),
+            }
+
+        # A ranking stays valid until reads are added to one of its buckets
+        rankings, window = state['rankings'], state['window']
+        cached = rankings.get(key)
+        if cached is not None and not popularity_counter.changed_since(cached['version'], *cached['buckets']):
+            rankings.move_to_end(key)
+            return cached['top'], cached['counts']
+
+        counts = window.move(popularity_counter, pd.Timestamp(end_bucket * popularity_counter.bucket_ns))
+        top = top_k_indices(counts, n, counts > 0)
+
+        rankings[key] = {'top': top, 'counts': counts[top].astype(np.float32), 'version': window.version, 'buckets': window.buckets}
+        while len(rankings) > POPULAR_WINDOWS_CACHED:
+            rankings.popitem(last=False)
+
+        return top, rankings[key]['counts']
+
+
+# Generators whose index is too slow to build in a request -> whether it was prebuilt
+PREBUILT_GENERATORS = {
+    'co-read': co_read_index_available,
+    'embedding-ann': news_ann_index_available,
+}
+
+
+def default_quotas():
+    '''DEFAULT_QUOTAS, without the generators whose index was not prebuilt (newer than the datasets).'''
+    return {
+        name: quota for name, quota in DEFAULT_QUOTAS.items()
+        if name not in PREBUILT_GENERATORS or PREBUILT_GENERATORS[name]()
+    }
+
+
+def _co_read_candidates(context, n):
+
+    rows, scores = get_co_read_index().candidates(context['read_rows'], n=n)
+    known = rows < context['n_articles']
+
+    return rows[known], scores[known]
+
+
+def _embedding_ann_candidates(context, n):
+
+    if context['profile'] is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    # Over-fetch: unreleased and read articles are only dropped after the search
+    rows = get_news_ann_index().query_rows(context['profile'], 2 * n)
+
+    return rows, get_news_embeddings().vectors[rows] @ context['profile']
+
+
+def _category_candidates(context, n):
+
+    # The chosen categories, or those of the articles read
+    news_encoding = get_news_encoding()
+    if context['categories']:
+        codes = news_encoding.categories.encode(context['categories'])
+    else:
+        codes = news_encoding.category_codes[context['read_rows']]
+    rows = get_category_index().newest(codes[codes >= 0], context['timestamp'], n)
+
+    # Newer first: score by recency rank
+    return rows, -np.arange(len(rows), dtype=np.float32)
+
+
+def _popularity_candidates(context, n):
+
+    popularity_counter = get_popularity_counter()
+    # Counted twice the quota so some survive the read and release filters
+    return _popular_rows(popularity_counter, popularity_counter.bucket_number(context['timestamp']), 2 * n)
+
+
+# Generator name -> generate(context, n) returning (rows, scores) of up to about n candidates, best first.
+# context holds the request: read_rows, profile (None without reads), timestamp, categories, n_articles.
+CANDIDATE_GENERATORS = {
+    'co-read': _co_read_candidates,
+    'embedding-ann': _embedding_ann_candidates,
+    'category': _category_candidates,
+    'popularity': _popularity_candidates,
+}
+
+
+def _cosine_scores(context, rows, prior):
+
+    return get_news_embeddings().vectors[rows] @ context['profile']
+
+
+def _blended_scores(context, rows, prior, prior_weight=0.2):
+
+    return (1 - prior_weight) * _cosine_scores(context, rows, prior) + prior_weight * prior / max(prior.max(), 1e-12)
+
+
+# Scorer name -> score(context, rows, prior) of the shortlisted rows; prior is their fused generator score
+RERANKERS = {
+    'cosine': _cosine_scores,
+    'blended': _blended_scores,
+}
+
+
+class CandidatePipeline:
+    '''Two-stage recommendations: cheap candidate generators, then an exact re-ranker on their shortlist.
+
+    Every generator in quotas proposes up to its quota of articles (see CANDIDATE_GENERATORS). The
+    proposals are merged by reciprocal rank fusion, so an article several generators agree on comes
+    first. Duplicates, read articles and articles released after the request are dropped, and the
+    best `budget` are re-ranked by `reranker` (see RERANKERS). Only the shortlist is scored, so the
+    per-request cost is set by the quotas and the budget rather than by the catalog size.
+    Requests without any read article get the fused order itself.
+
+    Smaller quotas and budget are faster and find fewer of the exhaustive top k; see budget_curve.
+    '''
+
+    def __init__(self, quotas=None, budget=DEFAULT_BUDGET, reranker='cosine'):
+
+        self.quotas = default_quotas() if quotas is None else dict(quotas)
+        self.budget = budget
+        self.reranker = RERANKERS[reranker]
+
+        unknown = set(self.quotas) - set(CANDIDATE_GENERATORS)
+        if unknown:
+            raise ValueError(f'Unknown candidate generators: {sorted(unknown)}')
+
+    def _context(self, read_rows, timestamp, categories, session):
+
+        embeddings = get_news_embeddings()
+        if session is not None:
+            profile = session.profile()
+        else:
+            profile = embeddings.profile(read_rows)
+
+        return {
+            'read_rows': read_rows,
+            'profile': None if profile is None else profile.astype(np.float32),
+            'timestamp': pd.Timestamp(timestamp),
+            'categories': list(categories),
+            'n_articles': len(embeddings.ids),
+            'session': session,
+        }
+
+    def shortlist(self, context):
+        '''(rows, fused scores) of the merged candidates of every generator, at most budget of them.'''
+        fused = {}
+        for name, quota in self.quotas.items():
+            with Tracing.stage(f'candidates:{name}') as span:
+                rows, _ = CANDIDATE_GENERATORS[name](context, quota)
+                rows = np.asarray(rows, dtype=np.int64)[:2 * quota]
+                span.record(candidates=len(rows))
+
+            for rank, row in enumerate(rows.tolist()):
+                fused[row] = fused.get(row, 0.0) + 1 / (RRF_K + rank)
+
+        rows = np.fromiter(fused, dtype=np.int64, count=len(fused))
+        scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+
+        # Drop read articles and those not released yet
+        if context['session'] is not None:
+            keep = ~context['session'].is_read(rows)
+        else:
+            keep = ~np.isin(rows, context['read_rows'])
+        release_date_index = get_release_date_index()
+        keep &= release_date_index.ranks[rows] < release_date_index.end(context['timestamp'])
+        rows, scores = rows[keep], scores[keep]
+
+        top = top_k_indices(scores, self.budget)
+
+        return rows[top], scores[top]
+
+    def recommend_rows(self, read_rows, timestamp, k=5, categories=(), session=None):
+        '''Rows of the k recommended articles, best first.'''
+        context = self._context(np.unique(np.asarray(read_rows, dtype=np.int64)), timestamp, categories, session)
+        rows, prior = self.shortlist(context)
+
+        if context['profile'] is None or len(rows) == 0:
+            return rows[:k]
+
+        with Tracing.stage('rerank', candidates=len(rows)):
+            scores = self.reranker(context, rows, prior)
+            return rows[top_k_indices(scores, k)]
+
+    def recommend(self, read_articles, timestamp, k=5, categories=(), session=None):
+        '''News IDs of the k recommended articles, best first; a session's reads replace read_articles.'''
+        embeddings = get_news_embeddings()
+        read_rows = session.read_rows() if session is not None else embeddings.rows(read_articles)
+        rows = self.recommend_rows(read_rows, timestamp, k, categories, session)
+
+        return embeddings.ids[rows].tolist()
+
+
+def get_candidate_pipeline():
+    '''Process-wide pipeline with the default quotas and budget, made again when the datasets change.'''
+    def builder(news, behaviors):
+        return CandidatePipeline()
+
+    return get_derived('candidate_pipeline', builder, depends_on=('news', 'behaviors'))
+
+
+def _exhaustive_rows(read_rows, timestamp, k):
+    # Reference: cosine with every released unread article, as the pure content recommender scores them
+    embeddings = get_news_embeddings()
+    release_date_index = get_release_date_index()
+    profile = embeddings.profile(read_rows)
+
+    released = release_date_index.order[:release_date_index.end(timestamp)]
+    released = released[~np.isin(released, read_rows)]
+
+    return released[top_k_indices(embeddings.vectors[released] @ profile, k)]
+
+
+def budget_curve(requests, budgets, k=10, reranker='cosine', generators=None):
+    '''Recall of the exhaustive top k and mean latency for every candidate budget (quotas scaled alike).
+
+    requests: (read_rows, timestamp) pairs with at least one read article
+    generators: names of the generators used, with their DEFAULT_QUOTAS (default_quotas() by default)
+    Returns a DataFrame indexed by budget with recall and mean_ms.
+    '''
+    generators = list(default_quotas()) if generators is None else generators
+    requests = [(np.unique(rows), timestamp) for rows, timestamp in requests if len(rows)]
+    exact = [_exhaustive_rows(rows, timestamp, k) for rows, timestamp in requests]
+    results = {}
+
+    for budget in budgets:
+        scale = budget / DEFAULT_BUDGET
+        pipeline = CandidatePipeline(
+            quotas={name: max(1, int(DEFAULT_QUOTAS[name] * scale)) for name in generators},
+            budget=budget, reranker=reranker
+        )
+
+        found, started = [], time.perf_counter()
+        for rows, timestamp in requests:
+            found.append(pipeline.recommend_rows(rows, timestamp, k))
+        elapsed = time.perf_counter() - started
+
+        recalls = [len(np.intersect1d(approximate, reference)) / len(reference) for approximate, reference in zip(found, exact) if len(reference)]
+        results[budget] = {'recall': float(np.mean(recalls)) if recalls else 0.0, 'mean_ms': elapsed / max(len(requests), 1) * 1000}
+
+    return pd.DataFrame.from_dict(results, orient='index').rename_axis('budget')
+
+
+if __name__ == '__main__':
+    from Shared.DataStore import get_behaviors
+    from EnoughArticlesRead.HistoryIndex import get_history_index
+
+    parser = argparse.ArgumentParser(description='Recall of the exhaustive content top k vs. latency, per candidate budget.')
+    parser.add_argument('--budgets', type=int, nargs='+', default=[25, 50, 100, 200, 400, 800])
+    parser.add_argument('--requests', type=int, default=500, help='Interactions sampled from behaviors')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--reranker', choices=sorted(RERANKERS), default='cosine')
+    parser.add_argument('--generators', nargs='+', choices=list(CANDIDATE_GENERATORS), help='Default: every generator, co-read and embedding-ann only if prebuilt')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    behaviors = get_behaviors().dropna(subset=['User ID', 'History'])
+    sample = behaviors.sample(min(args.requests, len(behaviors)), random_state=args.seed)
+    history_index = get_history_index('History')
+    n_articles = len(get_news_embeddings().ids)
+
+    requests = []
+    for position, timestamp in zip(history_index.positions(list(zip(sample['User ID'], sample['Timestamp']))), sample['Timestamp']):
+        rows = history_index.rows_at([position])
+        requests.append((rows[rows < n_articles], timestamp))
+
+    # One untimed pass builds every index first
+    budget_curve(requests[:1], args.budgets, args.k, args.reranker, args.generators)
+    print(budget_curve(requests, args.budgets, args.k, args.reranker, args.generators).round(3).to_string())
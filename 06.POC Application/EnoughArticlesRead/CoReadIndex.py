@@ -0,0 +1,254 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from Shared.DataStore import dataset_path, get_derived, get_tokens, is_fresh
+from Shared.EmbeddingMatrix import top_k_indices
+
+# A prebuilt index is looked up next to behaviors.pkl
+CO_READ_INDEX_FILE = 'co_read_index.npz'
+
+# Article pairs counted per range of left articles while building, which bounds memory
+PAIRS_PER_BLOCK = 1 << 22
+
+
+def _reading_sets(news, behaviors, column, max_session_length):
+    # Distinct articles of every user, CSR style, in first-read order and cut to the latest max_session_length
+    vocabulary, offsets, values = get_tokens(behaviors, column, news['News ID'].to_numpy())
+    user_codes = pd.factorize(behaviors['User ID'])[0]
+    token_users = np.repeat(user_codes, np.diff(offsets))
+
+    known = token_users >= 0
+    pairs = token_users[known].astype(np.int64) * len(vocabulary) + values[known]
+    _, first_reads = np.unique(pairs, return_index=True)
+    first_reads.sort()
+    set_users, set_rows = np.divmod(pairs[first_reads], len(vocabulary))
+
+    # Keep each user's latest reads: reverse rank within the user's set < max_session_length
+    order = np.argsort(set_users, kind='stable')
+    set_users, set_rows = set_users[order], set_rows[order]
+    counts = np.bincount(set_users, minlength=user_codes.max(initial=-1) + 1)
+    ends = np.cumsum(counts)
+    reverse_ranks = np.repeat(ends, counts) - np.arange(len(set_users)) - 1
+    keep = reverse_ranks < max_session_length
+
+    lengths = np.bincount(set_users[keep], minlength=len(counts))
+
+    return vocabulary, np.concatenate(([0], np.cumsum(lengths))), set_rows[keep].astype(np.int32)
+
+
+def _left_ranges(offsets, rows, n_articles):
+    # [start, end) ranges of left articles pairing up to about PAIRS_PER_BLOCK (left, right) pairs each
+    lengths = np.diff(offsets)
+    pair_loads = np.bincount(rows, weights=np.repeat(lengths - 1, lengths), minlength=n_articles)
+    cumulative_pairs = np.cumsum(pair_loads)
+
+    ranges = []
+    start = 0
+    while start < n_articles:
+        # As many articles as fit in PAIRS_PER_BLOCK pairs, at least one
+        budget = cumulative_pairs[start] - pair_loads[start] + PAIRS_PER_BLOCK
+        end = max(int(np.searchsorted(cumulative_pairs, budget, side='right')), start + 1)
+        ranges.append((start, min(end, n_articles)))
+        start = end
+
+    return ranges
+
+
+def _co_read_counts(offsets, rows, n_articles, readers, start, end):
+    # (left, right, number of users who read both) of every ordered pair whose left article is in [start, end)
+    lengths = np.diff(offsets)
+
+    # Every (left, user) read of the range, from the article -> readers lists
+    entry_articles = rows[readers['order'][readers['offsets'][start]:readers['offsets'][end]]].astype(np.int64)
+    entry_users = readers['users'][readers['offsets'][start]:readers['offsets'][end]]
+
+    # Paired with every article of that user's set
+    pair_blocks = lengths[entry_users]
+    left = np.repeat(entry_articles, pair_blocks)
+    within = np.arange(len(left)) - np.repeat(np.cumsum(pair_blocks) - pair_blocks, pair_blocks)
+    right = rows[np.repeat(offsets[entry_users], pair_blocks) + within].astype(np.int64)
+    distinct = left != right
+
+    codes, counts = np.unique((left[distinct] - start) * n_articles + right[distinct], return_counts=True)
+    left, right = np.divmod(codes, n_articles)
+
+    return left + start, right, counts
+
+
+class CoReadIndex:
+    '''Sparse item-item co-read matrix: for every article, its top_n neighbours among the articles
+    read by the same users, weighted by PMI (or by raw co-read counts).
+
+    Neighbours are stored as int32 rows of `vocabulary`, CSR style: the neighbours of row i are
+    neighbours[offsets[i]:offsets[i + 1]], best first, with their weights alongside. The vocabulary
+    starts with the news IDs in news.pkl order, so those rows line up with the news embedding matrix.
+    Candidates for a user are found by summing the neighbour rows of what they read, so the cost of a
+    lookup grows with the history length, not with the number of users.
+    '''
+
+    def __init__(self, offsets, neighbours, weights, vocabulary, weighting='pmi'):
+
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.neighbours = np.asarray(neighbours, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.vocabulary_index = pd.Index(self.vocabulary)
+        self.weighting = weighting
+
+    @classmethod
+    def build(cls, news, behaviors, column='History & Impressions', weighting='pmi', top_n=50, min_count=2, max_session_length=200):
+        '''Counts how many users read each pair of articles and keeps the top_n neighbours per article.
+
+        weighting: 'pmi' scores a pair by log(P(a, b) / (P(a) P(b))) over users and keeps only
+            positive scores; 'count' by the number of users who read both
+        min_count: pairs read together by fewer users are dropped as noise
+        max_session_length: only each user's latest distinct articles are paired, which bounds the
+            quadratic pair count of very long histories
+        '''
+        behaviors = behaviors.dropna(subset=['User ID'])
+        vocabulary, offsets, rows = _reading_sets(news, behaviors, column, max_session_length)
+
+        n_articles = len(vocabulary)
+        article_readers = np.bincount(rows, minlength=n_articles).astype(np.float64)
+        n_readers = np.count_nonzero(np.diff(offsets))
+
+        # Who read each article: the reads sorted by article, with their user
+        order = np.argsort(rows, kind='stable')
+        readers = {
+            'order': order,
+            'users': np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[order],
+            'offsets': np.concatenate(([0], np.cumsum(article_readers.astype(np.int64)))),
+        }
+
+        # Each range of left articles is counted and cut to top_n before the next one, so only one
+        # range's pairs are ever held next to the neighbours kept so far
+        kept = []
+        for start, end in _left_ranges(offsets, rows, n_articles):
+            left, right, counts = _co_read_counts(offsets, rows, n_articles, readers, start, end)
+
+            frequent = counts >= min_count
+            left, right, counts = left[frequent], right[frequent], counts[frequent]
+
+            if weighting == 'pmi':
+                weights = np.log(counts * n_readers / (article_readers[left] * article_readers[right]))
+                positive = weights > 0
+                left, right, weights = left[positive], right[positive], weights[positive]
+            else:
+                weights = counts.astype(np.float64)
+
+            # Best neighbours first within each article, then cut every row to top_n
+            order = np.lexsort((right, -weights, left))
+            left, right, weights = left[order], right[order], weights[order]
+            row_starts = np.concatenate(([0], np.cumsum(np.bincount(left - start, minlength=end - start))))
+            keep = np.arange(len(left)) - row_starts[left - start] < top_n
+            kept.append((left[keep], right[keep], weights[keep]))
+
+        left, right, weights = (np.concatenate(parts) for parts in zip(*kept)) if kept else (np.empty(0, dtype=np.int64),) * 3
+
+        return cls(
+            np.concatenate(([0], np.cumsum(np.bincount(left, minlength=n_articles)))),
+            right,
+            weights,
+            vocabulary,
+            weighting=weighting
+        )
+
+    def rows(self, article_ids):
+        '''Vocabulary rows of the given article IDs, silently skipping unknown ones.'''
+        positions = self.vocabulary_index.get_indexer(pd.Index(article_ids).unique())
+
+        return np.unique(positions[positions >= 0]).astype(np.int32)
+
+    def candidates(self, read_rows, n=100):
+        '''Up to n articles co-read with read_rows, by summed neighbour weight: (rows, scores), best first.
+
+        Articles in read_rows are never returned.
+        '''
+        read_rows = np.unique(np.asarray(read_rows, dtype=np.int64))
+        read_rows = read_rows[(read_rows >= 0) & (read_rows < len(self.vocabulary))]
+
+        # Concatenated neighbour rows of every read article
+        starts = self.offsets[read_rows]
+        lengths = self.offsets[read_rows + 1] - starts
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+        rows, inverse = np.unique(self.neighbours[positions], return_inverse=True)
+        scores = np.bincount(inverse, weights=self.weights[positions], minlength=len(rows))
+
+        unread = ~np.isin(rows, read_rows)
+        rows, scores = rows[unread], scores[unread]
+        top = top_k_indices(scores, n)
+
+        return rows[top], scores[top].astype(np.float32)
+
+    def save(self, path):
+
+        np.savez(
+            path,
+            offsets=self.offsets,
+            neighbours=self.neighbours,
+            weights=self.weights,
+            vocabulary=self.vocabulary.astype(str),
+            weighting=self.weighting
+        )
+
+
+def load_co_read_index(path):
+
+    with np.load(path) as data:
+        return CoReadIndex(
+            data['offsets'],
+            data['neighbours'],
+            data['weights'],
+            data['vocabulary'].astype(object),
+            weighting=str(data['weighting'])
+        )
+
+
+def co_read_index_path():
+
+    return os.path.join(os.path.dirname(dataset_path('behaviors')), CO_READ_INDEX_FILE)
+
+
+def co_read_index_available():
+    '''True if a prebuilt co-read index newer than both datasets exists.'''
+    return is_fresh(co_read_index_path(), depends_on=('news', 'behaviors'))
+
+
+def get_co_read_index():
+    '''Shared co-read index, loaded from its prebuilt file and reloaded when the datasets change.
+
+    Counting every pair of co-read articles is far too slow to do inside a request, so this raises
+    FileNotFoundError when there is no prebuilt file newer than the datasets.
+    '''
+    def builder(news, behaviors):
+        if not co_read_index_available():
+            raise FileNotFoundError(
+                f'No co-read index newer than the datasets at {co_read_index_path()}; '
+                'build it with python -m EnoughArticlesRead.CoReadIndex'
+            )
+
+        return load_co_read_index(co_read_index_path())
+
+    return get_derived('co_read_index', builder, depends_on=('news', 'behaviors'))
+
+
+if __name__ == '__main__':
+    from Shared.DataStore import get_news, get_behaviors
+
+    parser = argparse.ArgumentParser(description='Build and save the sparse item-item co-read index.')
+    parser.add_argument('--column', default='History & Impressions', choices=['History', 'Impressions', 'History & Impressions'])
+    parser.add_argument('--weighting', default='pmi', choices=['pmi', 'count'])
+    parser.add_argument('--top-n', type=int, default=50, help='Neighbours kept per article')
+    parser.add_argument('--min-count', type=int, default=2, help='Users who must have read both articles of a pair')
+    parser.add_argument('--max-session-length', type=int, default=200, help='Latest distinct articles paired per user')
+    args = parser.parse_args()
+
+    index = CoReadIndex.build(
+        get_news(), get_behaviors(), column=args.column, weighting=args.weighting,
+        top_n=args.top_n, min_count=args.min_count, max_session_length=args.max_session_length
+    )
+    index.save(co_read_index_path())
+
+    print(f'Saved co-read index with {len(index.neighbours)} neighbours of {np.count_nonzero(np.diff(index.offsets))} articles to {co_read_index_path()}')
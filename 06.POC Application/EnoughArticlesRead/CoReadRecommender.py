@@ -0,0 +1,18 @@
+from Shared import Tracing
+from EnoughArticlesRead.CoReadIndex import get_co_read_index
+
+@Tracing.traced('co_read_candidates')
+def co_read_recommender(read_articles, timestamp, n_candidates=100, session=None):
+
+    co_read_index = get_co_read_index()
+
+    # Rows of the articles read: the vocabulary starts with the rows of the news embedding matrix, as the session's
+    read_rows = session.read_rows() if session is not None else co_read_index.rows(read_articles)
+
+    # Sum the precomputed neighbours of every read article, excluding already read articles
+    candidate_rows, _ = co_read_index.candidates(read_rows, n=n_candidates)
+
+    recommended_article_ids = co_read_index.vocabulary[candidate_rows].tolist()
+    Tracing.record(candidates=len(recommended_article_ids))
+
+    return recommended_article_ids
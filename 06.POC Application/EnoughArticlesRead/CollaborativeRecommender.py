@@ -1,24 +1,26 @@
-import os
-import pandas as pd
+import numpy as np
+from Shared import Tracing
+from EnoughArticlesRead.HistoryIndex import get_history_index
 
-def collaborative_recommender(read_articles, timestamp, similar_users_timestamps):
+@Tracing.traced('history_expansion')
+def collaborative_recommender(read_articles, timestamp, similar_users_timestamps, session=None):
     
-    current_path = os.getcwd()
-    behaviors_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\behaviors.pkl')
-    behaviors = pd.read_pickle(behaviors_path)
+    history_index = get_history_index()
 
-    # Filter behaviors df for similar users & timestamps
-    similar_users_df = behaviors[behaviors[['User ID', 'Timestamp']].apply(tuple, axis=1).isin(similar_users_timestamps)]
-
-    # Initialize list to store relevant article IDs
-    recommended_article_ids = []
-
-    # Iterate over the rows of the DataFrame
-    for index, row in similar_users_df.iterrows():
-    # Split the text into words and add them to the word_list
-        recommended_article_ids.extend(row['History & Impressions'].split())
+    # Look up the articles of the similar users & timestamps
+    recommended_rows = history_index.lookup(similar_users_timestamps)
 
     # Remove any already read articles from the recommended articles
-    recommended_article_ids = list(set([id for id in recommended_article_ids if id not in read_articles]))
+    # (the first vocabulary rows are those of the news embedding matrix, which a session's bitset covers)
+    if session is not None:
+        recommended_rows = np.unique(recommended_rows)
+        in_news = recommended_rows < len(session.read_bits) * 8
+        in_news[in_news] = session.is_read(recommended_rows[in_news])
+        recommended_rows = recommended_rows[~in_news]
+    else:
+        recommended_rows = np.setdiff1d(recommended_rows, history_index.rows(read_articles))
+
+    recommended_article_ids = history_index.vocabulary[recommended_rows].tolist()
+    Tracing.record(candidates=len(recommended_article_ids))
 
-    return recommended_article_ids
\ No newline at end of file
+    return recommended_article_ids
@@ -1,29 +1,34 @@
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-import os
+import numpy as np
+from Shared import Tracing
+from Shared.EmbeddingMatrix import get_news_embeddings, top_k_indices
 
-def combined_embeddings_recommender(read_articles, timestamp, recommended_article_ids, k=3):
+@Tracing.traced('cosine_scoring')
+def combined_embeddings_recommender(read_articles, timestamp, recommended_article_ids, k=3, session=None):
     
-    current_path = os.getcwd()
-    news_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\news.pkl')
-    news = pd.read_pickle(news_path)
-
-    # create filtered_news based on recommended articles from collaborative based filtering
-    filtered_news = news.loc[news['News ID'].isin(recommended_article_ids)]
+    embeddings = get_news_embeddings()
 
     # Get average vector of user's history news IDs
-    average_news_vector = news.loc[news['News ID'].isin(read_articles), 'Average Vector'].mean()
-
-    # Filter news to exlcude articles in user history
-    filtered_news = filtered_news.loc[~filtered_news['News ID'].isin(read_articles)]
-
-    # Compute cosine similarity between average_news_vector and each unread news article
-    filtered_news['Similarity'] = filtered_news['Average Vector'].apply(lambda x: cosine_similarity([average_news_vector], [x])[0][0])
-
-    # Sort dataframe in descending order
-    filtered_news = filtered_news.sort_values(by='Similarity', ascending=False)
+    if session is not None:
+        average_news_vector = session.profile()
+    else:
+        read_rows = embeddings.rows(read_articles)
+        average_news_vector = embeddings.profile(read_rows)
+
+    if average_news_vector is None:
+        return []
+
+    # Rows of the articles recommended by collaborative based filtering, excluding articles in user history
+    if session is not None:
+        candidate_rows = embeddings.rows(recommended_article_ids)
+        candidate_rows = candidate_rows[~session.is_read(candidate_rows)]
+    else:
+        candidate_rows = np.setdiff1d(embeddings.rows(recommended_article_ids), read_rows)
+    Tracing.record(candidates=len(candidate_rows))
+
+    # Compute cosine similarity between average_news_vector and each unread candidate
+    similarity = embeddings.scores(average_news_vector, candidate_rows)
 
     #select top k articles
-    top_k_recommended_article_ids = filtered_news.head(k)['News ID'].tolist()
+    top_k_recommended_article_ids = embeddings.ids[candidate_rows[top_k_indices(similarity, k)]].tolist()
 
-    return top_k_recommended_article_ids
\ No newline at end of file
+    return top_k_recommended_article_ids
@@ -1,36 +1,27 @@
-import pandas as pd
-import os
-from sklearn.metrics.pairwise import cosine_similarity
+from Shared import Tracing
+from Shared.EmbeddingMatrix import get_news_embeddings
+from EnoughArticlesRead.SimilarUsersIndex import get_user_index
 
-def fetch_similar_users(read_articles, timestamp, k=5):
+@Tracing.traced('similar_user_search')
+def fetch_similar_users(read_articles, timestamp, k=5, method='exact', session=None):
     
-    current_path = os.getcwd()
-    
-    news_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\news.pkl')
-    behaviors_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\behaviors.pkl')
-    
-    news = pd.read_pickle(news_path)
-    behaviors = pd.read_pickle(behaviors_path)
-
-    # Get average vector of user's history news IDs
-    average_user_vector = news.loc[news['News ID'].isin(read_articles), 'Average Vector'].mean()
-
-    # Create a copy of behaviours_df
-    user_similarity_df = behaviors.copy()
-
-    # Removes users without history & impressions
-    user_similarity_df = user_similarity_df.dropna()
+    embeddings = get_news_embeddings()
 
-    # Drop duplicate users
-    user_similarity_df = user_similarity_df.drop_duplicates(subset=['User ID', 'History & Impressions'])
+    # Get average vector of user's history news IDs (kept up to date by the session's profile, if any)
+    if session is not None:
+        average_user_vector = session.profile()
+    else:
+        average_user_vector = embeddings.profile(embeddings.rows(read_articles))
 
-    # Compute cosine similarity between average_news_vector and each unread news article
-    user_similarity_df['Similarity'] = user_similarity_df['Average Vector'].apply(lambda x: cosine_similarity([average_user_vector], [x])[0][0])
+    if average_user_vector is None:
+        return []
 
-    # Sort dataframe in descending order
-    user_similarity_df = user_similarity_df.sort_values(by='Similarity', ascending=False).head(k)
+    # Prebuilt index over users with history & impressions, without duplicate users
+    # ('exact' scans every impression, 'ivf' only the closest clusters)
+    user_index = get_user_index(method)
 
     # Get similar users
-    similar_users_timestamps = [(row['User ID'], row['Timestamp']) for _, row in user_similarity_df.iterrows()]
+    similar_users_timestamps = user_index.query(average_user_vector, k)
+    Tracing.record(candidates=len(similar_users_timestamps))
 
-    return similar_users_timestamps
\ No newline at end of file
+    return similar_users_timestamps
@@ -0,0 +1,134 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from Shared.DataStore import dataset_path, get_derived, get_tokens, is_fresh
+from Shared.Tokens import take_rows
+
+# Prebuilt indexes are looked up next to behaviors.pkl, e.g. history_index_history_and_impressions.npz
+HISTORY_INDEX_FILE = 'history_index_{column}.npz'
+
+
+class HistoryIndex:
+    '''Inverted index from an impression key (User ID, Timestamp) to the articles in one of its token
+    columns ('History & Impressions' by default).
+
+    Articles are stored as int32 rows of `vocabulary`, CSR style: the articles of key i are
+    values[offsets[i]:offsets[i + 1]]. The vocabulary starts with the news IDs in news.pkl order,
+    so those rows line up with the news embedding matrix; IDs missing from news.pkl follow them.
+    '''
+
+    def __init__(self, user_ids, timestamps, offsets, values, vocabulary):
+
+        self.keys = pd.MultiIndex.from_arrays([
+            np.asarray(user_ids, dtype=object),
+            pd.DatetimeIndex(np.asarray(timestamps, dtype='datetime64[ns]'))
+        ])
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.int32)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.vocabulary_index = pd.Index(self.vocabulary)
+
+    @classmethod
+    def build(cls, news, behaviors, column='History & Impressions'):
+
+        # News IDs keep their news.pkl position; unknown IDs are appended after them
+        vocabulary, row_offsets, token_rows = get_tokens(behaviors, column, news['News ID'].to_numpy())
+
+        keep = behaviors[['User ID', 'Timestamp']].notna().all(axis=1).to_numpy()
+        if not keep.all():
+            behaviors = behaviors[keep]
+            row_offsets, token_rows = take_rows(row_offsets, token_rows, np.flatnonzero(keep))
+        lengths = np.diff(row_offsets)
+
+        # Group tokens of repeated keys together, in key order
+        key_codes, keys = pd.factorize(pd.MultiIndex.from_arrays([behaviors['User ID'], behaviors['Timestamp']]))
+        token_keys = np.repeat(key_codes, lengths)
+        order = np.argsort(token_keys, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(token_keys, minlength=len(keys)))))
+
+        return cls(
+            keys.get_level_values(0),
+            keys.get_level_values(1),
+            offsets,
+            token_rows[order],
+            vocabulary
+        )
+
+    def positions(self, user_ids_timestamps):
+        '''Position of each (User ID, Timestamp) key in the index, -1 for unknown keys.'''
+        if len(user_ids_timestamps) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        return self.keys.get_indexer(pd.MultiIndex.from_tuples(list(user_ids_timestamps)))
+
+    def rows_at(self, positions):
+        '''Concatenated article rows of the keys at `positions`; -1 positions are skipped.'''
+        positions = np.asarray(positions)
+        positions = positions[positions >= 0]
+
+        return np.concatenate([self.values[self.offsets[p]:self.offsets[p + 1]] for p in positions] or [self.values[:0]])
+
+    def lookup(self, user_ids_timestamps):
+        '''Concatenated article rows of all the given (User ID, Timestamp) keys; unknown keys are skipped.'''
+        return self.rows_at(self.positions(user_ids_timestamps))
+
+    def rows(self, article_ids):
+        '''Vocabulary rows of the given article IDs, silently skipping unknown ones.'''
+        positions = self.vocabulary_index.get_indexer(pd.Index(article_ids).unique())
+
+        return np.unique(positions[positions >= 0]).astype(np.int32)
+
+    def save(self, path):
+
+        np.savez(
+            path,
+            user_ids=self.keys.get_level_values(0).to_numpy().astype(str),
+            timestamps=self.keys.get_level_values(1).to_numpy().astype(np.int64),
+            offsets=self.offsets,
+            values=self.values,
+            vocabulary=self.vocabulary.astype(str)
+        )
+
+
+def load_history_index(path):
+
+    with np.load(path) as data:
+        return HistoryIndex(
+            data['user_ids'].astype(object),
+            data['timestamps'].astype('datetime64[ns]'),
+            data['offsets'],
+            data['values'],
+            data['vocabulary'].astype(object)
+        )
+
+
+def history_index_path(column='History & Impressions'):
+
+    file_name = HISTORY_INDEX_FILE.format(column=column.lower().replace(' & ', '_and_').replace(' ', '_'))
+
+    return os.path.join(os.path.dirname(dataset_path('behaviors')), file_name)
+
+
+def get_history_index(column='History & Impressions'):
+    '''Shared history index, loaded from a fresh prebuilt file or built in process, and rebuilt when the datasets change.'''
+    def builder(news, behaviors):
+        if is_fresh(history_index_path(column), depends_on=('news', 'behaviors')):
+            return load_history_index(history_index_path(column))
+
+        return HistoryIndex.build(news, behaviors, column=column)
+
+    return get_derived(('history_index', column), builder, depends_on=('news', 'behaviors'))
+
+
+if __name__ == '__main__':
+    from Shared.DataStore import get_news, get_behaviors
+
+    parser = argparse.ArgumentParser(description='Build and save the (User ID, Timestamp) -> articles history index.')
+    parser.add_argument('--column', default='History & Impressions', choices=['History', 'Impressions', 'History & Impressions'])
+    args = parser.parse_args()
+
+    index = HistoryIndex.build(get_news(), get_behaviors(), column=args.column)
+    index.save(history_index_path(args.column))
+
+    print(f'Saved history index over {len(index.keys)} impressions and {len(index.values)} articles to {history_index_path(args.column)}')
@@ -0,0 +1,332 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from Shared.DataStore import dataset_path, get_derived, get_vectors, is_fresh
+from Shared.EmbeddingMatrix import top_k_indices, top_k_rows
+from Shared.InvertedFile import InvertedFile
+from Shared.QuantizedMatrix import QuantizedMatrix, rerank, shortlist_size
+
+# Prebuilt indexes are looked up next to behaviors.pkl, e.g. user_index_ivf.npz
+USER_INDEX_FILE = 'user_index_{method}.npz'
+
+
+class ExactUserIndex:
+    '''Exact cosine search over the impression vectors of behaviors.pkl.
+
+    Each row is one (User ID, Timestamp) impression; vectors are stored L2-normalized in float32
+    and scored block by block so memory stays bounded however many impressions are indexed.
+    '''
+
+    method = 'exact'
+
+    def __init__(self, user_ids, timestamps, vectors, block_size=65536, normalized=False):
+
+        self.user_ids = np.asarray(user_ids)
+        self.timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        self.block_size = block_size
+
+        # Integer user codes make excluding a query's own impressions a vectorized comparison
+        self.user_codes, self.user_vocabulary = pd.factorize(self.user_ids)
+
+        # Vectors of a saved index are already unit length (and may be memory-mapped, so are not copied)
+        if normalized:
+            self.vectors = vectors
+        else:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1)
+            self.vectors = vectors / np.where(norms > 0, norms, 1).astype(np.float32)[:, None]
+
+    @classmethod
+    def build(cls, behaviors, **kwargs):
+        '''Builds the index from a behaviors frame, keeping the same impressions fetch_similar_users always used.'''
+        vectors, has_vector = get_vectors(behaviors)
+
+        # Removes users without history & impressions (or without a vector)
+        complete = behaviors.notna().all(axis=1).to_numpy() & has_vector
+        rows = np.flatnonzero(complete)
+
+        # Drop duplicate users
+        rows = rows[~behaviors[complete].duplicated(subset=['User ID', 'History & Impressions']).to_numpy()]
+        behaviors = behaviors.iloc[rows]
+
+        return cls(
+            behaviors['User ID'].to_numpy(),
+            behaviors['Timestamp'].to_numpy(),
+            vectors[rows],
+            **kwargs
+        )
+
+    def query_rows(self, user_vector, k=5):
+        '''Rows of the k impressions most similar to user_vector, most similar first.'''
+        user_vector = np.asarray(user_vector, dtype=np.float32)
+        best_rows, best_scores = [], []
+
+        for start in range(0, len(self.vectors), self.block_size):
+            scores = self.vectors[start:start + self.block_size] @ user_vector
+            top = top_k_indices(scores, k)
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+
+        if not best_rows:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(best_rows)
+
+        return rows[top_k_indices(np.concatenate(best_scores), k)]
+
+    def _exclusion_codes(self, user_vectors, exclude_user_ids):
+
+        if exclude_user_ids is None:
+            return np.full(len(user_vectors), -1)
+
+        return pd.Index(self.user_vocabulary).get_indexer(np.asarray(exclude_user_ids, dtype=object))
+
+    def _block_scores(self, user_vectors, start):
+
+        return user_vectors @ self.vectors[start:start + self.block_size].T
+
+    def _top_rows(self, user_vectors, k, exclude):
+        # (rows, scores) of each query's k best impressions, unordered, merged block by block
+        best_rows = np.empty((len(user_vectors), 0), dtype=np.int64)
+        best_scores = np.empty((len(user_vectors), 0), dtype=np.float32)
+
+        for start in range(0, len(self.user_ids), self.block_size):
+            scores = self._block_scores(user_vectors, start)
+            scores[self.user_codes[start:start + self.block_size][None, :] == exclude[:, None]] = -np.inf
+
+            # Top k of this block, merged with the k best of the previous blocks
+            top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+            rows = np.hstack([best_rows, top + start])
+            scores = np.hstack([best_scores, np.take_along_axis(scores, top, axis=1)])
+
+            keep = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+
+        return best_rows, best_scores
+
+    def query_rows_batch(self, user_vectors, k=5, exclude_user_ids=None):
+        '''query_rows for many vectors at once (one matrix product per block).
+
+        exclude_user_ids gives, per query, a User ID whose own impressions are skipped.
+        Returns one array of rows per query, most similar first.
+        '''
+        user_vectors = np.asarray(user_vectors, dtype=np.float32)
+        exclude = self._exclusion_codes(user_vectors, exclude_user_ids)
+        best_rows, best_scores = self._top_rows(user_vectors, k, exclude)
+
+        return [row[top] for row, top in zip(best_rows, top_k_rows(best_scores, k))]
+
+    def query(self, user_vector, k=5):
+        '''The k most similar impressions as (User ID, Timestamp) tuples.'''
+        return self.keys_at(self.query_rows(user_vector, k))
+
+    def keys_at(self, rows):
+        '''(User ID, Timestamp) tuples of the impressions at `rows`.'''
+        return [(self.user_ids[row], pd.Timestamp(self.timestamps[row])) for row in rows]
+
+    def _arrays(self):
+
+        return {}
+
+    def save(self, path):
+
+        np.savez(
+            path,
+            method=self.method,
+            user_ids=self.user_ids.astype(str),
+            timestamps=self.timestamps.astype(np.int64),
+            vectors=self.vectors,
+            **self._arrays()
+        )
+
+
+class IVFUserIndex(ExactUserIndex):
+    '''Approximate search with an inverted file: impressions are bucketed under their nearest
+    spherical k-means centroid and a query only scores the n_probe closest buckets (see InvertedFile).
+    '''
+
+    method = 'ivf'
+
+    def __init__(self, user_ids, timestamps, vectors, n_lists=None, n_probe=8, n_iter=10, seed=0,
+                 centroids=None, order=None, offsets=None, block_size=65536):
+
+        super().__init__(user_ids, timestamps, vectors, block_size=block_size)
+
+        if centroids is None:
+            self.lists = InvertedFile.train(self.vectors, n_lists, n_probe, n_iter, seed, block_size)
+        else:
+            self.lists = InvertedFile(centroids, order, offsets, n_probe)
+
+    def query_rows(self, user_vector, k=5, exclude_code=-1):
+
+        user_vector = np.asarray(user_vector, dtype=np.float32)
+
+        # Only score impressions filed under the closest centroids
+        candidates = self.lists.probe(user_vector)
+        candidates = candidates[self.user_codes[candidates] != exclude_code]
+
+        return candidates[top_k_indices(self.vectors[candidates] @ user_vector, k)]
+
+    def query_rows_batch(self, user_vectors, k=5, exclude_user_ids=None):
+
+        exclude = self._exclusion_codes(user_vectors, exclude_user_ids)
+
+        return [self.query_rows(user_vector, k, code) for user_vector, code in zip(user_vectors, exclude)]
+
+    def _arrays(self):
+
+        return self.lists.arrays()
+
+
+class QuantizedUserIndex(ExactUserIndex):
+    '''Exact search over int8 codes of the impression vectors, re-ranked on the float32 vectors.
+
+    Every block is scored on the codes (4x smaller than float32) to shortlist `shortlist` x k
+    impressions per query, and only those are re-scored exactly. A saved index keeps the float32
+    vectors in a memory-mapped sidecar file, so only the codes stay resident and processes loading
+    the same index share the page-cached vectors.
+    '''
+
+    method = 'int8'
+
+    def __init__(self, user_ids, timestamps, vectors, shortlist=4, codes=None, scales=None, block_size=65536, normalized=False):
+
+        super().__init__(user_ids, timestamps, vectors, block_size=block_size, normalized=normalized)
+        self.shortlist = shortlist
+
+        if codes is None:
+            self.quantized = QuantizedMatrix.from_vectors(self.vectors, self.method, block_size=block_size)
+        else:
+            self.quantized = QuantizedMatrix(codes, scales)
+
+    def _block_scores(self, user_vectors, start):
+
+        return self.quantized.scores(user_vectors, start, start + self.block_size)
+
+    def query_rows(self, user_vector, k=5):
+
+        return self.query_rows_batch([user_vector], k)[0]
+
+    def query_rows_batch(self, user_vectors, k=5, exclude_user_ids=None):
+
+        user_vectors = np.asarray(user_vectors, dtype=np.float32)
+        exclude = self._exclusion_codes(user_vectors, exclude_user_ids)
+        candidate_rows, coarse_scores = self._top_rows(user_vectors, shortlist_size(k, self.shortlist), exclude)
+
+        return rerank(user_vectors, candidate_rows, coarse_scores, self.vectors, k)
+
+    def save(self, path):
+
+        np.save(exact_vectors_path(path), self.vectors)
+        np.savez(
+            path,
+            method=self.method,
+            user_ids=self.user_ids.astype(str),
+            timestamps=self.timestamps.astype(np.int64),
+            codes=self.quantized.codes,
+            scales=self.quantized.scales
+        )
+
+
+class Float16UserIndex(QuantizedUserIndex):
+    '''QuantizedUserIndex with float16 codes: 2x smaller than float32 and closer to exact than int8.'''
+
+    method = 'float16'
+
+
+USER_INDEX_TYPES = {
+    index_type.method: index_type
+    for index_type in (ExactUserIndex, IVFUserIndex, QuantizedUserIndex, Float16UserIndex)
+}
+
+
+def exact_vectors_path(path):
+    '''Sidecar file holding the float32 vectors of a quantized index saved at `path`.'''
+    return os.path.splitext(path)[0] + '_vectors.npy'
+
+
+def load_user_index(path, **kwargs):
+    '''Loads an index written by save(), returning an instance of the class that saved it.'''
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+
+    index_type = USER_INDEX_TYPES[str(arrays.pop('method'))]
+    user_ids = arrays.pop('user_ids').astype(object)
+    timestamps = arrays.pop('timestamps').astype('datetime64[ns]')
+
+    # Quantized indexes keep their (unit) float32 vectors in a memory-mapped sidecar
+    if 'vectors' in arrays:
+        vectors = arrays.pop('vectors')
+    else:
+        vectors = np.load(exact_vectors_path(path), mmap_mode='r')
+        kwargs = {'normalized': True, **kwargs}
+
+    # IVF lists are restored as saved rather than retrained
+    return index_type(user_ids, timestamps, vectors, **arrays, **kwargs)
+
+
+def user_index_path(method):
+
+    return os.path.join(os.path.dirname(dataset_path('behaviors')), USER_INDEX_FILE.format(method=method))
+
+
+def get_user_index(method='exact'):
+    '''Shared user index for the behaviors dataset.
+
+    A prebuilt file is used when it is newer than behaviors.pkl; otherwise the index is built in process.
+    Either way it is rebuilt only when behaviors.pkl changes.
+    '''
+    def builder(behaviors):
+        path = user_index_path(method)
+
+        if is_fresh(path, depends_on=('behaviors',)):
+            return load_user_index(path)
+
+        return USER_INDEX_TYPES[method].build(behaviors)
+
+    return get_derived(('user_index', method), builder, depends_on=('behaviors',))
+
+
+def recall_at_k(index, reference, queries, k=5):
+    '''Mean share of the reference index's top k that `index` also returns, over the query vectors.'''
+    recalls = []
+    for query in queries:
+        expected = reference.query_rows(query, k)
+        if len(expected):
+            recalls.append(len(np.intersect1d(index.query_rows(query, k), expected)) / len(expected))
+
+    return float(np.mean(recalls)) if recalls else 0.0
+
+
+if __name__ == '__main__':
+    from Shared.DataStore import get_behaviors
+
+    parser = argparse.ArgumentParser(description='Build, save and check the similar-users index.')
+    parser.add_argument('--method', choices=sorted(USER_INDEX_TYPES), default='ivf')
+    parser.add_argument('--n-probe', type=int, default=8)
+    parser.add_argument('--shortlist', type=float, default=4, help='Candidates re-ranked per result (int8, float16)')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200, help='Impressions sampled to measure recall')
+    args = parser.parse_args()
+
+    behaviors = get_behaviors()
+    index_kwargs = {}
+    if args.method == 'ivf':
+        index_kwargs['n_probe'] = args.n_probe
+    elif issubclass(USER_INDEX_TYPES[args.method], QuantizedUserIndex):
+        index_kwargs['shortlist'] = args.shortlist
+
+    index = USER_INDEX_TYPES[args.method].build(behaviors, **index_kwargs)
+    index.save(user_index_path(args.method))
+
+    if args.method != 'exact':
+        exact = ExactUserIndex.build(behaviors)
+        sample = np.random.default_rng(0).choice(len(exact.vectors), min(args.queries, len(exact.vectors)), replace=False)
+        print(f'recall@{args.k} vs exact search: {recall_at_k(index, exact, exact.vectors[sample], args.k):.3f}')
+
+    if isinstance(index, QuantizedUserIndex):
+        print(f'Resident vectors: {index.quantized.nbytes / 2**20:.1f} MB ({args.method}) instead of {index.vectors.nbytes / 2**20:.1f} MB (float32)')
+
+    print(f'Saved {args.method} index over {len(index.vectors)} impressions to {user_index_path(args.method)}')
@@ -1,32 +1,45 @@
+import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-import os
+from Shared import Tracing
+from Shared.EmbeddingMatrix import get_news_embeddings, top_k_indices
+from Shared.TimeIndex import get_release_date_index, get_release_ordered_embeddings
 
-def pure_content_embeddings_recommender(read_articles, timestamp, articles_k=3):
+@Tracing.traced('content_scoring')
+def pure_content_embeddings_recommender(read_articles, timestamp, articles_k=3, session=None):
     
-    current_path = os.getcwd()
-    news_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\news.pkl')
-    news = pd.read_pickle(news_path)
+    embeddings = get_news_embeddings()
 
-    # Get average vector of user's history news IDs
-    average_news_vector = news.loc[news['News ID'].isin(read_articles), 'Average Vector'].mean()
+    # Get average vector of user's history news IDs (kept up to date by the session's profile, if any)
+    if session is not None:
+        average_news_vector = session.profile()
+    else:
+        read_rows = embeddings.rows(read_articles)
+        average_news_vector = embeddings.profile(read_rows)
 
-    # Filter news to exlcude articles in user history
-    filtered_news = news.loc[~news['News ID'].isin(read_articles)]
+    if average_news_vector is None:
+        return []
 
     # Convert input timestamp to date time
     timestamp = pd.to_datetime(timestamp)
 
-    # # Filter news to exlcude any articles released after date of interaction
-    filtered_news = filtered_news[filtered_news['Release Date'] <= timestamp]
+    # Rows ordered by release date: articles released up to the date of interaction are the first n_released
+    release_date_index = get_release_date_index()
+    released_embeddings = get_release_ordered_embeddings()
+    n_released = release_date_index.end(timestamp)
+    Tracing.record(candidates=n_released)
 
-    # Compute cosine similarity between average_news_vector and each unread news article
-    filtered_news['Similarity'] = filtered_news['Average Vector'].apply(lambda x: cosine_similarity([average_news_vector], [x])[0][0])
+    # Filter news to exlcude articles in user history
+    if session is not None:
+        candidates = ~session.is_read(release_date_index.order[:n_released])
+    else:
+        candidates = np.ones(n_released, dtype=bool)
+        read_ranks = release_date_index.ranks[read_rows]
+        candidates[read_ranks[read_ranks < n_released]] = False
 
-    # Sort dataframe in descending order
-    filtered_news = filtered_news.sort_values(by='Similarity', ascending=False)
+    # Compute cosine similarity between average_news_vector and every released article in one product
+    similarity = released_embeddings.vectors[:n_released] @ average_news_vector.astype(np.float32)
 
     #select top k articles
-    article_ids = filtered_news.head(articles_k)['News ID'].tolist()
+    article_ids = released_embeddings.ids[top_k_indices(similarity, articles_k, candidates)].tolist()
     
-    return article_ids
\ No newline at end of file
+    return article_ids
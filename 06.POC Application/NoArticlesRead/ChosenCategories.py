@@ -1,14 +1,9 @@
 import streamlit as st
-import pandas as pd
-import os
+from Shared.DataStore import get_news
 
 def choose_categories():
     
-    current_path = os.getcwd()
-    
-    news_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\news.pkl')
-    
-    news = pd.read_pickle(news_path)
+    news = get_news()
 
     categories = {category.title() for category in news.Category.unique()}
     
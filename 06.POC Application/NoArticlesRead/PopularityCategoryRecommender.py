@@ -1,44 +1,19 @@
 import pandas as pd
 from datetime import timedelta
-import os
 import streamlit as st
+from Shared import Tracing
+from NoArticlesRead.PopularityCounter import get_popularity_counter
 
-def popularity_category_recommender(timestamp, categories, read_articles, k=5):
+@Tracing.traced('popularity_ranking')
+def popularity_category_recommender(timestamp, categories, read_articles, k=5, bucket='1h', session=None):
     
-    current_path = os.getcwd()
-    
-    news_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\news.pkl')
-    behaviors_path = os.path.join(current_path, '..\\01.Dataset\\Small\\Clean\\Train\\behaviors.pkl')
+    # Read counts pre-aggregated per time bucket
+    popularity_counter = get_popularity_counter(bucket)
 
-    news = pd.read_pickle(news_path)
-    behaviors = pd.read_pickle(behaviors_path)
-    
     timestamp_threshold = pd.to_datetime(timestamp)
     max_old_date = timestamp_threshold - timedelta(weeks=2)
 
-    filtered_behaviors = behaviors.loc[
-        (behaviors["Timestamp"] < timestamp_threshold) &
-        (behaviors["Timestamp"] > max_old_date)
-    ].copy()
-
-    filtered_behaviors.drop("Timestamp", axis=1, inplace=True)
-
-    articles_df = (
-        filtered_behaviors["History"].str.split(" ")
-        .explode("History")
-        .to_frame()
-    )
-    
-    articles_df["ArticleCount"] = 1
-
-    articles_most_read = articles_df["History"].value_counts().to_frame(name="ArticleCount")
-    
-    articles_most_read["Category"] = articles_most_read.index.map(news.set_index("News ID")["Category"])
-
-    filtered_articles = articles_most_read[articles_most_read["Category"].isin(categories)]
-    
-    filtered_articles = filtered_articles[~filtered_articles.index.isin(read_articles)]
-    
-    article_ids = filtered_articles.index[:k].tolist()
+    # Sum the buckets of the last two weeks and keep the most read unread articles in the chosen categories
+    article_ids = popularity_counter.top_k(max_old_date, timestamp_threshold, categories, read_articles, k, session=session)
 
-    return article_ids
\ No newline at end of file
+    return article_ids
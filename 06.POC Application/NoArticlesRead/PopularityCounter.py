@@ -0,0 +1,212 @@
+import threading
+import numpy as np
+import pandas as pd
+from Shared.DataStore import get_derived
+from Shared.EmbeddingMatrix import top_k_indices
+from Shared.Tokens import flatten_tokens
+from Shared.Vocabulary import get_news_encoding
+
+
+class PopularityCounter:
+    '''Article read counts pre-aggregated into fixed time buckets (hourly by default).
+
+    Each bucket keeps the rows of the articles read in it and how often, so the counts over any
+    window are a sum over its buckets instead of a scan of every impression. Windows are answered
+    at bucket resolution: only buckets that lie entirely inside the window are counted.
+
+    For queries the buckets are also kept flattened in time order, CSR style, so the buckets of a
+    window are found with a binary search and summed from one contiguous slice.
+    '''
+
+    def __init__(self, news_encoding, bucket='1h'):
+
+        # Articles are counted by their news code (see Shared.Vocabulary)
+        self.news_encoding = news_encoding
+        self.n_articles = len(news_encoding.news)
+        self.bucket_ns = pd.Timedelta(bucket).value
+
+        # bucket number -> (article rows, read counts)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        # Sorted bucket numbers; the articles of _bucket_numbers[i] are _rows[_offsets[i]:_offsets[i + 1]]
+        self._bucket_numbers = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int32)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._flattened = True
+
+        # Incremented by every add; bucket number -> version of the last add to it
+        self.version = 0
+        self._changed = {}
+
+    def __getstate__(self):
+        # Locks cannot be pickled; a copy gets its own
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, news_encoding, behaviors, bucket='1h'):
+
+        counter = cls(news_encoding, bucket=bucket)
+        counter.add(behaviors['Timestamp'], behaviors['History'])
+
+        return counter
+
+    def bucket_number(self, timestamp):
+        '''Number of the bucket `timestamp` falls in.'''
+        return pd.Timestamp(timestamp).value // self.bucket_ns
+
+    def add(self, timestamps, histories):
+        '''Counts the articles in the space-separated `histories` read at `timestamps`; no rebuild needed.'''
+        timestamps = pd.to_datetime(pd.Series(timestamps)).reset_index(drop=True)
+        histories = pd.Series(histories).reset_index(drop=True)
+
+        known = timestamps.notna().to_numpy()
+        flat_tokens, lengths = flatten_tokens(histories[known])
+
+        rows = self.news_encoding.news.encode(flat_tokens)
+        buckets = np.repeat(timestamps[known].to_numpy(dtype='datetime64[ns]').astype(np.int64) // self.bucket_ns, lengths)
+
+        # Articles missing from news.pkl have no category and can never be recommended
+        rows, buckets = rows[rows >= 0], buckets[rows >= 0]
+
+        # Count every (bucket, article) pair at once
+        pairs, counts = np.unique(buckets * self.n_articles + rows, return_counts=True)
+        pair_buckets, pair_rows = np.divmod(pairs, self.n_articles)
+        bucket_starts = np.flatnonzero(np.r_[True, pair_buckets[1:] != pair_buckets[:-1]])
+        bucket_ends = np.r_[bucket_starts[1:], len(pairs)]
+
+        with self._lock:
+            self.version += 1
+            for start, end in zip(bucket_starts, bucket_ends):
+                bucket = int(pair_buckets[start])
+                self._changed[bucket] = self.version
+                new_rows, new_counts = pair_rows[start:end], counts[start:end]
+
+                if bucket in self._buckets:
+                    old_rows, old_counts = self._buckets[bucket]
+                    merged_rows, inverse = np.unique(np.concatenate([old_rows, new_rows]), return_inverse=True)
+                    new_counts = np.bincount(inverse, weights=np.concatenate([old_counts, new_counts])).astype(np.int64)
+                    new_rows = merged_rows
+
+                self._buckets[bucket] = (new_rows.astype(np.int32), new_counts.astype(np.int64))
+
+            # Flattened again on the next query, so a run of small adds stays cheap
+            self._flattened = False
+
+    def _flatten(self):
+
+        bucket_numbers = np.array(sorted(self._buckets), dtype=np.int64)
+        selected = [self._buckets[bucket] for bucket in bucket_numbers]
+
+        self._offsets = np.concatenate(([0], np.cumsum([len(rows) for rows, _ in selected], dtype=np.int64)))
+        self._rows = np.concatenate([rows for rows, _ in selected]) if selected else np.empty(0, dtype=np.int32)
+        self._counts = np.concatenate([counts for _, counts in selected]) if selected else np.empty(0, dtype=np.int64)
+        self._bucket_numbers = bucket_numbers
+        self._flattened = True
+
+    def window_buckets(self, start, end):
+        '''[first, last) bucket numbers of the buckets inside the open window (start, end).'''
+        # First bucket starting after `start`, last bucket ending by `end`
+        return self.bucket_number(start) + 1, self.bucket_number(end)
+
+    def bucket_reads(self, first, last):
+        '''(article rows, read counts) of the buckets numbered first to last - 1, one entry per bucket and article.'''
+        with self._lock:
+            if not self._flattened:
+                self._flatten()
+
+            # The buckets of the window are one range of the sorted buckets, their articles one slice
+            start_bucket, end_bucket = np.searchsorted(self._bucket_numbers, [first, last])
+            start_offset, end_offset = self._offsets[start_bucket], self._offsets[max(end_bucket, start_bucket)]
+
+            return self._rows[start_offset:end_offset], self._counts[start_offset:end_offset]
+
+    def changed_since(self, version, first, last):
+        '''True if an add after `version` touched one of the buckets numbered first to last - 1.'''
+        with self._lock:
+            if self.version <= version:
+                return False
+            if not self._flattened:
+                self._flatten()
+
+            start_bucket, end_bucket = np.searchsorted(self._bucket_numbers, [first, last])
+            return any(self._changed[int(bucket)] > version for bucket in self._bucket_numbers[start_bucket:end_bucket])
+
+    def counts(self, start, end):
+        '''Read count of every article over the buckets inside the open window (start, end).'''
+        rows, bucket_counts = self.bucket_reads(*self.window_buckets(start, end))
+
+        return np.bincount(rows, weights=bucket_counts, minlength=self.n_articles).astype(np.int64)
+
+    def top_k(self, start, end, categories, read_articles, k=5, session=None):
+        '''Most read article IDs in (start, end) within `categories`, excluding `read_articles`.
+
+        With a session (see ProfileStore), the articles it read are excluded too.
+        '''
+        counts = self.counts(start, end)
+
+        candidates = (counts > 0) & self.news_encoding.in_categories(categories)
+        read_codes = self.news_encoding.news.encode(read_articles)
+        candidates[read_codes[read_codes >= 0]] = False
+        if session is not None:
+            # News codes are the rows of the news embedding matrix, which the session's bitset covers
+            rows = np.flatnonzero(candidates)
+            candidates[rows[session.is_read(rows)]] = False
+
+        return self.news_encoding.news.decode(top_k_indices(counts, k, candidates))
+
+
+class PopularityWindow:
+    '''Read counts of a PopularityCounter over a window of fixed length that slides bucket by bucket.
+
+    Moving the window to a new end only adds the buckets that enter it and subtracts those that
+    leave it, so following the clock costs the reads of one bucket instead of a recount of the whole
+    window. The counts are recomputed when the window jumps by more than its length, or when reads
+    were added to buckets it already holds.
+    '''
+
+    def __init__(self, n_articles, length='14D'):
+
+        self.length = pd.Timedelta(length)
+        self.counts = np.zeros(n_articles, dtype=np.int64)
+        self.buckets = None
+        self.version = -1
+
+    def move(self, counter, end):
+        '''Moves the window to (end - length, end); returns the read count of every article in it.'''
+        first, last = counter.window_buckets(pd.Timestamp(end) - self.length, end)
+        version = counter.version
+
+        if self.buckets is None or max(first, self.buckets[0]) >= min(last, self.buckets[1]) or counter.changed_since(self.version, *self.buckets):
+            rows, counts = counter.bucket_reads(first, last)
+            self.counts[:] = 0
+            np.add.at(self.counts, rows, counts)
+        else:
+            old_first, old_last = self.buckets
+            for entering in ((first, min(last, old_first)), (max(first, old_last), last)):
+                rows, counts = counter.bucket_reads(*entering)
+                np.add.at(self.counts, rows, counts)
+            for leaving in ((old_first, min(old_last, first)), (max(old_first, last), old_last)):
+                rows, counts = counter.bucket_reads(*leaving)
+                np.subtract.at(self.counts, rows, counts)
+
+        self.buckets = (first, last)
+        self.version = version
+
+        return self.counts
+
+
+def get_popularity_counter(bucket='1h'):
+    '''Shared popularity counter over behaviors.pkl, rebuilt only when news.pkl or behaviors.pkl change.'''
+    def builder(news, behaviors):
+        return PopularityCounter.build(get_news_encoding(), behaviors, bucket=bucket)
+
+    return get_derived(('popularity_counter', bucket), builder, depends_on=('news', 'behaviors'))
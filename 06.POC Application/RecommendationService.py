@@ -0,0 +1,400 @@
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+import pandas as pd
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Shared import Tracing
+from Shared.DataStore import derived_generation, get_news, get_derived
+from Shared.EmbeddingMatrix import get_news_embeddings
+from Shared.ProfileStore import get_profile_store
+from Shared.ResultCache import ResultCache, get_result_cache
+from EnoughArticlesRead.SimilarUsersIndex import USER_INDEX_TYPES
+from NoArticlesRead.PopularityCounter import get_popularity_counter
+from BatchRecommender import score_content, score_collaborative, score_co_read
+from CandidatePipeline import DEFAULT_QUOTAS, default_quotas, get_candidate_pipeline
+from TierRouter import COLLABORATIVE_CANDIDATES, TierRouter
+
+# Bump whenever the scoring of a tier changes, so that results cached by the old code are not served
+RECOMMENDER_VERSION = 1
+
+
+class MicroBatcher:
+    '''Coalesces concurrent requests into batches for one score_batch(requests) -> results call.
+
+    A batch is scored as soon as it holds max_batch_size requests, or max_wait seconds after its
+    first request arrived, whichever comes first; callers block until their own result is ready,
+    or raise TimeoutError after timeout seconds (None waits as long as it takes). A request that
+    times out while still queued is dropped from its batch.
+    Batches are traced as a score_batch stage of `tier`, since they run on the batcher's own thread.
+    '''
+
+    def __init__(self, score_batch, max_batch_size=64, max_wait=0.005, tier=None, timeout=None):
+
+        self.score_batch = score_batch
+        self.tier = tier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+
+        future = Future()
+        self._queue.put((request, future))
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _next_batch(self):
+
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _score(self, batch):
+        # Cancelled futures belong to callers that timed out; the others can no longer be cancelled
+        batch = [(request, future) for request, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            requests = [request for request, _ in batch]
+            with Tracing.tier(self.tier), Tracing.stage('score_batch', batch_size=len(requests)):
+                results = list(self.score_batch(requests))
+            if len(results) != len(requests):
+                raise RuntimeError(f'score_batch returned {len(results)} results for {len(requests)} requests')
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as error:
+            # Every caller gets an answer, or it would wait forever
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+
+    def _run(self):
+
+        # Nothing may stop this thread: every later request would wait on it
+        while True:
+            try:
+                self._score(self._next_batch())
+            except Exception:
+                traceback.print_exc()
+
+
+def _latest_timestamp(behaviors):
+
+    return behaviors['Timestamp'].max()
+
+
+def parse_request(payload):
+    '''Validated request fields; the timestamp defaults to the latest interaction in behaviors.
+
+    With a session_id, read_articles are the session's new clicks rather than its whole history.
+    '''
+    if not isinstance(payload, dict):
+        raise ValueError('The request body must be a JSON object')
+
+    read_articles = payload.get('read_articles', [])
+    categories = payload.get('categories', [])
+    if not isinstance(read_articles, list) or not isinstance(categories, list):
+        raise ValueError("'read_articles' and 'categories' must be lists")
+
+    k = int(payload.get('k', 5))
+    if k < 1:
+        raise ValueError("'k' must be at least 1")
+
+    if payload.get('timestamp') is None:
+        timestamp = get_derived('latest_timestamp', _latest_timestamp, depends_on=('behaviors',))
+    else:
+        timestamp = pd.to_datetime(payload['timestamp'])
+
+    return {
+        'read_articles': [str(news_id) for news_id in read_articles],
+        'categories': [str(category).lower() for category in categories],
+        'timestamp': timestamp,
+        'k': k,
+        'session_id': str(payload['session_id']) if payload.get('session_id') is not None else None,
+    }
+
+
+def _read_rows(requests):
+
+    embeddings = get_news_embeddings()
+
+    return [
+        request['session'].read_rows() if request.get('session') is not None else embeddings.rows(request['read_articles'])
+        for request in requests
+    ]
+
+
+def _sessions(requests):
+
+    return [request.get('session') for request in requests]
+
+
+def recommend_no_articles_read(request):
+    '''Most read articles of the last two weeks in the chosen categories (cheap, so not batched).'''
+    popularity_counter = get_popularity_counter()
+    start = request['timestamp'] - pd.Timedelta(weeks=2)
+
+    return popularity_counter.top_k(
+        start, request['timestamp'], request['categories'], request['read_articles'], request['k'], session=request.get('session')
+    )
+
+
+def recommend_few_articles_read(requests):
+    '''Pure content recommendations for a batch of requests, sharing one user x item matmul.'''
+    k = max(request['k'] for request in requests)
+    timestamps = pd.Series([request['timestamp'] for request in requests])
+    recommendations = score_content(_read_rows(requests), timestamps, k, sessions=_sessions(requests))
+
+    return [news_ids[:request['k']] for request, news_ids in zip(requests, recommendations)]
+
+
+def recommend_enough_articles_read(requests, similar_user_k=5, method='exact', candidates='similar-users'):
+    '''Similar users' (or co-read) articles re-ranked by content, for a batch of requests.'''
+    k = max(request['k'] for request in requests)
+    if candidates == 'pipeline':
+        # Shortlists differ per request, so there is no shared matmul to batch
+        pipeline = get_candidate_pipeline()
+        embeddings = get_news_embeddings()
+        recommendations = [
+            embeddings.ids[pipeline.recommend_rows(rows, request['timestamp'], k, session=request.get('session'))].tolist()
+            for request, rows in zip(requests, _read_rows(requests))
+        ]
+    elif candidates == 'co-read':
+        recommendations = score_co_read(_read_rows(requests), k, sessions=_sessions(requests))
+    else:
+        recommendations = score_collaborative(_read_rows(requests), k, similar_user_k=similar_user_k, method=method, sessions=_sessions(requests))
+
+    return [news_ids[:request['k']] for request, news_ids in zip(requests, recommendations)]
+
+
+def describe_articles(news_ids):
+    '''News ID, title and category of each recommended article, in order.'''
+    news = get_news()
+    positions = get_news_embeddings().index.get_indexer(news_ids)
+
+    return [
+        {'news_id': news_id, 'title': news['Title'].iat[position], 'category': news['Category'].iat[position]}
+        for news_id, position in zip(news_ids, positions) if position >= 0
+    ]
+
+
+class RecommendationService:
+    '''The three POC tiers behind one object that keeps the models warm and batches the matmul tiers.
+
+    Requests with a session_id add their read_articles to that session's running profile (see
+    ProfileStore) and are recommended from the session's whole history, without averaging it again
+    or listing its article IDs; their cached results are keyed by session ID and click count.
+    half_life makes session profiles favour recent clicks.
+    '''
+
+    def __init__(self, max_batch_size=64, max_wait=0.005, similar_user_k=5, method='exact', cache=None, budget_ms=200, candidates='similar-users', half_life=None):
+
+        self.cache = cache or get_result_cache()
+        self.half_life = half_life
+        self.router = TierRouter(budget_ms=budget_ms, similar_user_k=similar_user_k, candidates=candidates)
+        self.options = {'similar_user_k': similar_user_k, 'method': method, 'candidates': candidates}
+        # Batched requests wait at most the latency budget for their batch
+        self.batchers = {
+            'few-articles-read': MicroBatcher(
+                recommend_few_articles_read, max_batch_size, max_wait, tier='few-articles-read', timeout=budget_ms / 1000
+            ),
+            'enough-articles-read': MicroBatcher(
+                lambda requests: recommend_enough_articles_read(requests, similar_user_k, method, candidates),
+                max_batch_size, max_wait, tier='enough-articles-read', timeout=budget_ms / 1000
+            ),
+        }
+        self.tiers = {
+            'no-articles-read': recommend_no_articles_read,
+            **{tier: batcher.submit for tier, batcher in self.batchers.items()},
+        }
+
+    def warm_up(self):
+        '''Loads the datasets and builds every index before the first request.'''
+        # Scored directly: building the indexes takes much longer than a request's budget
+        request = parse_request({'read_articles': get_news()['News ID'].head(3).tolist(), 'categories': ['news']})
+        recommend_no_articles_read(request)
+        for batcher in self.batchers.values():
+            batcher.score_batch([request])
+
+    def _open_session(self, request):
+        # Records the new clicks; the request then carries the session, which stands for its whole history
+        if request['session_id'] is None:
+            return request
+
+        session = get_profile_store(self.half_life).click(request['session_id'], request['read_articles'], request['timestamp'])
+
+        return {**request, 'session': session}
+
+    def _history_key(self, request):
+        # A session's reads only grow, so its ID and click count identify its history (and the click times a decay uses)
+        if 'session' not in request:
+            return request['read_articles'], {}
+
+        return [], {'session_id': request['session_id'], 'session_count': request['session'].count}
+
+    def recommend(self, tier, payload):
+
+        request = self._open_session(parse_request(payload))
+        read_articles, session_key = self._history_key(request)
+
+        # Repeat views (reruns, refreshes) are answered from the shared result cache
+        with Tracing.tier(tier):
+            news_ids = self.cache.get_or_compute(
+                lambda: self.tiers[tier](request),
+                # Retrained or rebuilt indexes come with a new derived generation
+                tier, (RECOMMENDER_VERSION, derived_generation()), read_articles, request['timestamp'], request['k'],
+                categories=request['categories'] if tier == 'no-articles-read' else [],
+                **(self.options if tier == 'enough-articles-read' else {}),
+                **session_key
+            )
+
+        return {'tier': tier, 'news_ids': news_ids, 'articles': describe_articles(news_ids)}
+
+    def route(self, payload):
+        '''Picks the tier from the history size and falls back to cheaper tiers to stay within budget.'''
+        request = self._open_session(parse_request(payload))
+        result = self.router.recommend(
+            request['read_articles'], request['timestamp'], request['k'], request['categories'], session=request.get('session')
+        )
+
+        return {**result, 'articles': describe_articles(result['news_ids'])}
+
+
+def make_handler(service):
+
+    class RecommendationHandler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, body):
+
+            data = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'tiers': sorted(service.tiers)})
+            elif self.path == '/stats':
+                self._send_json(200, {'cache': service.cache.stats(), 'router': service.router.stats()})
+            else:
+                self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+        def do_POST(self):
+
+            tier = self.path.strip('/').removeprefix('recommend/')
+            if tier != 'recommend' and tier not in service.tiers:
+                self._send_json(404, {'error': f'Unknown path {self.path}'})
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if tier == 'recommend':
+                    self._send_json(200, service.route(payload))
+                else:
+                    self._send_json(200, service.recommend(tier, payload))
+            except (ValueError, TypeError) as error:
+                self._send_json(400, {'error': str(error)})
+            except TimeoutError:
+                self._send_json(504, {'error': 'The request was not scored within its latency budget'})
+            except Exception as error:
+                # Anything else is a server fault: answer it rather than dropping the connection
+                traceback.print_exc()
+                self._send_json(500, {'error': f'{type(error).__name__}: {error}'})
+
+        def log_message(self, format, *args):
+            # Keep request logging off the hot path
+            pass
+
+    return RecommendationHandler
+
+
+class RecommendationServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    # Concurrent clients queue here while their requests wait to be batched
+    request_queue_size = 256
+
+
+def serve(host='127.0.0.1', port=8500, **service_options):
+
+    service = RecommendationService(**service_options)
+    service.warm_up()
+
+    missing = sorted(set(DEFAULT_QUOTAS) - set(default_quotas()))
+    if service_options.get('candidates') == 'pipeline' and missing:
+        print(f"Candidate generators left out until their index is prebuilt: {', '.join(missing)}")
+
+    server = RecommendationServer((host, port), make_handler(service))
+    print(f'Serving recommendations on http://{host}:{server.server_port}')
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the POC recommendation tiers over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--similar-user-k', type=int, default=5)
+    parser.add_argument('--method', choices=sorted(USER_INDEX_TYPES), default='exact')
+    parser.add_argument('--candidates', choices=sorted(COLLABORATIVE_CANDIDATES), default='similar-users', help='Collaborative candidate source')
+    parser.add_argument('--budget-ms', type=float, default=200, help='Latency budget: routed requests (POST /recommend) fall back to cheaper tiers, batched tier requests time out')
+    parser.add_argument('--cache-mb', type=float, default=64, help='Size bound of the result cache')
+    parser.add_argument('--cache-ttl', type=float, default=600, help='Seconds a cached result stays valid')
+    parser.add_argument('--cache-bucket', default='1h', help='Timestamps in the same bucket share cached results')
+    parser.add_argument('--half-life', help="Decay of session profiles, e.g. '6h' (no decay by default)")
+    parser.add_argument('--trace-jsonl', help='Append a JSON record per pipeline stage run to this file')
+    parser.add_argument('--metrics-port', type=int, help='Serve per-stage Prometheus metrics on this port')
+    parser.add_argument('--trace-allocations', action='store_true', help='Also record allocated bytes per stage (slow)')
+    args = parser.parse_args()
+
+    sinks = []
+    if args.trace_jsonl:
+        sinks.append(Tracing.JsonlSink(args.trace_jsonl))
+    if args.metrics_port is not None:
+        sinks.append(Tracing.PrometheusSink(args.metrics_port, args.host))
+        print(f'Serving metrics on http://{args.host}:{args.metrics_port}/metrics')
+    if sinks:
+        Tracing.enable(*sinks, track_allocations=args.trace_allocations)
+
+    server = serve(
+        args.host, args.port,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        similar_user_k=args.similar_user_k,
+        method=args.method,
+        candidates=args.candidates,
+        budget_ms=args.budget_ms,
+        half_life=args.half_life,
+        cache=ResultCache(max_bytes=int(args.cache_mb * 1024 * 1024), ttl=args.cache_ttl, bucket=args.cache_bucket)
+    )
+    server.serve_forever()
@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+import multiprocessing
+import pandas as pd
+from Shared.DataStore import get_behaviors, derived_entries, put_derived
+from Shared.SharedArrays import share, attach
+from BatchRecommender import BATCH_MODELS, recommend_batch
+
+# BLAS threads per worker; one per process scales best once every core has a worker
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def load_interactions(input_path=None, last=None):
+    '''(User ID, Timestamp) pairs to score: from a CSV/JSONL file with those columns, or the last interactions in behaviors.'''
+    if input_path is not None:
+        if input_path.endswith('.csv'):
+            frame = pd.read_csv(input_path)
+        else:
+            frame = pd.read_json(input_path, lines=True)
+    else:
+        frame = get_behaviors().tail(last)
+
+    return list(zip(frame['User ID'], pd.to_datetime(frame['Timestamp'])))
+
+
+def _interactions_hash(interactions):
+    '''SHA-256 of the (User ID, Timestamp) pairs in order, so a checkpoint is only resumed on the same input.'''
+    digest = hashlib.sha256()
+    for user_id, timestamp in interactions:
+        digest.update(f'{user_id}\t{pd.Timestamp(timestamp).isoformat()}\n'.encode())
+
+    return digest.hexdigest()
+
+
+def _init_worker(descriptors):
+    # Map the structures the parent built instead of rebuilding (or unpickling) them per worker
+    for key, (depends_on, descriptor) in descriptors.items():
+        put_derived(key, attach(descriptor), depends_on)
+
+
+def _score_shard(task):
+
+    shard, interactions, model, k, options = task
+    recommendations = recommend_batch(interactions, model=model, k=k, **options)
+
+    records = [
+        {'user_id': user_id, 'timestamp': str(timestamp), 'news_ids': news_ids}
+        for (user_id, timestamp), news_ids in recommendations.items()
+    ]
+
+    return shard, records
+
+
+def _read_checkpoint(path):
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_checkpoint(path, checkpoint):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    with open(path + '.tmp', 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(path + '.tmp', path)
+
+
+def run(interactions, output_path, model='content', k=5, workers=None, shard_size=1000,
+        threads_per_worker=1, resume=True, options=None):
+    '''Scores interactions in shards across a process pool, streaming records to output_path (JSONL).
+
+    Completed shards and the sink's byte offset are checkpointed in output_path + '.checkpoint';
+    a resumed run truncates the sink to that offset and only scores the missing shards.
+    '''
+    options = options or {}
+    workers = workers or os.cpu_count()
+    checkpoint_path = output_path + '.checkpoint'
+
+    shards = [interactions[start:start + shard_size] for start in range(0, len(interactions), shard_size)]
+    run_info = {
+        'model': model,
+        'k': k,
+        # Round-tripped through JSON so it compares equal to the copy read back from the checkpoint
+        'options': json.loads(json.dumps(options, sort_keys=True, default=str)),
+        'interactions': len(interactions),
+        'interactions_sha256': _interactions_hash(interactions),
+        'shard_size': shard_size,
+    }
+
+    checkpoint = _read_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None and checkpoint['run'] != run_info:
+        raise ValueError(f'{checkpoint_path} belongs to a different run ({checkpoint["run"]}); use --no-resume to start over.')
+    if checkpoint is None:
+        checkpoint = {'run': run_info, 'shards': [], 'offset': 0}
+
+    with open(output_path, 'ab') as sink:
+        sink.truncate(checkpoint['offset'])
+
+    done = set(checkpoint['shards'])
+    pending = [(shard, shard_interactions, model, k, options) for shard, shard_interactions in enumerate(shards) if shard not in done]
+    if not pending:
+        return
+
+    # Build every structure the model needs once, in the parent
+    recommend_batch(interactions[:1], model=model, k=k, **options)
+
+    with tempfile.TemporaryDirectory(prefix='scoring-') as shared_directory:
+        descriptors = {
+            key: (depends_on, share(data, shared_directory, str(key)))
+            for key, (depends_on, data) in derived_entries().items()
+        }
+
+        # Spawned workers read these before importing NumPy
+        for variable in THREAD_VARIABLES:
+            os.environ.setdefault(variable, str(threads_per_worker))
+
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=_init_worker, initargs=(descriptors,)) as pool, open(output_path, 'ab') as sink:
+            for shard, records in pool.imap_unordered(_score_shard, pending):
+                sink.write(''.join(json.dumps(record) + '\n' for record in records).encode())
+                sink.flush()
+                os.fsync(sink.fileno())
+
+                checkpoint['shards'].append(shard)
+                checkpoint['offset'] = sink.tell()
+                _write_checkpoint(checkpoint_path, checkpoint)
+
+                print(f'{len(checkpoint["shards"])}/{len(shards)} shards scored')
+
+
+def export_predictions_json(jsonl_path, json_path):
+    '''Converts the JSONL sink to the {'["User ID", "Timestamp"]': [News IDs]} JSON read by the evaluation notebook.'''
+    predictions = {}
+    with open(jsonl_path) as file:
+        for line in file:
+            record = json.loads(line)
+            predictions[json.dumps([record['user_id'], record['timestamp']])] = record['news_ids']
+
+    with open(json_path, 'w') as file:
+        json.dump(predictions, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score (User ID, Timestamp) interactions in parallel shards.')
+    parser.add_argument('output', help='JSONL file the predictions are streamed to')
+    parser.add_argument('--model', choices=sorted(BATCH_MODELS), default='content')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--input', help='CSV or JSONL file with User ID and Timestamp columns')
+    parser.add_argument('--last', type=int, default=5000, help='Score the last N behaviors interactions when no --input is given')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--shard-size', type=int, default=1000)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--no-resume', action='store_true', help='Ignore an existing checkpoint and start over')
+    parser.add_argument('--json', help='Also write the predictions in the evaluation JSON format to this path')
+    parser.add_argument('--parquet', help='Also write the predictions as Parquet to this path')
+    args = parser.parse_args()
+
+    run(
+        load_interactions(args.input, args.last),
+        args.output,
+        model=args.model,
+        k=args.k,
+        workers=args.workers,
+        shard_size=args.shard_size,
+        threads_per_worker=args.threads_per_worker,
+        resume=not args.no_resume
+    )
+
+    if args.json:
+        export_predictions_json(args.output, args.json)
+    if args.parquet:
+        pd.read_json(args.output, lines=True).to_parquet(args.parquet, index=False)
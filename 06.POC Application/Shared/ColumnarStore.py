@@ -0,0 +1,213 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from Shared.Tokens import encode_tokens
+
+# Columnar copies live in <dataset folder>/Columnar/<dataset name>/
+COLUMNAR_DIRECTORY = 'Columnar'
+MANIFEST_FILE = 'manifest.json'
+
+VECTOR_COLUMN = 'Average Vector'
+TOKEN_COLUMNS = ('History', 'Impressions', 'History & Impressions')
+DICTIONARY_COLUMNS = ('News ID', 'User ID', 'Category', 'SubCategory')
+
+
+def _column_file(column, suffix):
+
+    return column.lower().replace(' & ', '_and_').replace(' ', '_') + suffix
+
+
+def manifest_path(directory):
+
+    return os.path.join(directory, MANIFEST_FILE)
+
+
+def vector_matrix(column):
+    '''(vectors, has_vector) of an object column of vectors: one matrix row per row, NaN where it was missing.'''
+    has_vector = column.notna().to_numpy()
+    valid_vectors = column.to_numpy()[has_vector]
+    stacked = np.stack(valid_vectors) if len(valid_vectors) else np.empty((0, 0), dtype=np.float32)
+
+    vectors = np.full((len(column), stacked.shape[1]), np.nan, dtype=stacked.dtype)
+    vectors[has_vector] = stacked
+
+    return vectors, has_vector
+
+
+def write_manifest(directory, manifest):
+    # Write then rename, so a reader never sees half a manifest
+    with open(manifest_path(directory) + '.tmp', 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_path(directory) + '.tmp', manifest_path(directory))
+
+
+def write_table(directory, table, vectors=None, has_vector=None, tokens=None, columns=None, arrays=None, metadata=None):
+    '''Writes one table as a columnar dataset directory.
+
+    table.parquet: every column except the vectors, with IDs and categories dictionary-encoded
+    vectors.npy / has_vector.npy: the 'Average Vector' matrix (NaN rows where it is missing)
+    <column>_offsets.npy / _values.npy / _vocabulary.npy: each {column: (vocabulary, offsets, values)}
+        of tokens, as CSR rows of a vocabulary that starts with the news IDs
+    <name>.npy: each extra array of arrays
+    manifest.json is written last, so a directory without one is an unfinished export. It lists
+    `columns` (by default those of table, then the vectors) and any extra metadata entries.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(manifest_path(directory)):
+        os.remove(manifest_path(directory))
+
+    table = table.copy()
+    for column in DICTIONARY_COLUMNS:
+        if column in table:
+            table[column] = table[column].astype('category')
+
+    table.to_parquet(os.path.join(directory, 'table.parquet'), index=False)
+
+    if vectors is not None:
+        np.save(os.path.join(directory, 'vectors.npy'), vectors)
+        np.save(os.path.join(directory, 'has_vector.npy'), has_vector)
+
+    for column, (vocabulary, offsets, values) in (tokens or {}).items():
+        np.save(os.path.join(directory, _column_file(column, '_vocabulary.npy')), vocabulary.astype(str))
+        np.save(os.path.join(directory, _column_file(column, '_offsets.npy')), offsets)
+        np.save(os.path.join(directory, _column_file(column, '_values.npy')), values)
+
+    for name, array in (arrays or {}).items():
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+
+    if columns is None:
+        columns = list(table.columns) + ([VECTOR_COLUMN] if vectors is not None else [])
+
+    write_manifest(directory, {
+        'rows': len(table),
+        'columns': list(columns),
+        'vector_column': VECTOR_COLUMN if vectors is not None else None,
+        'token_columns': list(tokens or {}),
+        **(metadata or {}),
+    })
+
+
+def export_table(frame, directory, article_ids=None):
+    '''Writes one cleaned table (such as news.pkl) with write_table.
+
+    The 'Average Vector' column is stored as a float32 matrix, and token columns are only encoded
+    when article_ids is given.
+    '''
+    vectors, has_vector = vector_matrix(frame[VECTOR_COLUMN]) if VECTOR_COLUMN in frame else (None, None)
+    tokens = {
+        column: encode_tokens(frame[column], article_ids)
+        for column in TOKEN_COLUMNS if column in frame and article_ids is not None
+    }
+
+    write_table(
+        directory,
+        frame.drop(columns=[VECTOR_COLUMN], errors='ignore'),
+        vectors=vectors.astype(np.float32) if vectors is not None else None,
+        has_vector=has_vector,
+        tokens=tokens,
+        columns=frame.columns
+    )
+
+
+def read_manifest(directory):
+
+    with open(manifest_path(directory)) as file:
+        return json.load(file)
+
+
+def _partition_directories(directory, manifest):
+
+    return [os.path.join(directory, partition) for partition in manifest['partitions']]
+
+
+def load_vectors(directory, mmap=True):
+    '''(vectors, has_vector) of a columnar dataset; vectors are memory-mapped read-only by default.
+
+    The partitions of a partitioned dataset are concatenated, which reads them into memory.
+    '''
+    manifest = read_manifest(directory)
+    if 'partitions' in manifest:
+        parts = [load_vectors(partition, mmap=mmap) for partition in _partition_directories(directory, manifest)]
+        return np.concatenate([vectors for vectors, _ in parts]), np.concatenate([has_vector for _, has_vector in parts])
+
+    return (
+        np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r' if mmap else None),
+        np.load(os.path.join(directory, 'has_vector.npy')),
+    )
+
+
+def load_tokens(directory, column, mmap=True):
+    '''(vocabulary, offsets, values) of a token column; offsets and values are memory-mapped by default.
+
+    Returns None when the column was not exported. The partitions of a partitioned dataset share one
+    vocabulary and are concatenated.
+    '''
+    manifest = read_manifest(directory)
+    if column not in manifest.get('token_columns', []):
+        return None
+
+    if 'partitions' in manifest:
+        parts = [load_tokens(partition, column, mmap=mmap) for partition in _partition_directories(directory, manifest)]
+        if any(part is None or not np.array_equal(part[0], parts[0][0]) for part in parts):
+            return None
+
+        starts = np.cumsum([0] + [part[1][-1] for part in parts[:-1]])
+        offsets = np.concatenate([[0]] + [part[1][1:] + start for part, start in zip(parts, starts)])
+
+        return parts[0][0], offsets.astype(np.int64), np.concatenate([part[2] for part in parts])
+
+    mmap_mode = 'r' if mmap else None
+
+    return (
+        np.load(os.path.join(directory, _column_file(column, '_vocabulary.npy'))).astype(object),
+        np.load(os.path.join(directory, _column_file(column, '_offsets.npy')), mmap_mode=mmap_mode),
+        np.load(os.path.join(directory, _column_file(column, '_values.npy')), mmap_mode=mmap_mode),
+    )
+
+
+def load_table(directory):
+    '''Loads a columnar dataset as a DataFrame with the columns of the original pickle except 'Average Vector'.
+
+    The vectors are not rebuilt as a column of per-row arrays: load_vectors gives them as one
+    memory-mapped matrix, so processes loading the same directory share one page-cached copy.
+    A partitioned dataset (as written by 03.Preprocessing/mind_ingest.py) lists its partitions in
+    its manifest; they are loaded in order and concatenated.
+    '''
+    manifest = read_manifest(directory)
+    columns = [column for column in manifest['columns'] if column != manifest['vector_column']]
+
+    if 'partitions' in manifest:
+        parts = [load_table(partition) for partition in _partition_directories(directory, manifest)]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+
+    return pd.read_parquet(os.path.join(directory, 'table.parquet'))[columns]
+
+
+def columnar_path(pickle_path, name):
+
+    return os.path.join(os.path.dirname(pickle_path), COLUMNAR_DIRECTORY, name)
+
+
+def export_datasets(news, behaviors, directory):
+    '''Exports the cleaned news and behaviors tables to directory/news and directory/behaviors.'''
+    article_ids = news['News ID'].to_numpy()
+
+    export_table(news, os.path.join(directory, 'news'))
+    export_table(behaviors, os.path.join(directory, 'behaviors'), article_ids=article_ids)
+
+
+if __name__ == '__main__':
+    from Shared.DataStore import DATASET_PATHS
+
+    parser = argparse.ArgumentParser(description='Export news.pkl and behaviors.pkl to the memory-mappable columnar format.')
+    parser.parse_args()
+
+    news_path = os.path.join(os.getcwd(), DATASET_PATHS['news'])
+    behaviors_path = os.path.join(os.getcwd(), DATASET_PATHS['behaviors'])
+    output_directory = os.path.dirname(columnar_path(news_path, 'news'))
+
+    export_datasets(pd.read_pickle(news_path), pd.read_pickle(behaviors_path), output_directory)
+
+    print(f'Exported news and behaviors to {output_directory}')
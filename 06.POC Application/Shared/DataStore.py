@@ -0,0 +1,214 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from Shared import Tracing
+from Shared.Tokens import encode_tokens
+from Shared.ColumnarStore import VECTOR_COLUMN, columnar_path, manifest_path, load_table, load_tokens, load_vectors, read_manifest, vector_matrix
+
+# Location of the cleaned datasets, relative to the directory the app is started from
+DATASET_PATHS = {
+    'news': os.path.join('..', '01.Dataset', 'Small', 'Clean', 'Train', 'news.pkl'),
+    'behaviors': os.path.join('..', '01.Dataset', 'Small', 'Clean', 'Train', 'behaviors.pkl'),
+}
+
+# Process-wide registry of loaded datasets and of structures derived from them
+_datasets = {}
+_derived = {}
+_lock = threading.RLock()
+# Bumped whenever a derived structure is built or registered
+_generation = 0
+
+
+def _version_file(path):
+    # A columnar export is versioned by its manifest, which is written last
+    return manifest_path(path) if os.path.isdir(path) else path
+
+
+def _file_version(path):
+    # mtime + size is enough to notice a re-exported pickle without hashing the whole file
+    stat = os.stat(_version_file(path))
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def dataset_path(name):
+    '''Path `name` is read from: its columnar export when that is complete and not older than the pickle, else the pickle.'''
+    pickle_path = os.path.join(os.getcwd(), DATASET_PATHS[name])
+    columnar = columnar_path(pickle_path, name)
+
+    if os.path.exists(manifest_path(columnar)):
+        if not os.path.exists(pickle_path) or os.path.getmtime(manifest_path(columnar)) >= os.path.getmtime(pickle_path):
+            return columnar
+
+    return pickle_path
+
+
+def _load(path):
+    # (frame without the vector column, (vectors, has_vector) or None)
+    if os.path.isdir(path):
+        frame = load_table(path)
+        return frame, load_vectors(path) if read_manifest(path)['vector_column'] is not None else None
+
+    frame = pd.read_pickle(path)
+    if VECTOR_COLUMN not in frame:
+        return frame, None
+
+    vectors = vector_matrix(frame[VECTOR_COLUMN])
+
+    return frame.drop(columns=[VECTOR_COLUMN]), vectors
+
+
+def get_dataset(name, check_for_changes=True):
+    '''Returns the shared DataFrame for `name`, loading it only the first time it is requested.
+
+    The same object is handed to every caller, so it must be treated as read-only.
+    When check_for_changes is True the file is re-read if its mtime or size changed since it was loaded.
+    Columnar exports (see Shared.ColumnarStore) are preferred over the pickles when they are up to date.
+    The 'Average Vector' column is kept apart as a matrix rather than as one array object per row;
+    get_vectors returns it.
+    '''
+    path = dataset_path(name)
+
+    with _lock:
+        entry = _datasets.get(name)
+
+        if entry is not None and (not check_for_changes or (entry['path'] == path and entry['version'] == _file_version(path))):
+            return entry['data']
+
+        version = _file_version(path)
+        with Tracing.stage('load_dataset', dataset=name):
+            data, vectors = _load(path)
+        _datasets[name] = {'path': path, 'version': version, 'data': data, 'vectors': vectors, 'tokens': {}}
+
+        return data
+
+
+def get_news():
+
+    return get_dataset('news')
+
+
+def get_behaviors():
+
+    return get_dataset('behaviors')
+
+
+def _loaded_entry(frame):
+    # The registry entry of a shared dataset frame, None for any other frame
+    with _lock:
+        return next((entry for entry in _datasets.values() if entry['data'] is frame), None)
+
+
+def get_vectors(frame):
+    '''(vectors, has_vector) of the frame's 'Average Vector': one matrix row per frame row, NaN where missing.
+
+    Shared datasets hand out the matrix they keep (memory-mapped for a columnar export); any other
+    frame is stacked from its 'Average Vector' column.
+    '''
+    entry = _loaded_entry(frame)
+    if entry is not None and entry['vectors'] is not None:
+        return entry['vectors']
+
+    return vector_matrix(frame[VECTOR_COLUMN])
+
+
+def get_tokens(frame, column, article_ids):
+    '''encode_tokens(frame[column], article_ids), read from the exported CSR files when frame is a
+    shared dataset loaded from a columnar export whose vocabulary starts with the same article_ids.
+    '''
+    entry = _loaded_entry(frame)
+    if entry is not None and os.path.isdir(entry['path']):
+        with _lock:
+            if column not in entry['tokens']:
+                entry['tokens'][column] = load_tokens(entry['path'], column)
+            tokens = entry['tokens'][column]
+
+        article_ids = np.asarray(article_ids, dtype=object)
+        if tokens is not None and np.array_equal(tokens[0][:len(article_ids)], article_ids):
+            return tokens
+
+    return encode_tokens(frame[column], article_ids)
+
+
+def dataset_version(name):
+    '''Returns the version of the currently loaded copy of `name` (loading it if needed).'''
+    get_dataset(name)
+
+    return _datasets[name]['version']
+
+
+def is_fresh(path, depends_on=('news',)):
+    '''True if a prebuilt file at `path` exists and is newer than every dataset it was built from.'''
+    if not os.path.exists(path):
+        return False
+
+    built = os.path.getmtime(path)
+
+    return all(built >= os.path.getmtime(_version_file(dataset_path(name))) for name in depends_on)
+
+
+def get_derived(key, builder, depends_on=('news',)):
+    '''Returns a structure built from shared datasets, rebuilding it only when one of them changes.
+
+    builder is called with the datasets listed in depends_on, in that order. A structure that is
+    still current is returned without loading the datasets at all.
+    '''
+    with _lock:
+        entry = _derived.get(key)
+        if entry is not None and entry['versions'] == current_versions(depends_on):
+            Tracing.record(derived_hits=1)
+            return entry['data']
+
+        Tracing.record(derived_misses=1)
+        frames = [get_dataset(name) for name in depends_on]
+        versions = tuple(_datasets[name]['version'] for name in depends_on)
+
+        with Tracing.stage('build_derived', structure=str(key)):
+            data = builder(*frames)
+        _derived[key] = {'versions': versions, 'depends_on': tuple(depends_on), 'data': data}
+        _bump_generation()
+
+        return data
+
+
+def _bump_generation():
+
+    global _generation
+    _generation += 1
+
+
+def derived_generation():
+    '''Counter that changes whenever a derived structure (index, matrix, model) is built or registered.
+
+    Results computed from the structures in use carry the generation they were computed at, so a
+    rebuilt or reloaded structure never serves them.
+    '''
+    with _lock:
+        return _generation
+
+
+def current_versions(depends_on=('news',)):
+    '''Versions of the dataset files on disk, without loading them.'''
+    return tuple(_file_version(dataset_path(name)) for name in depends_on)
+
+
+def derived_entries():
+    '''Snapshot of the derived structures built so far: {key: (depends_on, data)}.'''
+    with _lock:
+        return {key: (entry['depends_on'], entry['data']) for key, entry in _derived.items()}
+
+
+def put_derived(key, data, depends_on=('news',)):
+    '''Registers a structure built elsewhere (e.g. by a parent process) as current for the datasets on disk.'''
+    with _lock:
+        _derived[key] = {'versions': current_versions(depends_on), 'depends_on': tuple(depends_on), 'data': data}
+        _bump_generation()
+
+
+def reload(name=None):
+    '''Drops the cached copy of one dataset (or of all of them) so the next access re-reads it from disk.'''
+    with _lock:
+        if name is None:
+            _datasets.clear()
+        else:
+            _datasets.pop(name, None)
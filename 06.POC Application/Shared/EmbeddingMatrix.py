@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from Shared.DataStore import get_derived, get_vectors
+
+
+class EmbeddingMatrix:
+    '''Dense, L2-normalized float32 copy of an object column of vectors, with an ID -> row index.
+
+    ids: array of IDs, one per row; they must be unique, so every ID has exactly one row
+    vectors: (n, d) float32 matrix of unit vectors (all-zero rows stay zero)
+    norms: original length of each vector, so raw averages can still be rebuilt
+    '''
+
+    def __init__(self, ids, raw_vectors):
+
+        self.ids = np.asarray(ids)
+        self.index = pd.Index(self.ids)
+        if not self.index.is_unique:
+            duplicates = self.index[self.index.duplicated()].unique()
+            raise ValueError(f'{len(duplicates)} IDs appear on more than one row, e.g. {duplicates[:5].tolist()}')
+
+        vectors = np.ascontiguousarray(raw_vectors, dtype=np.float32)
+        self.norms = np.linalg.norm(vectors, axis=1)
+
+        # Avoid dividing zero vectors by zero
+        safe_norms = np.where(self.norms > 0, self.norms, 1).astype(np.float32)
+        self.vectors = vectors / safe_norms[:, None]
+
+    def rows(self, ids):
+        '''Unique row numbers of the given IDs, silently skipping unknown ones.'''
+        positions = self.index.get_indexer(pd.Index(ids).unique())
+
+        return np.unique(positions[positions >= 0])
+
+    def profile(self, rows):
+        '''Unit vector pointing like the mean of the raw vectors at `rows` (None if there are none).'''
+        if len(rows) == 0:
+            return None
+
+        average_vector = (self.vectors[rows] * self.norms[rows, None]).mean(axis=0)
+        norm = np.linalg.norm(average_vector)
+
+        if norm == 0:
+            return None
+
+        return average_vector / norm
+
+    def scores(self, user_vector, rows=None):
+        '''Cosine similarity of user_vector with every row (or only with `rows`).'''
+        vectors = self.vectors if rows is None else self.vectors[rows]
+
+        return vectors @ user_vector.astype(np.float32)
+
+    def take(self, rows):
+        '''Copy of the matrix holding only `rows`, in that order.'''
+        taken = EmbeddingMatrix.__new__(EmbeddingMatrix)
+        taken.ids = self.ids[rows]
+        taken.index = pd.Index(taken.ids)
+        taken.norms = self.norms[rows]
+        taken.vectors = self.vectors[rows]
+
+        return taken
+
+
+def top_k_indices(scores, k, mask=None):
+    '''Positions of the k largest scores in descending order, ignoring positions where mask is False.'''
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+        available = int(np.count_nonzero(mask))
+    else:
+        available = len(scores)
+
+    k = min(k, available)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Partial selection of the top k, then sort only those
+    top = np.argpartition(-scores, k - 1)[:k]
+
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def top_k_rows(scores, k):
+    '''Row by row, positions of the k largest scores in descending order; -inf scores are never returned.'''
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(len(scores))]
+
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    return [row[np.isfinite(row_scores)] for row, row_scores in zip(top, top_scores)]
+
+
+def build_news_embeddings(news):
+
+    vectors, _ = get_vectors(news)
+
+    return EmbeddingMatrix(news['News ID'].to_numpy(), vectors)
+
+
+def get_news_embeddings():
+    '''Embedding matrix of the shared news dataset, rebuilt only when news.pkl changes.'''
+    return get_derived('news_embeddings', build_news_embeddings)
@@ -0,0 +1,77 @@
+import numpy as np
+from Shared.EmbeddingMatrix import top_k_indices
+
+
+def nearest_centroid(vectors, centroids, block_size=65536):
+    '''Row of the most similar centroid for every (unit) vector, scored block by block.'''
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assignment[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+
+    return assignment
+
+
+class InvertedFile:
+    '''Rows of a matrix of unit vectors bucketed under their nearest spherical k-means centroid.
+
+    A query only looks at the rows of the n_probe centroids closest to it, which is what makes an
+    IVF search approximate and cheap. The rows of list c are order[offsets[c]:offsets[c + 1]].
+    '''
+
+    def __init__(self, centroids, order, offsets, n_probe=8):
+
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.order = np.asarray(order)
+        self.offsets = np.asarray(offsets)
+        self.n_probe = n_probe
+
+    @classmethod
+    def train(cls, vectors, n_lists=None, n_probe=8, n_iter=10, seed=0, block_size=65536):
+        '''Trains the centroids on a bounded sample of `vectors` and files every row under one of them.
+
+        n_lists defaults to the square root of the number of rows.
+        '''
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        centroids = _train_centroids(vectors, n_lists, n_iter, seed, block_size)
+
+        assignment = nearest_centroid(vectors, centroids, block_size)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))))
+
+        return cls(centroids, order, offsets, n_probe)
+
+    def probe(self, vector):
+        '''Rows filed under the n_probe centroids closest to `vector`.'''
+        probed = top_k_indices(self.centroids @ vector, self.n_probe)
+
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probed])
+
+    def arrays(self):
+
+        return {'centroids': self.centroids, 'order': self.order, 'offsets': self.offsets}
+
+
+def _train_centroids(vectors, n_lists, n_iter, seed, block_size):
+
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(vectors))
+
+    # Train on a bounded sample; centroids do not need every row
+    sample_size = min(len(vectors), 256 * n_lists)
+    sample = np.asarray(vectors[rng.choice(len(vectors), sample_size, replace=False)], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignment = nearest_centroid(sample, centroids, block_size)
+        counts = np.bincount(assignment, minlength=n_lists)
+        non_empty = counts > 0
+
+        # Sum the members of every non-empty list in one pass, then project back onto the sphere
+        order = np.argsort(assignment, kind='stable')
+        starts = (np.cumsum(counts) - counts)[non_empty]
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids[non_empty] = sums / np.where(norms > 0, norms, 1)
+
+    return centroids
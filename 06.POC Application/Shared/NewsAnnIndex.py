@@ -0,0 +1,99 @@
+import os
+import argparse
+import numpy as np
+from Shared.DataStore import dataset_path, get_derived, is_fresh
+from Shared.EmbeddingMatrix import get_news_embeddings, top_k_indices
+from Shared.InvertedFile import InvertedFile
+
+# Prebuilt next to news.pkl
+NEWS_ANN_INDEX_FILE = 'news_ann_index.npz'
+
+
+class NewsAnnIndex:
+    '''Approximate nearest-article search over the rows of the news embedding matrix.
+
+    An InvertedFile over the (unit) news vectors: a query scores only the articles filed under its
+    n_probe closest centroids. Only the lists are stored; the vectors are those of the embedding
+    matrix, so the index adds about one int64 per article.
+    '''
+
+    def __init__(self, vectors, lists):
+
+        self.vectors = vectors
+        self.lists = lists
+
+    @classmethod
+    def build(cls, embeddings, **kwargs):
+        '''Trains the lists on an EmbeddingMatrix (kwargs go to InvertedFile.train).'''
+        return cls(embeddings.vectors, InvertedFile.train(embeddings.vectors, **kwargs))
+
+    def query_rows(self, vector, n=100):
+        '''Rows of up to n articles most similar to the unit `vector`, most similar first.'''
+        vector = np.asarray(vector, dtype=np.float32)
+        candidates = self.lists.probe(vector)
+
+        return candidates[top_k_indices(self.vectors[candidates] @ vector, n)]
+
+    def save(self, path):
+
+        np.savez(path, n_probe=self.lists.n_probe, **self.lists.arrays())
+
+
+def load_news_ann_index(path, embeddings):
+
+    with np.load(path) as data:
+        lists = InvertedFile(data['centroids'], data['order'], data['offsets'], int(data['n_probe']))
+
+    if len(lists.order) != len(embeddings.ids):
+        raise ValueError(f'{path} indexes {len(lists.order)} articles, the news embeddings have {len(embeddings.ids)}')
+
+    return NewsAnnIndex(embeddings.vectors, lists)
+
+
+def news_ann_index_path():
+
+    return os.path.join(os.path.dirname(dataset_path('news')), NEWS_ANN_INDEX_FILE)
+
+
+def news_ann_index_available():
+    '''True if a prebuilt news ANN index newer than news.pkl exists.'''
+    return is_fresh(news_ann_index_path(), depends_on=('news',))
+
+
+def get_news_ann_index():
+    '''Shared news ANN index, loaded from its prebuilt file and reloaded when news.pkl changes.
+
+    Training the centroids is too slow to do inside a request, so this raises FileNotFoundError
+    when there is no prebuilt file newer than news.pkl.
+    '''
+    def builder(news):
+        if not news_ann_index_available():
+            raise FileNotFoundError(
+                f'No news ANN index newer than news.pkl at {news_ann_index_path()}; '
+                'build it with python -m Shared.NewsAnnIndex'
+            )
+
+        return load_news_ann_index(news_ann_index_path(), get_news_embeddings())
+
+    return get_derived('news_ann_index', builder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and save the approximate nearest-article index of the news embeddings.')
+    parser.add_argument('--n-lists', type=int, help='Centroids (default: square root of the number of articles)')
+    parser.add_argument('--n-probe', type=int, default=8, help='Closest lists scored per query')
+    parser.add_argument('--n', type=int, default=100, help='Articles per query to measure recall')
+    parser.add_argument('--queries', type=int, default=200, help='Articles sampled as queries to measure recall')
+    args = parser.parse_args()
+
+    embeddings = get_news_embeddings()
+    index = NewsAnnIndex.build(embeddings, n_lists=args.n_lists, n_probe=args.n_probe)
+    index.save(news_ann_index_path())
+
+    sample = np.random.default_rng(0).choice(len(embeddings.ids), min(args.queries, len(embeddings.ids)), replace=False)
+    recalls = [
+        len(np.intersect1d(index.query_rows(query, args.n), top_k_indices(embeddings.vectors @ query, args.n))) / min(args.n, len(embeddings.ids))
+        for query in embeddings.vectors[sample]
+    ]
+    print(f'recall@{args.n} vs exact search: {np.mean(recalls):.3f}')
+    print(f'Saved news ANN index over {len(embeddings.ids)} articles to {news_ann_index_path()}')
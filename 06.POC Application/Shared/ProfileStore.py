@@ -0,0 +1,153 @@
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from Shared.DataStore import get_derived
+from Shared.EmbeddingMatrix import get_news_embeddings
+
+# Clicks up to this many are looked up ID by ID rather than through a pandas Index
+SMALL_CLICK_BATCH = 16
+
+
+class SessionProfile:
+    '''Running profile of one user or session over the rows of an EmbeddingMatrix.
+
+    Keeps the sum and count of the raw vectors of the distinct articles read, so adding a click is
+    O(d) instead of averaging the whole history again, and the read set as a bitset over the rows,
+    so checking whether a candidate was read is one bit test. With a half_life, a second sum decays
+    by half every half_life of click time, for a profile that follows recent reads.
+
+    sum: float64 sum of the raw vectors read
+    count: number of distinct articles read
+    read_bits: uint8 bitset, bit i of byte i >> 3 set when row i was read
+    '''
+
+    def __init__(self, n_articles, dimensions, half_life=None):
+
+        self.sum = np.zeros(dimensions, dtype=np.float64)
+        self.count = 0
+        self.read_bits = np.zeros((n_articles + 7) // 8, dtype=np.uint8)
+
+        self.half_life = pd.Timedelta(half_life) if half_life is not None else None
+        self.decayed_sum = np.zeros(dimensions, dtype=np.float64)
+        self.last_click = None
+
+    def is_read(self, rows):
+        '''Boolean mask of which of the given rows were read.'''
+        rows = np.asarray(rows, dtype=np.int64)
+
+        return ((self.read_bits[rows >> 3] >> (rows & 7)) & 1).astype(bool)
+
+    def read_rows(self):
+        '''Rows read so far, ascending.'''
+        return np.flatnonzero(np.unpackbits(self.read_bits, bitorder='little'))
+
+    def add(self, embeddings, rows, timestamp=None):
+        '''Adds the articles at `rows` not read yet; returns how many were new.'''
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        rows = rows[~self.is_read(rows)]
+        if len(rows) == 0:
+            return 0
+
+        raw_sum = (embeddings.vectors[rows].astype(np.float64) * embeddings.norms[rows, None]).sum(axis=0)
+        self.sum += raw_sum
+        self.count += len(rows)
+        np.bitwise_or.at(self.read_bits, rows >> 3, (1 << (rows & 7)).astype(np.uint8))
+
+        if self.half_life is not None:
+            self._decay(raw_sum, pd.Timestamp(timestamp) if timestamp is not None else None)
+
+        return len(rows)
+
+    def _decay(self, raw_sum, timestamp):
+        # The decayed sum is kept as of last_click: later clicks decay it first, earlier ones are decayed themselves
+        if timestamp is None or self.last_click is None:
+            self.decayed_sum += raw_sum
+            self.last_click = self.last_click if timestamp is None else timestamp
+        elif timestamp >= self.last_click:
+            self.decayed_sum = self.decayed_sum * 0.5 ** ((timestamp - self.last_click) / self.half_life) + raw_sum
+            self.last_click = timestamp
+        else:
+            self.decayed_sum += raw_sum * 0.5 ** ((self.last_click - timestamp) / self.half_life)
+
+    def profile(self, decayed=None):
+        '''Unit vector pointing like the mean (or decayed sum) of the raw vectors read (None if there are none).
+
+        decayed defaults to whether the profile has a half_life.
+        '''
+        if decayed is None:
+            decayed = self.half_life is not None
+        vector = self.decayed_sum if decayed and self.half_life is not None else self.sum
+        norm = np.linalg.norm(vector)
+
+        if self.count == 0 or norm == 0:
+            return None
+
+        return (vector / norm).astype(np.float32)
+
+
+class ProfileStore:
+    '''SessionProfiles by session (or user) ID, for the articles of one EmbeddingMatrix.
+
+    Sessions are created on their first click and the least recently used ones are dropped beyond
+    max_sessions, which bounds memory to about max_sessions * n_articles / 8 bytes of bitsets.
+    '''
+
+    def __init__(self, embeddings, max_sessions=4096, half_life=None):
+
+        self.embeddings = embeddings
+        self.max_sessions = max_sessions
+        self.half_life = half_life
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def session(self, session_id):
+        '''The session's profile, created empty if it is new.'''
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = SessionProfile(
+                    len(self.embeddings.ids), self.embeddings.vectors.shape[1], self.half_life
+                )
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+
+            return session
+
+    def _rows(self, news_ids):
+        # A few clicks are looked up one by one: the hash lookups are much cheaper than building an Index.
+        # EmbeddingMatrix IDs are unique, so get_loc always returns a single row.
+        if len(news_ids) > SMALL_CLICK_BATCH:
+            return self.embeddings.rows(news_ids)
+
+        index = self.embeddings.index
+        return np.array([index.get_loc(news_id) for news_id in news_ids if news_id in index], dtype=np.int64)
+
+    def click(self, session_id, news_ids, timestamp=None):
+        '''Records reads of news_ids (unknown IDs and articles already read are skipped); returns the session.'''
+        session = self.session(session_id)
+        rows = self._rows(list(news_ids))
+        with self._lock:
+            session.add(self.embeddings, rows, timestamp)
+
+        return session
+
+    def forget(self, session_id):
+
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+
+        return len(self._sessions)
+
+
+def get_profile_store(half_life=None):
+    '''Process-wide ProfileStore; every session is dropped when news.pkl changes, since its rows do.'''
+    def builder(news):
+        return ProfileStore(get_news_embeddings(), half_life=half_life)
+
+    return get_derived(('profile_store', half_life), builder)
@@ -0,0 +1,200 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from Shared.DataStore import dataset_path, get_derived, get_vectors
+from Shared.EmbeddingMatrix import top_k_rows
+from Shared.TimeIndex import get_release_date_index
+
+# Storage types a quantized matrix can use, by name
+QUANTIZED_DTYPES = {'float16': np.float16, 'int8': np.int8}
+
+# Exact unit vectors of the quantized news embeddings, written next to news.pkl, e.g. news_vectors_release.npy
+NEWS_VECTORS_FILE = 'news_vectors_{order}.npy'
+
+
+class QuantizedMatrix:
+    '''Row vectors stored as float16 or int8 codes with one float32 scale per row.
+
+    int8 rows are round(vector / scale) with scale = max |component| / 127; float16 rows are the
+    vectors themselves with scale 1. That is 4x (int8) or 2x (float16) less memory than float32.
+    Scores computed on the codes are approximate: they are meant to shortlist candidates, which are
+    then re-ranked on the exact float32 vectors (see rerank).
+    '''
+
+    def __init__(self, codes, scales):
+
+        self.codes = codes
+        self.scales = np.asarray(scales, dtype=np.float32)
+
+    @classmethod
+    def from_vectors(cls, vectors, dtype='int8', block_size=65536):
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty(vectors.shape, dtype=QUANTIZED_DTYPES[dtype])
+        scales = np.ones(len(vectors), dtype=np.float32)
+
+        # Block by block, so only one block is ever held in float32 next to the codes
+        for start in range(0, len(vectors), block_size):
+            codes[start:start + block_size], scales[start:start + block_size] = quantize(vectors[start:start + block_size], dtype)
+
+        return cls(codes, scales)
+
+    def __len__(self):
+
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, queries, start=0, stop=None):
+        '''Approximate queries @ vectors[start:stop].T; only that block is converted to float32.'''
+        block = self.codes[start:stop].astype(np.float32)
+
+        return (np.asarray(queries, dtype=np.float32) @ block.T) * self.scales[start:stop]
+
+
+def quantize(block, dtype='int8'):
+    '''(codes, scales) of a float32 block of row vectors, as stored by QuantizedMatrix.'''
+    if dtype != 'int8':
+        return block.astype(QUANTIZED_DTYPES[dtype]), np.ones(len(block), dtype=np.float32)
+
+    scales = np.abs(block).max(axis=1, initial=0) / 127
+    scales[scales == 0] = 1
+
+    return np.rint(block / scales[:, None]).astype(np.int8), scales
+
+
+class QuantizedEmbeddings:
+    '''News embeddings for approximate scoring, without a resident float32 copy of the vectors.
+
+    ids, index and norms are those of the EmbeddingMatrix with the same rows. quantized holds the
+    int8 or float16 codes of the unit vectors, which are the only per-dimension data in memory; vectors
+    is the exact float32 unit matrix memory-mapped from disk, of which only the rows of read articles
+    and of shortlisted candidates are ever read.
+    '''
+
+    def __init__(self, ids, norms, quantized, vectors):
+
+        self.ids = np.asarray(ids)
+        self.index = pd.Index(self.ids)
+        self.norms = norms
+        self.quantized = quantized
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, ids, raw_vectors, path, dtype='int8', order=None, block_size=65536):
+        '''Quantizes raw_vectors[order] block by block, writing their exact unit rows to path as it goes.'''
+        order = np.arange(len(ids)) if order is None else np.asarray(order)
+        shape = (len(order), raw_vectors.shape[1])
+
+        norms = np.empty(len(order), dtype=np.float32)
+        codes = np.empty(shape, dtype=QUANTIZED_DTYPES[dtype])
+        scales = np.empty(len(order), dtype=np.float32)
+
+        # Written under a temporary name, so a process mapping the previous file keeps a complete one
+        exact = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float32, shape=shape)
+        for start in range(0, len(order), block_size):
+            block = np.asarray(raw_vectors[order[start:start + block_size]], dtype=np.float32)
+            block_norms = np.linalg.norm(block, axis=1)
+            block /= np.where(block_norms > 0, block_norms, 1).astype(np.float32)[:, None]
+
+            norms[start:start + block_size] = block_norms
+            exact[start:start + block_size] = block
+            codes[start:start + block_size], scales[start:start + block_size] = quantize(block, dtype)
+        exact.flush()
+        del exact
+        os.replace(path + '.tmp', path)
+
+        return cls(np.asarray(ids)[order], norms, QuantizedMatrix(codes, scales), np.load(path, mmap_mode='r'))
+
+    def scores(self, queries, start=0, stop=None):
+
+        return self.quantized.scores(queries, start, stop)
+
+    @property
+    def nbytes(self):
+        '''Resident bytes of the per-article arrays (the memory-mapped vectors are not counted).'''
+        return self.quantized.nbytes + self.norms.nbytes
+
+
+def shortlist_size(k, shortlist):
+    '''Candidates kept per query for re-ranking: shortlist times k, at least k.'''
+    return max(k, int(np.ceil(k * shortlist)))
+
+
+def rerank(queries, candidate_rows, coarse_scores, exact_vectors, k):
+    '''Re-ranks each query's shortlist on exact float32 vectors.
+
+    candidate_rows and coarse_scores are (n_queries, m) arrays of shortlisted rows and their
+    approximate scores; candidates with a -inf coarse score (masked out) are never returned.
+    exact_vectors may be memory-mapped: only the shortlisted rows are read.
+    Returns one array of rows per query, best first.
+    '''
+    queries = np.asarray(queries, dtype=np.float32)
+    if candidate_rows.shape[1] == 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(len(queries))]
+
+    exact_scores = np.einsum('qmd,qd->qm', np.asarray(exact_vectors[candidate_rows], dtype=np.float32), queries)
+    exact_scores[~np.isfinite(coarse_scores)] = -np.inf
+
+    return [rows[top] for rows, top in zip(candidate_rows, top_k_rows(exact_scores, k))]
+
+
+def mean_recall(approximate_rows, exact_rows):
+    '''Mean share of each query's exact top k found by the approximate search.'''
+    recalls = [
+        len(np.intersect1d(approximate, exact)) / len(exact)
+        for approximate, exact in zip(approximate_rows, exact_rows) if len(exact)
+    ]
+
+    return float(np.mean(recalls)) if recalls else 0.0
+
+
+def news_vectors_path(release_ordered=True):
+
+    file_name = NEWS_VECTORS_FILE.format(order='release' if release_ordered else 'news')
+
+    return os.path.join(os.path.dirname(dataset_path('news')), file_name)
+
+
+def get_quantized_news_embeddings(dtype='int8', release_ordered=True):
+    '''Shared QuantizedEmbeddings of the news (release-ordered or in news.pkl order), rebuilt only when news.pkl changes.
+
+    They are built straight from the dataset's vectors, never from a float32 EmbeddingMatrix.
+    '''
+    def builder(news):
+        raw_vectors, _ = get_vectors(news)
+        order = get_release_date_index().order if release_ordered else None
+        path = news_vectors_path(release_ordered)
+
+        return QuantizedEmbeddings.build(news['News ID'].to_numpy(), raw_vectors, path, dtype, order)
+
+    return get_derived(('quantized_news_embeddings', dtype, release_ordered), builder)
+
+
+if __name__ == '__main__':
+    from Shared.DataStore import get_behaviors
+    from BatchRecommender import recommend_batch
+
+    parser = argparse.ArgumentParser(description='Recall and memory of quantized content scoring against float32.')
+    parser.add_argument('--precision', choices=sorted(QUANTIZED_DTYPES), default='int8')
+    parser.add_argument('--shortlist', type=float, default=4, help='Candidates re-ranked per result')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=500, help='Interactions sampled from behaviors')
+    args = parser.parse_args()
+
+    behaviors = get_behaviors().dropna(subset=['User ID', 'History'])
+    sample = np.random.default_rng(0).choice(len(behaviors), min(args.queries, len(behaviors)), replace=False)
+    interactions = list(zip(behaviors['User ID'].to_numpy()[sample], behaviors['Timestamp'].to_numpy()[sample]))
+
+    exact = recommend_batch(interactions, model='content', k=args.k)
+    approximate = recommend_batch(interactions, model='content', k=args.k, precision=args.precision, shortlist=args.shortlist)
+    keys = list(exact)
+    recall = mean_recall([approximate[key] for key in keys], [exact[key] for key in keys])
+
+    quantized = get_quantized_news_embeddings(args.precision)
+    print(f'recall@{args.k} of {args.precision} content scoring vs float32: {recall:.3f}')
+    print(f'Resident vectors: {quantized.nbytes / 2**20:.1f} MB ({args.precision}) instead of {quantized.vectors.nbytes / 2**20:.1f} MB (float32)')
@@ -0,0 +1,151 @@
+import time
+import pickle
+import hashlib
+import threading
+import pandas as pd
+from collections import OrderedDict
+from Shared import Tracing
+from Shared.DataStore import current_versions
+
+
+class ResultCache:
+    '''Bounded cache of recommendation results, shared by every recommender of the process.
+
+    Keys are a canonical hash of the read set, the timestamp floored to `bucket`, the model name
+    and version, k and any other options, so repeat views of the same inputs are served without
+    recomputing, and a changed model never serves results of the old one.
+    Entries expire after ttl seconds and the least recently used ones are evicted once the pickled
+    size of all results exceeds max_bytes. The whole cache is dropped as soon as one of the
+    datasets in depends_on changes on disk. Cached results are shared between callers, so they
+    must be treated as read-only.
+    '''
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=600, bucket='1h', depends_on=('news', 'behaviors')):
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bucket = pd.Timedelta(bucket)
+        self.depends_on = tuple(depends_on)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions = None
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def key(self, model, version, read_articles, timestamp, k, **options):
+        '''Canonical key: the order and duplicates of read_articles (and of list options) do not matter.
+
+        version identifies the model's code and the structures it scores with; any repr-able value.
+        '''
+        bucket_start = pd.Timestamp(timestamp).floor(self.bucket) if timestamp is not None else None
+
+        parts = [model, repr(version), sorted(set(map(str, read_articles))), str(bucket_start), int(k)]
+        for name in sorted(options):
+            value = options[name]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                value = sorted(set(map(str, value)))
+            parts.append((name, value))
+
+        return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+    def _check_versions(self):
+        # Results computed from an older copy of the datasets must never be served
+        versions = current_versions(self.depends_on)
+        if versions != self._versions:
+            if self._versions is not None:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self._versions = versions
+
+    def get(self, key):
+        '''(True, result) on a hit, (False, None) on a miss.'''
+        with self._lock:
+            self._check_versions()
+
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return True, entry[0]
+
+    def put(self, key, result):
+
+        size = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._check_versions()
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, size, time.monotonic() + self.ttl)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def get_or_compute(self, compute, model, version, read_articles, timestamp, k, **options):
+        '''Cached result for these inputs, calling compute() only on a miss.'''
+        key = self.key(model, version, read_articles, timestamp, k, **options)
+
+        found, result = self.get(key)
+        Tracing.record(cache_hits=int(found), cache_misses=int(not found))
+        if not found:
+            result = compute()
+            self.put(key, result)
+
+        return result
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+# One cache for the whole process, so every recommender shares the byte budget
+_shared_cache = ResultCache()
+
+
+def get_result_cache():
+
+    return _shared_cache
+
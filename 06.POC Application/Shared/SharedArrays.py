@@ -0,0 +1,61 @@
+import os
+import re
+import copy
+import pickle
+import numpy as np
+
+# Smaller arrays are cheaper to pickle than to map
+MIN_SHARED_BYTES = 1 << 20
+
+
+def _is_large_array(value):
+
+    return isinstance(value, np.ndarray) and value.dtype != object and value.nbytes >= MIN_SHARED_BYTES
+
+
+def share(data, directory, name):
+    '''Writes the large numeric arrays of `data` to .npy files and returns a small, picklable descriptor.
+
+    data may be an array, a tuple of values or an object whose attributes hold arrays; anything else
+    is pickled into the descriptor as is. attach() rebuilds it in another process with the arrays
+    memory-mapped read-only, so every process shares one page-cached copy.
+    '''
+    name = re.sub(r'\W+', '_', name).strip('_')
+
+    if _is_large_array(data):
+        path = os.path.join(directory, name + '.npy')
+        np.save(path, data)
+        return ('array', path)
+
+    if isinstance(data, tuple):
+        return ('tuple', [share(item, directory, f'{name}_{i}') for i, item in enumerate(data)])
+
+    if hasattr(data, '__dict__'):
+        shell = copy.copy(data)
+        arrays = {}
+        for attribute, value in vars(data).items():
+            if _is_large_array(value):
+                arrays[attribute] = share(value, directory, f'{name}_{attribute}')
+                setattr(shell, attribute, None)
+        return ('object', pickle.dumps(shell), arrays)
+
+    return ('value', pickle.dumps(data))
+
+
+def attach(descriptor):
+    '''Rebuilds data shared with share().'''
+    kind = descriptor[0]
+
+    if kind == 'array':
+        return np.load(descriptor[1], mmap_mode='r')
+
+    if kind == 'tuple':
+        return tuple(attach(item) for item in descriptor[1])
+
+    if kind == 'object':
+        data = pickle.loads(descriptor[1])
+        for attribute, array_descriptor in descriptor[2].items():
+            setattr(data, attribute, attach(array_descriptor))
+        return data
+
+    return pickle.loads(descriptor[1])
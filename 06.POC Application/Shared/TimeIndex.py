@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from Shared.DataStore import get_derived
+from Shared.EmbeddingMatrix import get_news_embeddings
+
+
+class TimeIndex:
+    '''Row numbers of a dataset sorted by one of its datetime columns.
+
+    The rows at or before any timestamp are then a prefix of `order`, found with one binary search
+    and returned as a view, instead of a boolean scan of the whole column on every call.
+    Rows without a time (NaT) are left out of `order`.
+
+    order: row numbers, oldest first
+    times: the (sorted) time of each entry of `order`
+    ranks: position in `order` of every row (len(order) for rows without a time)
+    '''
+
+    def __init__(self, times):
+
+        times = np.asarray(times, dtype='datetime64[ns]')
+        known = np.flatnonzero(~np.isnat(times))
+
+        self.order = known[np.argsort(times[known], kind='stable')]
+        self.times = times[self.order]
+
+        self.ranks = np.full(len(times), len(self.order), dtype=np.int64)
+        self.ranks[self.order] = np.arange(len(self.order))
+
+    def end(self, timestamp):
+        '''Number of rows at or before `timestamp`.'''
+        return int(np.searchsorted(self.times, pd.Timestamp(timestamp).to_datetime64(), side='right'))
+
+    def ends(self, timestamps):
+        '''end() of many timestamps at once.'''
+        return np.searchsorted(self.times, pd.to_datetime(pd.Series(timestamps)).to_numpy(dtype='datetime64[ns]'), side='right')
+
+    def rows_until(self, timestamp):
+        '''Row numbers at or before `timestamp`, oldest first (a view of `order`, do not modify).'''
+        return self.order[:self.end(timestamp)]
+
+
+def get_release_date_index():
+    '''News rows sorted by 'Release Date', rebuilt only when news.pkl changes.'''
+    def builder(news):
+        return TimeIndex(news['Release Date'])
+
+    return get_derived('release_date_index', builder)
+
+
+def get_release_ordered_embeddings():
+    '''News embedding matrix with its rows in release-date order.
+
+    The articles released by any timestamp are then the first get_release_date_index().end(timestamp)
+    rows, so scoring them is a matmul over a slice of the matrix rather than over every article.
+    This costs a second copy of the news vectors.
+    '''
+    def builder(news):
+        return get_news_embeddings().take(get_release_date_index().order)
+
+    return get_derived('release_ordered_embeddings', builder)
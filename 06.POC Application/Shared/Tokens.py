@@ -0,0 +1,45 @@
+from itertools import chain
+import numpy as np
+import pandas as pd
+
+
+def flatten_tokens(texts):
+    '''Splits a Series of space-separated IDs into one flat array of tokens plus the token count of each row.
+
+    Missing values count as rows without tokens.
+    '''
+    tokens = pd.Series(texts).fillna('').str.split()
+    lengths = tokens.str.len().to_numpy().astype(np.int64)
+    flat_tokens = np.fromiter(chain.from_iterable(tokens), dtype=object, count=int(lengths.sum()))
+
+    return flat_tokens, lengths
+
+
+def encode_tokens(texts, article_ids):
+    '''Encodes a Series of space-separated IDs as CSR rows of a vocabulary.
+
+    The vocabulary starts with article_ids in their order; tokens missing from it are appended after them.
+    Returns (vocabulary, offsets, values) where row i holds values[offsets[i]:offsets[i + 1]].
+    '''
+    flat_tokens, lengths = flatten_tokens(texts)
+
+    article_ids = np.asarray(article_ids, dtype=object)
+    unknown = pd.unique(flat_tokens[pd.Index(article_ids).get_indexer(flat_tokens) < 0])
+    vocabulary = np.concatenate([article_ids, unknown])
+
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    values = pd.Index(vocabulary).get_indexer(flat_tokens).astype(np.int32)
+
+    return vocabulary, offsets, values
+
+
+def take_rows(offsets, values, rows):
+    '''The CSR rows `rows` of (offsets, values), as new (offsets, values).'''
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = np.asarray(offsets)[rows]
+    lengths = np.asarray(offsets)[rows + 1] - starts
+
+    new_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+
+    return new_offsets, np.asarray(values)[positions]
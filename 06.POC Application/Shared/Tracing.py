@@ -0,0 +1,338 @@
+import json
+import time
+import bisect
+import functools
+import threading
+import tracemalloc
+from collections import Counter
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency histogram buckets, as Prometheus' defaults plus sub-millisecond ones
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_sinks = ()
+_enabled = False
+_track_allocations = False
+_current_tier = ContextVar('tier', default=None)
+_local = threading.local()
+
+
+class Span:
+    '''One timed run of a pipeline stage, within the tier that was current when it started.
+
+    Numeric values recorded on it (candidates, cache_hits, ...) add up; other values are kept as
+    is. With allocation tracking on, allocated_bytes is the peak traced memory during the stage
+    above what was allocated when it started (process-wide, so only exact for one request at a time).
+    '''
+
+    def __init__(self, stage, tier=None, **values):
+
+        self.stage = stage
+        self.tier = tier if tier is not None else _current_tier.get()
+        self.values = values
+        self.started_at = None
+        self.seconds = None
+        self._sets_tier = False
+        self._tier_token = None
+
+    def record(self, **values):
+
+        for name, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.values[name] = self.values.get(name, 0) + value
+            else:
+                self.values[name] = value
+
+        return self
+
+    def __enter__(self):
+
+        stack = _stack()
+        if _track_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, peak)
+            tracemalloc.reset_peak()
+            self._memory = self._peak = current
+
+        if self._sets_tier:
+            self._tier_token = _current_tier.set(self.tier)
+
+        stack.append(self)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+
+        self.seconds = time.perf_counter() - self._started
+        stack = _stack()
+        stack.pop()
+
+        if _track_allocations and hasattr(self, '_memory'):
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            self.values['allocated_bytes'] = self._peak - self._memory
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, self._peak)
+
+        if self._tier_token is not None:
+            _current_tier.reset(self._tier_token)
+        if error_type is not None:
+            self.values['error'] = error_type.__name__
+
+        for sink in _sinks:
+            sink.emit(self)
+
+        return False
+
+
+class _NullSpan:
+    '''What stage() and tier() return while tracing is disabled: every call is a no-op.'''
+
+    def record(self, **values):
+
+        return self
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _stack():
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    return stack
+
+
+def enable(*sinks, track_allocations=False):
+    '''Starts tracing into the given sinks; track_allocations also measures allocated bytes (with tracemalloc, slow).'''
+    global _sinks, _enabled, _track_allocations
+
+    _sinks = tuple(sinks)
+    _track_allocations = track_allocations
+    if track_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _enabled = bool(_sinks)
+
+
+def disable():
+    '''Stops tracing and returns the sinks that were in use.'''
+    global _sinks, _enabled, _track_allocations
+
+    sinks = _sinks
+    if _track_allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _sinks, _enabled, _track_allocations = (), False, False
+
+    return sinks
+
+
+def is_enabled():
+
+    return _enabled
+
+
+def stage(name, **values):
+    '''Context manager timing one stage: `with stage('cosine_scoring') as span: ... span.record(candidates=n)`.'''
+    if not _enabled:
+        return NULL_SPAN
+
+    return Span(name, **values)
+
+
+def tier(name):
+    '''Context manager timing a whole tier; stages started inside it (in this thread) are attributed to it.'''
+    if not _enabled:
+        return NULL_SPAN
+
+    span = Span('tier', tier=name)
+    span._sets_tier = True
+
+    return span
+
+
+def record(**values):
+    '''Records values on the innermost running stage of this thread (ignored when there is none).'''
+    if not _enabled:
+        return
+
+    stack = _stack()
+    if stack:
+        stack[-1].record(**values)
+
+
+def traced(name=None):
+    '''Decorator timing every call of a function as a stage (the function name by default).'''
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(stage_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class HistogramSink:
+    '''In-memory latency histogram and totals of the recorded values, per (tier, stage).'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def emit(self, span):
+
+        with self._lock:
+            entry = self._stages.get((span.tier, span.stage))
+            if entry is None:
+                entry = self._stages[(span.tier, span.stage)] = {
+                    'count': 0, 'seconds': 0.0, 'buckets': [0] * (len(self.buckets) + 1), 'totals': Counter()
+                }
+
+            entry['count'] += 1
+            entry['seconds'] += span.seconds
+            entry['buckets'][bisect.bisect_left(self.buckets, span.seconds)] += 1
+            entry['totals'].update({
+                name: value for name, value in span.values.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            })
+            if 'error' in span.values:
+                entry['totals']['errors'] += 1
+
+    def percentile(self, entry, q):
+        # Upper bound of the bucket holding the q-th percentile (the last finite bound for the overflow bucket)
+        rank = q / 100 * entry['count']
+        seen = 0
+        for bound, count in zip(self.buckets + (self.buckets[-1],), entry['buckets']):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return self.buckets[-1]
+
+    def summary(self):
+        '''{(tier, stage): {'count', 'mean_ms', 'p50_ms', 'p99_ms', totals...}}, slowest total first.'''
+        with self._lock:
+            entries = sorted(self._stages.items(), key=lambda item: -item[1]['seconds'])
+
+            return {
+                key: {
+                    'count': entry['count'],
+                    'mean_ms': entry['seconds'] / entry['count'] * 1000,
+                    'p50_ms': self.percentile(entry, 50) * 1000,
+                    'p99_ms': self.percentile(entry, 99) * 1000,
+                    **entry['totals'],
+                }
+                for key, entry in entries
+            }
+
+    def exposition(self):
+        '''The histograms and totals in the Prometheus text exposition format.'''
+        lines = [
+            '# HELP pipeline_stage_seconds Wall time of recommendation pipeline stages.',
+            '# TYPE pipeline_stage_seconds histogram',
+        ]
+        totals = {}
+
+        with self._lock:
+            for (tier, stage), entry in sorted(self._stages.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+                labels = f'stage="{stage}",tier="{tier or ""}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry['buckets']):
+                    cumulative += count
+                    lines.append(f'pipeline_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'pipeline_stage_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+                lines.append(f'pipeline_stage_seconds_sum{{{labels}}} {entry["seconds"]}')
+                lines.append(f'pipeline_stage_seconds_count{{{labels}}} {entry["count"]}')
+
+                for name, value in entry['totals'].items():
+                    totals.setdefault(name, []).append(f'pipeline_stage_{name}_total{{{labels}}} {value}')
+
+        for name, samples in totals.items():
+            lines.append(f'# TYPE pipeline_stage_{name}_total counter')
+            lines.extend(samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+
+        with self._lock:
+            self._stages.clear()
+
+
+class JsonlSink:
+    '''Appends one JSON record per stage run to a file: tier, stage, start time, seconds and recorded values.'''
+
+    def __init__(self, path):
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', buffering=1)
+
+    def emit(self, span):
+
+        record = {'tier': span.tier, 'stage': span.stage, 'started_at': span.started_at, 'seconds': span.seconds, **span.values}
+        line = json.dumps(record, default=str)
+
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusSink(HistogramSink):
+    '''HistogramSink served in the Prometheus text format on http://host:port/metrics, from a background thread.'''
+
+    def __init__(self, port=9100, host='127.0.0.1', buckets=LATENCY_BUCKETS):
+
+        super().__init__(buckets)
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = sink.exposition().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+
+    def close(self):
+
+        self.server.shutdown()
+        self.server.server_close()
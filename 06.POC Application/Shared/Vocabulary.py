@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from Shared.DataStore import get_derived
+
+
+class Vocabulary:
+    '''Dense int32 codes for string IDs of one kind: News IDs, User IDs or category names.
+
+    Code i stands for values[i] and unknown values encode to -1. Recommenders work on codes
+    (cheap isin / setdiff1d / bincount on int32 arrays) and only decode at the output boundary.
+    '''
+
+    def __init__(self, values):
+
+        self.values = np.asarray(values, dtype=object)
+        self.index = pd.Index(self.values)
+
+    def __len__(self):
+
+        return len(self.values)
+
+    def encode(self, values):
+        '''int32 code of every value, -1 for values not in the vocabulary.'''
+        if isinstance(values, (set, frozenset)):
+            values = list(values)
+
+        return self.index.get_indexer(pd.Index(values, dtype=object)).astype(np.int32)
+
+    def decode(self, codes):
+        '''Values of the given codes, as a list.'''
+        return self.values[np.asarray(codes, dtype=np.int64)].tolist()
+
+    def mask(self, values):
+        '''Boolean array over the codes, True for the given values (unknown ones are ignored).'''
+        selected = np.zeros(len(self.values), dtype=bool)
+        codes = self.encode(values)
+        selected[codes[codes >= 0]] = True
+
+        return selected
+
+
+class NewsEncoding:
+    '''Codes of the articles of news.pkl and of their categories.
+
+    news: News IDs in news.pkl order, so an article's code is also its row in the news DataFrame
+      and in the news embedding matrix
+    categories: category names, in order of first appearance in news.pkl
+    category_codes: int32 category code of every article
+    '''
+
+    def __init__(self, news_ids, categories):
+
+        self.news = Vocabulary(news_ids)
+        self.categories = Vocabulary(pd.Series(categories, dtype=object).dropna().unique())
+        self.category_codes = self.categories.encode(categories)
+
+    def in_categories(self, categories):
+        '''Boolean array over the articles, True for those in the given category names.'''
+        # Articles without a category have code -1, which picks the trailing False
+        return np.append(self.categories.mask(categories), False)[self.category_codes]
+
+    def categories_of(self, news_codes):
+        '''Category names of the given articles (known codes only), without duplicates.'''
+        news_codes = np.asarray(news_codes, dtype=np.int64)
+        codes = np.unique(self.category_codes[news_codes[news_codes >= 0]])
+
+        return self.categories.decode(codes[codes >= 0])
+
+
+def get_news_encoding():
+    '''Shared news and category codes, rebuilt only when news.pkl changes.'''
+    def builder(news):
+        return NewsEncoding(news['News ID'].to_numpy(), news['Category'].to_numpy())
+
+    return get_derived('news_encoding', builder)
+
+
+def get_user_vocabulary():
+    '''Shared User ID codes, in order of first appearance in behaviors.pkl.'''
+    def builder(behaviors):
+        return Vocabulary(pd.unique(behaviors['User ID'].dropna().to_numpy(dtype=object)))
+
+    return get_derived('user_vocabulary', builder, depends_on=('behaviors',))
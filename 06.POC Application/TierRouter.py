@@ -0,0 +1,197 @@
+import time
+import threading
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from Shared import Tracing
+from Shared.Vocabulary import get_news_encoding
+from CandidatePipeline import get_candidate_pipeline
+from EnoughArticlesRead.FetchSimilarUsers import fetch_similar_users
+from EnoughArticlesRead.CollaborativeRecommender import collaborative_recommender
+from EnoughArticlesRead.CoReadRecommender import co_read_recommender
+from EnoughArticlesRead.CombinedEmbeddingsRecommender import combined_embeddings_recommender
+from FewArticlesRead.PureContentEmbeddingsRecommender import pure_content_embeddings_recommender
+from NoArticlesRead.PopularityCategoryRecommender import popularity_category_recommender
+
+# Tiers from most to least expensive; a request falls back down this list
+TIERS = ('EnoughArticlesRead', 'FewArticlesRead', 'NoArticlesRead')
+
+
+def choose_tier(read_articles, few_articles_threshold=1, enough_articles_threshold=5, session=None):
+    '''Tier for a history of this size: none read, a few read, or enough for collaborative filtering.
+
+    With a session (see ProfileStore), the history is the articles it read.
+    '''
+    n_read = session.count if session is not None else len(set(read_articles))
+
+    if n_read >= enough_articles_threshold:
+        return 'EnoughArticlesRead'
+    if n_read >= few_articles_threshold:
+        return 'FewArticlesRead'
+
+    return 'NoArticlesRead'
+
+
+def _enough_articles_read(read_articles, timestamp, categories, k, similar_user_k, session=None):
+
+    similar_users_timestamps = fetch_similar_users(read_articles, timestamp, k=similar_user_k, session=session)
+    recommended_article_ids = collaborative_recommender(read_articles, timestamp, similar_users_timestamps, session=session)
+
+    return combined_embeddings_recommender(read_articles, timestamp, recommended_article_ids, k=k, session=session)
+
+
+def _enough_articles_read_co_read(read_articles, timestamp, categories, k, similar_user_k, session=None):
+
+    recommended_article_ids = co_read_recommender(read_articles, timestamp, session=session)
+
+    return combined_embeddings_recommender(read_articles, timestamp, recommended_article_ids, k=k, session=session)
+
+
+def _enough_articles_read_pipeline(read_articles, timestamp, categories, k, similar_user_k, session=None):
+
+    return get_candidate_pipeline().recommend(read_articles, timestamp, k=k, categories=categories, session=session)
+
+
+def _few_articles_read(read_articles, timestamp, categories, k, similar_user_k, session=None):
+
+    return pure_content_embeddings_recommender(read_articles, timestamp, articles_k=k, session=session)
+
+
+def _no_articles_read(read_articles, timestamp, categories, k, similar_user_k, session=None):
+
+    if not categories:
+        # Without chosen categories, use those of the articles read (or all of them)
+        news_encoding = get_news_encoding()
+        read_codes = session.read_rows() if session is not None else news_encoding.news.encode(read_articles)
+        read_categories = news_encoding.categories_of(read_codes)
+        categories = read_categories or news_encoding.categories.values.tolist()
+
+    return popularity_category_recommender(timestamp, categories, read_articles, k=k, session=session)
+
+
+TIER_RECOMMENDERS = {
+    'EnoughArticlesRead': _enough_articles_read,
+    'FewArticlesRead': _few_articles_read,
+    'NoArticlesRead': _no_articles_read,
+}
+
+# Where the EnoughArticlesRead tier gets its collaborative candidates: a similar-user search over
+# every impression, the precomputed neighbours of the articles read (see CoReadIndex), or the
+# budgeted merge of several cheap generators (see CandidatePipeline)
+COLLABORATIVE_CANDIDATES = {
+    'similar-users': _enough_articles_read,
+    'co-read': _enough_articles_read_co_read,
+    'pipeline': _enough_articles_read_pipeline,
+}
+
+
+def _traced_tier(stage, recommender, arguments, deadline, slots):
+    # The tier has to be entered in the worker thread: context variables do not follow submit()
+    try:
+        # A stage that only starts after its deadline would be discarded anyway; it counts as a timeout
+        if time.perf_counter() >= deadline:
+            raise TimeoutError(f'{stage} started after its deadline')
+        with Tracing.tier(stage):
+            return recommender(*arguments)
+    finally:
+        slots.release()
+
+
+class TierRouter:
+    '''Routes each request to a tier by history size and keeps it within a latency budget.
+
+    A tier that overruns what is left of budget_ms, fails, or returns fewer than k articles is
+    topped up by the next cheaper tier (collaborative -> content -> popularity). Popularity is
+    the floor and always runs to completion. An overrunning stage is abandoned, not interrupted:
+    its worker thread finishes in the background and the result is discarded. At most max_workers
+    expensive stages are in flight; while they all are, new ones are skipped as 'busy' rather than
+    queued behind abandoned work.
+
+    Every result records which tiers served it, and served_counts tallies them per tier.
+    candidates picks the EnoughArticlesRead candidate source, 'similar-users', 'co-read' or 'pipeline'.
+    With a session (see ProfileStore), the history is the articles it read and read_articles are
+    ignored; its running profile saves recomputing theirs.
+    '''
+
+    def __init__(self, budget_ms=200, few_articles_threshold=1, enough_articles_threshold=5, similar_user_k=5, max_workers=8, candidates='similar-users'):
+
+        self.budget = budget_ms / 1000
+        self.few_articles_threshold = few_articles_threshold
+        self.enough_articles_threshold = enough_articles_threshold
+        self.similar_user_k = similar_user_k
+        self.recommenders = {**TIER_RECOMMENDERS, 'EnoughArticlesRead': COLLABORATIVE_CANDIDATES[candidates]}
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tier')
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self.served_counts = Counter()
+        self.fallback_counts = Counter()
+
+    def recommend(self, read_articles, timestamp, k=5, categories=(), session=None):
+        '''Returns {'news_ids', 'tier', 'served_by', 'fallbacks', 'elapsed_ms'} for one request.
+
+        tier is the tier chosen from the history size, served_by the tiers whose articles were
+        returned (in order) and fallbacks the (tier, reason) of every stage that fell short.
+        '''
+        started = time.perf_counter()
+        deadline = started + self.budget
+        timestamp = pd.to_datetime(timestamp)
+
+        tier = choose_tier(read_articles, self.few_articles_threshold, self.enough_articles_threshold, session)
+        news_ids, served_by, fallbacks = [], [], []
+
+        for stage in TIERS[TIERS.index(tier):]:
+            remaining = k - len(news_ids)
+            stage_ids, reason = self._run_stage(stage, read_articles, timestamp, categories, k, deadline, session)
+
+            new_ids = [news_id for news_id in stage_ids if news_id not in news_ids][:remaining]
+            if new_ids:
+                news_ids.extend(new_ids)
+                served_by.append(stage)
+
+            if reason is None and len(new_ids) < remaining:
+                reason = 'short'
+            if reason is None:
+                break
+            fallbacks.append((stage, reason))
+
+        with self._lock:
+            self.served_counts.update(served_by or ['none'])
+            self.fallback_counts.update(reason for _, reason in fallbacks)
+
+        return {
+            'news_ids': news_ids,
+            'tier': tier,
+            'served_by': served_by,
+            'fallbacks': fallbacks,
+            'elapsed_ms': (time.perf_counter() - started) * 1000,
+        }
+
+    def _run_stage(self, stage, read_articles, timestamp, categories, k, deadline, session=None):
+        # (news_ids, None) on success, ([], reason) when the stage has to be skipped
+        recommender = self.recommenders[stage]
+        arguments = (read_articles, timestamp, list(categories), k, self.similar_user_k, session)
+
+        if stage == TIERS[-1]:
+            with Tracing.tier(stage):
+                return recommender(*arguments), None
+
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return [], 'timeout'
+
+        if not self._slots.acquire(blocking=False):
+            return [], 'busy'
+
+        future = self._executor.submit(_traced_tier, stage, recommender, arguments, deadline, self._slots)
+        try:
+            return future.result(timeout=remaining), None
+        except TimeoutError:
+            return [], 'timeout'
+        except Exception:
+            return [], 'error'
+
+    def stats(self):
+
+        with self._lock:
+            return {'served': dict(self.served_counts), 'fallbacks': dict(self.fallback_counts)}
@@ -0,0 +1,47 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# The POC modules import each other from the application folder, as when it is run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shared import DataStore
+
+
+def _write_datasets(directory, n_articles=60, n_rows=80, dimensions=8, seed=0):
+
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2019-11-09')
+    news_ids = [f'N{i}' for i in range(n_articles)]
+    news = pd.DataFrame({
+        'News ID': news_ids,
+        'Category': rng.choice(['news', 'sports', 'tv'], n_articles),
+        'Title': [f't{i}' for i in range(n_articles)],
+        'Release Date': start + pd.to_timedelta(rng.integers(0, 7 * 24 * 3600, n_articles), unit='s'),
+        'Average Vector': list(rng.normal(size=(n_articles, dimensions))),
+    })
+
+    histories = [' '.join(rng.choice(news_ids, rng.integers(1, 10), replace=False)) for _ in range(n_rows)]
+    behaviors = pd.DataFrame({
+        'User ID': [f'U{user}' for user in rng.integers(0, 30, n_rows)],
+        'Timestamp': start + pd.to_timedelta(rng.integers(0, 7 * 24 * 3600, n_rows), unit='s'),
+        'History': histories,
+        'Impressions': histories,
+        'History & Impressions': histories,
+        'Average Vector': list(rng.normal(size=(n_rows, dimensions))),
+    })
+
+    os.makedirs(directory)
+    news.to_pickle(os.path.join(directory, 'news.pkl'))
+    behaviors.to_pickle(os.path.join(directory, 'behaviors.pkl'))
+
+
+@pytest.fixture
+def datasets(tmp_path, monkeypatch):
+    # A workspace laid out like the repository's, with fresh DataStore registries for it
+    _write_datasets(tmp_path / '01.Dataset' / 'Small' / 'Clean' / 'Train')
+    (tmp_path / 'app').mkdir()
+    monkeypatch.chdir(tmp_path / 'app')
+    monkeypatch.setattr(DataStore, '_datasets', {})
+    monkeypatch.setattr(DataStore, '_derived', {})
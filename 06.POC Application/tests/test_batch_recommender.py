@@ -0,0 +1,31 @@
+import numpy as np
+from BatchRecommender import score_collaborative
+from Shared.EmbeddingMatrix import get_news_embeddings
+from EnoughArticlesRead.HistoryIndex import get_history_index
+from EnoughArticlesRead.SimilarUsersIndex import get_user_index
+
+
+def test_collaborative_matches_full_catalog_scoring(datasets):
+
+    embeddings = get_news_embeddings()
+    rng = np.random.default_rng(2)
+    read_rows = [np.unique(rng.integers(0, len(embeddings.ids), n)) for n in (0, 1, 4, 9, 3)]
+
+    found = score_collaborative(read_rows, k=5, similar_user_k=3)
+
+    # Reference: every article scored, then masked down to the similar users' unread articles
+    user_index, history_index = get_user_index(), get_history_index()
+    for rows, news_ids in zip(read_rows, found):
+        profile = embeddings.profile(rows)
+        if profile is None:
+            assert news_ids == []
+            continue
+
+        candidates = history_index.lookup(user_index.query(profile, 3))
+        allowed = np.zeros(len(embeddings.ids), dtype=bool)
+        allowed[candidates[candidates < len(embeddings.ids)]] = True
+        allowed[rows] = False
+
+        scores = np.where(allowed, embeddings.vectors @ profile, -np.inf)
+        top = np.argsort(-scores, kind='stable')[:5]
+        assert news_ids == embeddings.ids[top[np.isfinite(scores[top])]].tolist()
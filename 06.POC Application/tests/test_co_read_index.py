@@ -0,0 +1,72 @@
+from collections import Counter
+from itertools import permutations
+import numpy as np
+import pandas as pd
+import pytest
+import EnoughArticlesRead.CoReadIndex as co_read
+
+
+def _frames(n_articles=12, n_rows=60, seed=0):
+
+    rng = np.random.default_rng(seed)
+    news = pd.DataFrame({'News ID': [f'N{i}' for i in range(n_articles)]})
+    behaviors = pd.DataFrame({
+        'User ID': [f'U{user}' for user in rng.integers(0, 15, n_rows)],
+        'History & Impressions': [' '.join(f'N{i}' for i in rng.integers(0, n_articles, rng.integers(0, 8))) for _ in range(n_rows)],
+    })
+    behaviors.loc[3, 'User ID'] = None
+
+    return news, behaviors
+
+
+def _brute_force(news, behaviors, weighting, top_n, min_count, max_session_length):
+    # The same index from plain Python counts of every pair of each user's latest distinct articles
+    sets = {}
+    for user_id, articles in zip(behaviors['User ID'], behaviors['History & Impressions']):
+        if pd.notna(user_id):
+            sets.setdefault(user_id, []).extend(articles.split())
+    sets = [list(dict.fromkeys(articles))[-max_session_length:] for articles in sets.values()]
+
+    rows = {news_id: row for row, news_id in enumerate(news['News ID'])}
+    readers = Counter(rows[article] for articles in sets for article in articles)
+    n_readers = sum(1 for articles in sets if articles)
+    pairs = Counter((rows[a], rows[b]) for articles in sets for a, b in permutations(articles, 2))
+
+    neighbours = {row: [] for row in range(len(news))}
+    for (left, right), count in pairs.items():
+        if count < min_count:
+            continue
+        weight = np.log(count * n_readers / (readers[left] * readers[right])) if weighting == 'pmi' else float(count)
+        if weighting == 'count' or weight > 0:
+            neighbours[left].append((-weight, right))
+
+    return {row: [right for _, right in sorted(pairs_)[:top_n]] for row, pairs_ in neighbours.items()}
+
+
+@pytest.mark.parametrize('pairs_per_block', [1 << 22, 7, 1])
+@pytest.mark.parametrize('weighting, top_n, min_count, max_session_length', [
+    ('pmi', 50, 2, 200),
+    ('count', 3, 1, 200),
+    ('count', 4, 2, 3),
+])
+def test_build_matches_brute_force_counts(monkeypatch, pairs_per_block, weighting, top_n, min_count, max_session_length):
+
+    monkeypatch.setattr(co_read, 'PAIRS_PER_BLOCK', pairs_per_block)
+    news, behaviors = _frames()
+
+    index = co_read.CoReadIndex.build(
+        news, behaviors, weighting=weighting, top_n=top_n, min_count=min_count, max_session_length=max_session_length
+    )
+    expected = _brute_force(news, behaviors, weighting, top_n, min_count, max_session_length)
+
+    for row in range(len(news)):
+        assert index.neighbours[index.offsets[row]:index.offsets[row + 1]].tolist() == expected[row]
+
+
+def test_get_co_read_index_does_not_build_in_process(monkeypatch):
+
+    monkeypatch.setattr(co_read, 'co_read_index_available', lambda: False)
+    monkeypatch.setattr(co_read, 'get_derived', lambda key, builder, depends_on: builder(*_frames()))
+
+    with pytest.raises(FileNotFoundError, match='python -m EnoughArticlesRead.CoReadIndex'):
+        co_read.get_co_read_index()
@@ -0,0 +1,56 @@
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from RecommendationService import MicroBatcher
+
+
+def test_short_results_fail_every_request():
+
+    batcher = MicroBatcher(lambda requests: requests[:-1], max_wait=0.05, timeout=5)
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(batcher.submit, i) for i in range(4)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match='results for'):
+                future.result()
+
+
+def test_worker_survives_a_failing_batch():
+
+    def score_batch(requests):
+        if 'fail' in requests:
+            raise KeyError('fail')
+        return [request * 2 for request in requests]
+
+    batcher = MicroBatcher(score_batch, max_wait=0, timeout=5)
+
+    with pytest.raises(KeyError):
+        batcher.submit('fail')
+    assert batcher.submit(21) == 42
+
+
+def test_submit_times_out_and_drops_the_queued_request():
+
+    started, release, scored = threading.Event(), threading.Event(), []
+
+    def score_batch(requests):
+        started.set()
+        release.wait()
+        scored.extend(requests)
+        return requests
+
+    batcher = MicroBatcher(score_batch, max_batch_size=1, max_wait=0, timeout=0.05)
+
+    # The first request holds the worker; the second times out while still queued
+    with ThreadPoolExecutor(1) as executor:
+        first = executor.submit(batcher.submit, 'first')
+        started.wait()
+        with pytest.raises(TimeoutError):
+            batcher.submit('second')
+        release.set()
+        with pytest.raises(TimeoutError):
+            first.result()
+
+    batcher.timeout = 5
+    assert batcher.submit('third') == 'third'
+    assert 'second' not in scored
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from CandidatePipeline import CandidatePipeline, default_quotas
+from Shared.EmbeddingMatrix import get_news_embeddings, top_k_indices
+from Shared.NewsAnnIndex import NewsAnnIndex, get_news_ann_index, news_ann_index_path
+
+
+def test_not_built_in_a_request(datasets):
+
+    assert 'embedding-ann' not in default_quotas()
+    with pytest.raises(FileNotFoundError, match='python -m Shared.NewsAnnIndex'):
+        get_news_ann_index()
+
+    # The default pipeline still answers, from the generators that need no prebuilt index
+    assert len(CandidatePipeline().recommend(['N1', 'N2'], '2019-11-20', k=3)) == 3
+
+
+def test_prebuilt_index_is_loaded_and_used(datasets):
+
+    embeddings = get_news_embeddings()
+    NewsAnnIndex.build(embeddings, n_lists=4, n_probe=4).save(news_ann_index_path())
+
+    assert 'embedding-ann' in default_quotas()
+
+    # Probing every list is an exact search
+    index = get_news_ann_index()
+    for query in embeddings.vectors[:10]:
+        expected = top_k_indices(embeddings.vectors @ query, 5)
+        assert np.array_equal(np.sort(index.query_rows(query, 5)), np.sort(expected))
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from Shared.Vocabulary import NewsEncoding
+from NoArticlesRead.PopularityCounter import PopularityCounter, PopularityWindow
+
+
+def _reads(rng, n, start, days):
+
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 24 * 3600, n), unit='s')
+    histories = [' '.join(f'N{i}' for i in rng.integers(0, 30, rng.integers(1, 5))) for _ in range(n)]
+
+    return timestamps, histories
+
+
+def test_sliding_window_matches_recount():
+
+    rng = np.random.default_rng(0)
+    news_ids = np.array([f'N{i}' for i in range(30)], dtype=object)
+    counter = PopularityCounter(NewsEncoding(news_ids, np.array(['news'] * 30, dtype=object)))
+    counter.add(*_reads(rng, 2000, '2019-11-01', 30))
+
+    window = PopularityWindow(counter.n_articles, length='14D')
+    ends = pd.Timestamp('2019-11-10') + pd.to_timedelta(np.r_[0, 1, 2, 2, 5, 4, 40, 41, 400, 390, 391, 395], unit='h')
+    for i, end in enumerate(ends):
+        if i == 9:
+            # Late reads in buckets the window already holds
+            counter.add(*_reads(rng, 50, '2019-11-20', 5))
+
+        assert np.array_equal(window.move(counter, end), counter.counts(end - pd.Timedelta('14D'), end))
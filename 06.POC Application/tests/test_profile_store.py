@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from Shared.EmbeddingMatrix import EmbeddingMatrix
+from Shared.ProfileStore import SMALL_CLICK_BATCH, ProfileStore
+
+
+def _embeddings(n_articles=40, dimensions=4):
+
+    vectors = np.random.default_rng(0).normal(size=(n_articles, dimensions))
+
+    return EmbeddingMatrix([f'N{i}' for i in range(n_articles)], vectors)
+
+
+@pytest.mark.parametrize('n_clicks', [3, SMALL_CLICK_BATCH + 5])
+def test_click_paths_agree_on_repeated_and_unknown_ids(n_clicks):
+
+    embeddings = _embeddings()
+    news_ids = [f'N{i % 7}' for i in range(n_clicks)] + ['unknown', 'N1']
+
+    session = ProfileStore(embeddings).click('user', news_ids)
+
+    assert session.read_rows().tolist() == embeddings.rows(news_ids).tolist()
+    assert session.count == len(set(news_ids) - {'unknown'})
+
+
+def test_duplicate_ids_are_rejected():
+
+    with pytest.raises(ValueError, match='more than one row'):
+        EmbeddingMatrix(['N1', 'N2', 'N1'], np.ones((3, 4)))
@@ -0,0 +1,36 @@
+from Shared import DataStore
+from Shared.ResultCache import ResultCache
+
+
+def test_key_depends_on_version_not_on_read_order():
+
+    cache = ResultCache(depends_on=())
+
+    assert cache.key('few', 1, ['N1', 'N2', 'N1'], '2019-11-14 10:05', 5) == cache.key('few', 1, ['N2', 'N1'], '2019-11-14 10:55', 5)
+    assert cache.key('few', 1, ['N1'], '2019-11-14', 5) != cache.key('few', 2, ['N1'], '2019-11-14', 5)
+
+
+def test_new_version_recomputes():
+
+    cache = ResultCache(depends_on=())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ['N3']
+
+    for version in (1, 1, 2, 2):
+        assert cache.get_or_compute(compute, 'few', version, ['N1'], '2019-11-14', 5) == ['N3']
+
+    assert len(calls) == 2
+
+
+def test_registering_a_structure_bumps_the_generation(monkeypatch):
+
+    monkeypatch.setattr(DataStore, '_derived', {})
+    monkeypatch.setattr(DataStore, 'current_versions', lambda depends_on=('news',): ())
+    generation = DataStore.derived_generation()
+
+    DataStore.put_derived('retrained_index', object(), depends_on=())
+
+    assert DataStore.derived_generation() == generation + 1
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from Shared.ProfileStore import ProfileStore
+from Shared.EmbeddingMatrix import get_news_embeddings
+from EnoughArticlesRead.FetchSimilarUsers import fetch_similar_users
+from EnoughArticlesRead.CollaborativeRecommender import collaborative_recommender
+from FewArticlesRead.PureContentEmbeddingsRecommender import pure_content_embeddings_recommender
+
+
+def _histories(n=20, seed=1):
+
+    rng = np.random.default_rng(seed)
+    news_ids = get_news_embeddings().ids
+
+    return [rng.choice(news_ids, rng.integers(1, 12), replace=False).tolist() + ['unknown'] for _ in range(n)]
+
+
+def _session(store, session_id, read_articles, timestamp):
+    # Clicks arrive a few at a time, some of them repeated
+    for start in range(0, len(read_articles), 3):
+        store.click(session_id, read_articles[start:start + 3] + read_articles[:1], timestamp)
+
+    return store.session(session_id)
+
+
+def test_pure_content_matches_stateless(datasets):
+
+    store = ProfileStore(get_news_embeddings())
+    timestamp = pd.Timestamp('2019-11-14')
+
+    for i, read_articles in enumerate(_histories()):
+        session = _session(store, i, read_articles, timestamp)
+
+        expected = pure_content_embeddings_recommender(read_articles, timestamp, articles_k=5)
+        assert pure_content_embeddings_recommender([], timestamp, articles_k=5, session=session) == expected
+
+
+def test_similar_users_match_stateless(datasets):
+
+    store = ProfileStore(get_news_embeddings())
+    timestamp = pd.Timestamp('2019-11-14')
+
+    for i, read_articles in enumerate(_histories()):
+        session = _session(store, i, read_articles, timestamp)
+
+        expected = fetch_similar_users(read_articles, timestamp, k=3)
+        similar_users_timestamps = fetch_similar_users([], timestamp, k=3, session=session)
+        assert similar_users_timestamps == expected
+
+        assert collaborative_recommender([], timestamp, similar_users_timestamps, session=session) == \
+            collaborative_recommender(read_articles, timestamp, expected)
@@ -0,0 +1,39 @@
+import time
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from TierRouter import TierRouter, _traced_tier
+
+
+def _tier(*arguments):
+
+    return ['N1']
+
+
+def test_stage_started_after_its_deadline_is_a_timeout():
+
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+
+    with pytest.raises(TimeoutError):
+        _traced_tier('FewArticlesRead', _tier, (), time.perf_counter() - 1, slots)
+
+    # The slot is released all the same
+    assert slots.acquire(blocking=False)
+
+
+def test_late_stage_is_counted_as_a_timeout(monkeypatch):
+
+    router = TierRouter(budget_ms=1000)
+    router.recommenders = {'EnoughArticlesRead': _tier, 'FewArticlesRead': _tier, 'NoArticlesRead': _tier}
+
+    # A stage whose worker only starts once the deadline has passed
+    def late_submit(function, stage, recommender, arguments, deadline, slots):
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(function, stage, recommender, arguments, time.perf_counter() - 1, slots)
+
+    monkeypatch.setattr(router._executor, 'submit', late_submit)
+    result = router.recommend(['N2'], '2019-11-14', k=1)
+
+    assert result['fallbacks'] == [('FewArticlesRead', 'timeout')]
+    assert router.stats()['fallbacks'] == {'timeout': 1}
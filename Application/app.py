@@ -1,5 +1,7 @@
+import os
+import threading
 import streamlit as st
-import openai
+from recommendation_client import PROFILE_CATEGORIES, RECOMMENDATION_TABS, profile_recommendations, service_is_up
 
 # =====================================
 # SET UP OPENAI API (via st.secrets)
@@ -7,8 +9,13 @@ import openai
 if "OPENAI_API_KEY" not in st.secrets:
     st.error("Please add your OpenAI API key to the Streamlit advanced settings (st.secrets).")
     st.stop()
-else:
+
+@st.cache_resource(show_spinner=False)
+def get_openai():
+    # openai is slow to import, so it is only loaded (once per process) when the chatbot first needs it
+    import openai
     openai.api_key = st.secrets["OPENAI_API_KEY"]
+    return openai
 
 # =====================================
 # Initialize Chatbot Session Variables
@@ -59,6 +66,46 @@ dummy_recommendations = {
     ],
 }
 
+@st.cache_data(ttl=600, show_spinner=False)
+def service_recommendations(tab: str, profile: str, k: int):
+    # Cached per (tab, profile, k) for every session, so reruns don't call the service again;
+    # OSError is raised (and nothing cached) when the service is unreachable
+    return profile_recommendations(tab, profile, k)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def service_available():
+    # Checked at most every 30 seconds, so reruns without a service don't each wait for its timeout
+    return service_is_up()
+
+def get_recommendations(tab: str, profile: str, k: int):
+    # Real recommendations come from the recommendation service; without it, show the dummy data
+    if service_available():
+        try:
+            return service_recommendations(tab, profile, k)
+        except OSError:
+            service_available.clear()
+    return dummy_recommendations.get(profile, [])[:k]
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up(k: int = 5):
+    # Once per server process: fill the recommendation cache for every profile and tab in the background,
+    # so the first visitors don't wait on the service. Off unless SOKONEWS_WARM_UP=1.
+    def warm_up():
+        if service_available():
+            for profile in PROFILE_CATEGORIES:
+                for tab in RECOMMENDATION_TABS:
+                    try:
+                        service_recommendations(tab, profile, k)
+                    except OSError:
+                        return
+
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+if os.environ.get("SOKONEWS_WARM_UP") == "1":
+    start_warm_up()
+
 def map_input_to_profile(user_input: str):
     text = user_input.lower()
     if "tech" in text or "computer" in text:
@@ -261,7 +308,7 @@ with tabs[0]:
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     st.markdown('<h2 class="section-header">Collaborative Filtering ⚙️</h2>', unsafe_allow_html=True)
     st.markdown('<p class="description-text">This method analyzes the behavior of users with similar interests to recommend relevant news articles.</p>', unsafe_allow_html=True)
-    recs = dummy_recommendations.get(selected_profile, [])[:num_recommendations]
+    recs = get_recommendations("Collaborative Filtering", selected_profile, num_recommendations)
     if recs:
         for title, summary in recs:
             st.markdown(f"""
@@ -279,7 +326,7 @@ with tabs[1]:
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     st.markdown('<h2 class="section-header">Content-Based 📄</h2>', unsafe_allow_html=True)
     st.markdown('<p class="description-text">This method recommends news based on the content of articles you have previously read, identifying patterns in your preferences.</p>', unsafe_allow_html=True)
-    recs = dummy_recommendations.get(selected_profile, [])[:num_recommendations]
+    recs = get_recommendations("Content-Based", selected_profile, num_recommendations)
     if recs:
         for title, summary in recs:
             st.markdown(f"""
@@ -297,7 +344,7 @@ with tabs[2]:
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     st.markdown('<h2 class="section-header">Hybrid 🔀</h2>', unsafe_allow_html=True)
     st.markdown('<p class="description-text">This method combines collaborative filtering and content-based approaches to offer more precise recommendations.</p>', unsafe_allow_html=True)
-    recs = dummy_recommendations.get(selected_profile, [])[:num_recommendations]
+    recs = get_recommendations("Hybrid", selected_profile, num_recommendations)
     if recs:
         for title, summary in recs:
             st.markdown(f"""
@@ -327,6 +374,8 @@ with tabs[3]:
     else:
         user_input = st.chat_input("Type your message here and press Enter...")
         if user_input:
+            get_openai()
+
             # Append user message
             st.session_state["chat_history"].append({"role": "user", "content": user_input})
 
@@ -0,0 +1,65 @@
+import os
+import json
+import urllib.request
+
+# Where 06.POC Application/RecommendationService.py is listening
+SERVICE_URL = os.environ.get("RECOMMENDATION_SERVICE_URL", "http://127.0.0.1:8500")
+
+# MIND categories behind each profile of the app
+PROFILE_CATEGORIES = {
+    "Tech Enthusiast 💻": ["news", "finance"],
+    "Sports Fan ⚽": ["sports"],
+    "Political Enthusiast 🏛️": ["news"],
+    "Movie Buff 🎬": ["movies", "tv", "entertainment"],
+}
+
+# Tabs of the app served by the recommendation service
+RECOMMENDATION_TABS = ("Collaborative Filtering", "Content-Based", "Hybrid")
+
+
+def service_is_up(timeout=0.5):
+    """
+    Whether the recommendation service answers its health check within timeout seconds.
+    """
+    try:
+        with urllib.request.urlopen(f"{SERVICE_URL}/health", timeout=timeout) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def fetch_recommendations(tier, read_articles=(), categories=(), k=5, timestamp=None, timeout=2.0):
+    """
+    Asks the recommendation service for k articles of one tier.
+
+    tier: 'no-articles-read', 'few-articles-read' or 'enough-articles-read'
+    Returns the list of {news_id, title, category} articles; raises OSError if the service is unreachable.
+    """
+    payload = {"read_articles": list(read_articles), "categories": list(categories), "k": k, "timestamp": timestamp}
+    request = urllib.request.Request(
+        f"{SERVICE_URL}/recommend/{tier}",
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)["articles"]
+
+
+def profile_recommendations(tab, profile, k=5):
+    """
+    Recommendations for one tab of the app, as (title, summary) pairs.
+
+    The profile's most read articles in its categories ('Collaborative Filtering' tab) stand in for
+    a reading history, which the 'Content-Based' and 'Hybrid' tabs then build on.
+    """
+    categories = PROFILE_CATEGORIES.get(profile, [])
+    popular = fetch_recommendations("no-articles-read", categories=categories, k=k)
+
+    if tab == "Collaborative Filtering":
+        articles = popular
+    else:
+        tier = "few-articles-read" if tab == "Content-Based" else "enough-articles-read"
+        articles = fetch_recommendations(tier, read_articles=[article["news_id"] for article in popular], k=k)
+
+    return [(article["title"], article["category"].title()) for article in articles]
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Widget interactions replayed as reruns: (selectbox value, slider value)
+RERUNS = [
+    ("Sports Fan ⚽", 5),
+    ("Movie Buff 🎬", 5),
+    ("Tech Enthusiast 💻", 10),
+    ("Sports Fan ⚽", 10),
+    ("Tech Enthusiast 💻", 5),
+]
+
+
+def measure_startup(n_reruns=20):
+    """
+    Times the app in the current process, which should be fresh: importing streamlit, the first
+    script run (first paint) and reruns after widget interactions, all through streamlit's AppTest.
+
+    Returns:
+      dict with import_ms, first_run_ms and p50/p90/max_rerun_ms.
+    """
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+
+    app = AppTest.from_file(APP_PATH, default_timeout=30)
+    app.secrets["OPENAI_API_KEY"] = "benchmark"
+    app.run()
+    first_run = time.perf_counter()
+    if app.exception:
+        raise RuntimeError(f"The app failed on its first run: {app.exception[0].message}")
+
+    reruns = []
+    for i in range(n_reruns):
+        profile, k = RERUNS[i % len(RERUNS)]
+        rerun_started = time.perf_counter()
+        app.selectbox[0].set_value(profile)
+        app.slider[0].set_value(k)
+        app.run()
+        reruns.append((time.perf_counter() - rerun_started) * 1000)
+
+    return {
+        "import_ms": (imported - started) * 1000,
+        "first_run_ms": (first_run - imported) * 1000,
+        "p50_rerun_ms": statistics.median(reruns),
+        "p90_rerun_ms": sorted(reruns)[int(0.9 * (len(reruns) - 1))],
+        "max_rerun_ms": max(reruns),
+    }
+
+
+def run_benchmark(n_processes=3, n_reruns=20):
+    """
+    measure_startup in n_processes fresh interpreters, so every first run is a cold start.
+
+    Returns:
+      The list of measure_startup results, one per process.
+    """
+    results = []
+    for _ in range(n_processes):
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure", "--reruns", str(n_reruns)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the cold start and rerun time of the Streamlit app.")
+    parser.add_argument("--processes", type=int, default=3, help="Fresh processes, one cold start each")
+    parser.add_argument("--reruns", type=int, default=20, help="Widget interactions timed per process")
+    parser.add_argument("--first-paint-ms", type=float, default=1000, help="Fail if the median first run is slower")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_startup(args.reruns)))
+        sys.exit(0)
+
+    results = run_benchmark(args.processes, args.reruns)
+    for metric in results[0]:
+        values = [result[metric] for result in results]
+        print(f"{metric:<14} median {statistics.median(values):8.1f} ms  (min {min(values):.1f}, max {max(values):.1f})")
+
+    first_paint = statistics.median(result["first_run_ms"] for result in results)
+    if first_paint > args.first_paint_ms:
+        print(f"First paint {first_paint:.0f} ms is over the {args.first_paint_ms:.0f} ms target")
+        sys.exit(1)
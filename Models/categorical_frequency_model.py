@@ -1,19 +1,155 @@
+import numpy as np
 import pandas as pd
 import os
 from datetime import timedelta
 
+RECOMMENDATION_COLUMNS = ["news_id", "category", "title", "url"]
+
+
+def _mount_drive_if_needed():
+    # Attempt to auto-mount Drive if in Colab
+    try:
+        import google.colab
+        from google.colab import drive
+        if not os.path.exists("/content/drive"):
+            drive.mount("/content/drive", force_remount=True)
+    except ImportError:
+        pass  # Not in Colab, skip
+
+
+def _encode_reads(behav, news_ids):
+    # Flat int codes of every (user, read article) pair, in history order. Articles are coded by their
+    # catalog position; IDs missing from the catalog get codes after it, so they still count as read.
+    user_codes, users = pd.factorize(behav["user_id"], use_na_sentinel=False)
+
+    has_history = behav["history"].notna().to_numpy()
+    tokens = behav["history"][has_history].astype(str).str.split()
+    lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    flat = np.concatenate(tokens.to_numpy()).astype(object) if lengths.sum() else np.empty(0, dtype=object)
+
+    read_users = np.repeat(user_codes[has_history], lengths)
+    read_news = news_ids.get_indexer(flat)
+    unknown = read_news < 0
+    read_news[unknown] = len(news_ids) + pd.factorize(flat[unknown])[0]
+
+    return users, read_users, read_news
+
+
+def build_user_aggregates(df_behav, df_news, use_recency=True, recency_weeks=2):
+    """
+    Precomputes everything frequency_categorical_recommender needs per user, in one pass over behaviors.
+
+    Users, articles and categories are handled as dense integer codes throughout; names are only
+    decoded for the stores' keys and top categories.
+
+    Parameters:
+      df_behav (DataFrame): Behaviors with columns [user_id, time, history].
+      df_news (DataFrame): News with columns [news_id, category, title, url].
+      use_recency (bool): Whether to limit each user's history to their last `recency_weeks`.
+      recency_weeks (int): Number of weeks to consider if use_recency=True.
+
+    Returns:
+      (user_store, category_store)
+        - user_store: dict user_id -> {"top_category", "category_counts", "read_codes"}.
+          top_category is None when the user has no history or none of it maps to a category.
+          read_codes is a sorted int32 array of the read articles' codes: their position in df_news,
+          or a code past the end of it for IDs missing from df_news.
+        - category_store: dict category -> DataFrame of that category's articles
+          [news_id, category, title, url], in catalog order and indexed by article code.
+    """
+    behav = df_behav[["user_id", "time", "history"]].copy()
+    behav["time"] = pd.to_datetime(behav["time"], errors="coerce")
+
+    # Keep each user's rows within recency_weeks of their latest interaction (all rows if no valid time)
+    if use_recency:
+        latest_time = behav.groupby("user_id")["time"].transform("max")
+        threshold = latest_time - timedelta(weeks=recency_weeks)
+        behav = behav[latest_time.isna() | (behav["time"] >= threshold)]
+
+    news = df_news.reset_index(drop=True)
+    news_ids = pd.Index(news["news_id"])
+    category_codes, categories = pd.factorize(news["category"])
+
+    # One (user, article) code pair per read, in history order
+    users, read_users, read_news = _encode_reads(behav, news_ids)
+
+    # Distinct articles per user, CSR style
+    n_codes = int(read_news.max(initial=len(news_ids) - 1)) + 1
+    pairs = np.unique(read_users.astype(np.int64) * n_codes + read_news)
+    pair_users, pair_news = np.divmod(pairs, n_codes)
+    read_offsets = np.concatenate(([0], np.cumsum(np.bincount(pair_users, minlength=len(users)))))
+
+    # Category histogram per user; ties go to the category read first, as value_counts().idxmax() does
+    read_categories = np.append(category_codes, -1)[np.minimum(read_news, len(news_ids))]
+    known = read_categories >= 0
+    positions = np.flatnonzero(known)
+    pairs, first_reads, counts = np.unique(
+        read_users[known].astype(np.int64) * len(categories) + read_categories[known],
+        return_index=True, return_counts=True
+    )
+    histogram_users, histogram_categories = np.divmod(pairs, max(len(categories), 1))
+    order = np.lexsort((positions[first_reads], -counts, histogram_users))
+    histogram_offsets = np.concatenate(([0], np.cumsum(np.bincount(histogram_users, minlength=len(users)))))
+
+    user_store = {}
+    for user, user_id in enumerate(users):
+        user_histogram = order[histogram_offsets[user]:histogram_offsets[user + 1]]
+        category_counts = {categories[histogram_categories[i]]: int(counts[i]) for i in user_histogram}
+
+        user_store[user_id] = {
+            "top_category": next(iter(category_counts), None),
+            "category_counts": category_counts,
+            "read_codes": pair_news[read_offsets[user]:read_offsets[user + 1]].astype(np.int32),
+        }
+
+    # Candidate articles per category, presorted in catalog order
+    category_store = {
+        category: articles[RECOMMENDATION_COLUMNS]
+        for category, articles in news.groupby("category", sort=False)
+    }
+
+    return user_store, category_store
+
+
+def precompute_user_aggregates(
+    output_path,
+    behaviors_path="/content/drive/MyDrive/BigData/processed_behaviours_train.parquet",
+    news_path="/content/drive/MyDrive/BigData/processed_news_train.parquet",
+    use_recency=True,
+    recency_weeks=2
+):
+    """
+    Offline job: builds the user and category stores from the parquet files and pickles them to output_path.
+    Load them back with pd.read_pickle(output_path) and pass them to frequency_categorical_recommender.
+    """
+    _mount_drive_if_needed()
+
+    stores = build_user_aggregates(
+        pd.read_parquet(behaviors_path), pd.read_parquet(news_path),
+        use_recency=use_recency, recency_weeks=recency_weeks
+    )
+    pd.to_pickle(stores, output_path)
+
+    return stores
+
+
 def frequency_categorical_recommender(
     user_id,
     n_recommendations=5,
     behaviors_path="/content/drive/MyDrive/BigData/processed_behaviours_train.parquet",
     news_path="/content/drive/MyDrive/BigData/processed_news_train.parquet",
     use_recency=True,
-    recency_weeks=2
+    recency_weeks=2,
+    user_store=None,
+    category_store=None
 ):
     """
-    For a given user, loads behaviors & news data from the specified parquet files in Google Drive,
-    determines the user's most frequently read category, and returns top n articles in that category
-    that the user hasn't read yet.
+    For a given user, determines the user's most frequently read category and returns top n articles
+    in that category that the user hasn't read yet.
+
+    With precomputed stores (see build_user_aggregates / precompute_user_aggregates) a call is two
+    dictionary lookups plus a filtered slice. Without them, behaviors & news are loaded from the
+    specified parquet files in Google Drive and aggregated for this user only.
 
     Parameters:
       user_id (str): The user identifier from the behaviors DataFrame.
@@ -22,6 +158,8 @@ def frequency_categorical_recommender(
       news_path (str): Path to the news .parquet in Google Drive.
       use_recency (bool): Whether to limit behavior data to last `recency_weeks`.
       recency_weeks (int): Number of weeks to consider if use_recency=True.
+      user_store (dict): Per-user aggregates from build_user_aggregates; used instead of the parquet files.
+      category_store (dict): Per-category candidates from build_user_aggregates.
 
     Returns:
       (recommendations_df, explanation_str)
@@ -30,52 +168,33 @@ def frequency_categorical_recommender(
         - If no recommendations found, returns (None, explanation).
     """
 
-    # Attempt to auto-mount Drive if in Colab
-    try:
-        import google.colab
-        from google.colab import drive
-        if not os.path.exists("/content/drive"):
-            drive.mount("/content/drive", force_remount=True)
-    except ImportError:
-        pass  # Not in Colab, skip
+    if user_store is None or category_store is None:
+        _mount_drive_if_needed()
 
-    # 1) Load the parquet files
-    df_behav = pd.read_parquet(behaviors_path)
-    df_news = pd.read_parquet(news_path)
+        # 1) Load the parquet files and aggregate the specified user only
+        df_behav = pd.read_parquet(behaviors_path)
+        df_news = pd.read_parquet(news_path)
+        user_store, category_store = build_user_aggregates(
+            df_behav[df_behav["user_id"] == user_id], df_news,
+            use_recency=use_recency, recency_weeks=recency_weeks
+        )
 
-    # 2) Filter behaviors for the specified user
-    user_behav = df_behav[df_behav["user_id"] == user_id]
-    if user_behav.empty:
+    # 2) Look up the specified user
+    user_aggregates = user_store.get(user_id)
+    if user_aggregates is None:
         return None, f"No behavior records found for user {user_id}"
 
-    # 3) Optional recency filtering (last 2 weeks by default)
-    user_behav["time"] = pd.to_datetime(user_behav["time"], errors="coerce")
-    latest_time = user_behav["time"].max()
-    if pd.isnull(latest_time):
-        recent_behav = user_behav
-    else:
-        threshold = latest_time - timedelta(weeks=recency_weeks)
-        recent_behav = user_behav if not use_recency else user_behav[user_behav["time"] >= threshold]
-
-    # 4) Parse user's reading history (space-separated news IDs)
-    history_series = recent_behav["history"].dropna().astype(str)
-    user_history_list = " ".join(history_series).split()
-    if not user_history_list:
+    if len(user_aggregates["read_codes"]) == 0:
         return None, f"User {user_id} has no reading history in the last {recency_weeks} weeks."
 
-    # 5) Determine top category
-    # Map from news_id -> category
-    news_cat_map = df_news.set_index("news_id")["category"]
-    user_categories = pd.Series(user_history_list).map(news_cat_map).dropna()
-    if user_categories.empty:
+    # 3) Top category, precomputed from the user's reading history
+    top_category = user_aggregates["top_category"]
+    if top_category is None:
         return None, "No category information found for the user's history."
 
-    top_category = user_categories.value_counts().idxmax()
-
-    # 6) Get candidate articles in that category, excluding read IDs
-    read_ids = set(user_history_list)
-    candidates = df_news[df_news["category"] == top_category].copy()
-    candidates = candidates[~candidates["news_id"].isin(read_ids)]
+    # 4) Get candidate articles in that category, excluding read IDs
+    candidates = category_store.get(top_category, pd.DataFrame(columns=RECOMMENDATION_COLUMNS))
+    candidates = candidates[~np.isin(candidates.index.to_numpy(), user_aggregates["read_codes"])]
 
     # Return first n_recommendations
     recommendations = candidates.head(n_recommendations)
@@ -90,4 +209,4 @@ def frequency_categorical_recommender(
         f"Based on your reading history, you appear to favor **{top_category}** news. "
         f"Here are {len(recommendations)} articles you haven't read yet:"
     )
-    return recommendations[["news_id", "category", "title", "url"]], explanation
+    return recommendations[RECOMMENDATION_COLUMNS], explanation
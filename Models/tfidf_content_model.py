@@ -0,0 +1,228 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Fitted vocabulary, idf weights and item matrix, as written by fit_tfidf_index
+FEATURES_FILE = "tfidf_features.npz"
+TERMS_FILE = "tfidf_terms.npy"
+IDF_FILE = "tfidf_idf.npy"
+METADATA_FILE = "tfidf_metadata.json"
+
+# Caps the vocabulary, and with it the width of the item matrix and of every user profile
+DEFAULT_MAX_FEATURES = 50_000
+
+_loaded_indexes = {}
+
+
+def create_tfidf_features(news_df, max_features=DEFAULT_MAX_FEATURES, tokenizer=None):
+    """
+    Fits the TF-IDF vectorizer of the content models on news_df['Content'].
+
+    Same settings as in the model notebooks, plus a vocabulary cap (the max_features most frequent
+    terms) and float32 weights. tokenizer defaults to nltk's word_tokenize.
+
+    Returns:
+      (vectorizer, features): the fitted TfidfVectorizer and the L2-normalized CSR item matrix.
+    """
+    if tokenizer is None:
+        from nltk.tokenize import word_tokenize
+        tokenizer = word_tokenize
+
+    tfidf = TfidfVectorizer(strip_accents=None,
+                            lowercase=True,
+                            tokenizer=tokenizer,
+                            token_pattern=None,
+                            use_idf=True,
+                            norm="l2",
+                            smooth_idf=True,
+                            stop_words="english",
+                            max_df=0.5,
+                            max_features=max_features,
+                            sublinear_tf=True,
+                            dtype=np.float32)
+
+    features = tfidf.fit_transform(news_df["Content"].fillna(""))
+
+    return tfidf, features.tocsr()
+
+
+class TfidfIndex:
+    """
+    TF-IDF item matrix with the article order it was fitted on.
+
+    news_ids: News IDs, one per row of features
+    features: (n_articles, n_terms) CSR matrix of L2-normalized rows
+    release_dates: datetime64 release date per row (NaT if unknown), for filtering future articles
+    """
+
+    def __init__(self, news_ids, features, release_dates=None, terms=None, idf=None):
+
+        self.news_ids = np.asarray(news_ids, dtype=object)
+        self.index = pd.Index(self.news_ids)
+        self.features = features
+        self.release_dates = release_dates
+        self.terms = terms
+        self.idf = idf
+
+    def rows(self, news_ids):
+        """Unique rows of the given News IDs, skipping unknown ones."""
+        positions = self.index.get_indexer(pd.Index(news_ids).unique())
+
+        return np.unique(positions[positions >= 0])
+
+    def profiles(self, read_rows):
+        """
+        Sparse user profiles: for each list of read rows, the mean of those rows of the item matrix.
+
+        All profiles are built with one sparse product of a (users x articles) read indicator matrix
+        and the item matrix, so a profile never gets wider than the terms its articles use.
+        """
+        lengths = np.array([len(rows) for rows in read_rows], dtype=np.int64)
+        indicator = sp.csr_matrix(
+            (np.repeat(1 / np.maximum(lengths, 1), lengths).astype(np.float32),
+             np.concatenate(read_rows).astype(np.int64) if lengths.sum() else np.empty(0, dtype=np.int64),
+             np.concatenate(([0], np.cumsum(lengths)))),
+            shape=(len(read_rows), self.features.shape[0])
+        )
+
+        return indicator @ self.features
+
+    def scores(self, profiles, rows=None):
+        """
+        Dense (users x articles) cosine similarity of sparse profiles with every article, in one sparse
+        product; with rows, only with the articles at those rows (one column per row).
+        """
+        norms = np.sqrt(np.asarray(profiles.multiply(profiles).sum(axis=1)).ravel())
+        features = self.features if rows is None else self.features[rows]
+        scores = (profiles @ features.T).toarray()
+
+        return scores / np.where(norms > 0, norms, 1)[:, None]
+
+
+def fit_tfidf_index(news_df, output_dir, max_features=DEFAULT_MAX_FEATURES, tokenizer=None):
+    """
+    Offline job: fits TF-IDF once and saves the item matrix (save_npz), vocabulary and idf to output_dir.
+    Load it back with load_tfidf_index(output_dir) instead of refitting in every recommendation call.
+    """
+    vectorizer, features = create_tfidf_features(news_df, max_features=max_features, tokenizer=tokenizer)
+    os.makedirs(output_dir, exist_ok=True)
+
+    sp.save_npz(os.path.join(output_dir, FEATURES_FILE), features)
+    np.save(os.path.join(output_dir, TERMS_FILE), vectorizer.get_feature_names_out().astype(str))
+    np.save(os.path.join(output_dir, IDF_FILE), vectorizer.idf_.astype(np.float32))
+
+    metadata = {
+        "news_ids": news_df["News ID"].astype(str).tolist(),
+        "release_dates": news_df["Release Date"].astype(str).tolist() if "Release Date" in news_df else None,
+        "max_features": max_features,
+    }
+    with open(os.path.join(output_dir, METADATA_FILE), "w") as file:
+        json.dump(metadata, file)
+
+    return TfidfIndex(news_df["News ID"], features, _release_dates(metadata), vectorizer.get_feature_names_out(), vectorizer.idf_)
+
+
+def _release_dates(metadata):
+
+    if metadata["release_dates"] is None:
+        return None
+
+    return pd.to_datetime(pd.Series(metadata["release_dates"]), errors="coerce").to_numpy(dtype="datetime64[ns]")
+
+
+def load_tfidf_index(directory):
+    """
+    Loads a saved TfidfIndex; loaded indexes are cached per directory and reloaded when the
+    saved item matrix changes.
+    """
+    features_path = os.path.join(directory, FEATURES_FILE)
+    stat = os.stat(features_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _loaded_indexes.get(directory)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(os.path.join(directory, METADATA_FILE)) as file:
+        metadata = json.load(file)
+
+    index = TfidfIndex(
+        metadata["news_ids"],
+        sp.load_npz(features_path).tocsr(),
+        _release_dates(metadata),
+        np.load(os.path.join(directory, TERMS_FILE)),
+        np.load(os.path.join(directory, IDF_FILE))
+    )
+    _loaded_indexes[directory] = (version, index)
+
+    return index
+
+
+def _top_k(scores, allowed, k):
+    # Positions of the k best allowed scores, best first
+    candidates = np.flatnonzero(allowed)
+    k = min(k, len(candidates))
+    if k == 0:
+        return candidates
+
+    top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def recommendations_pure_content_tfidf(read_article_ids_list, index, timestamps=None, articles_k=5, batch_size=256):
+    """
+    Pure content TF-IDF recommendations for several users at once.
+
+    Parameters:
+      read_article_ids_list (list): For each user, the News IDs in their history.
+      index (TfidfIndex): Loaded with load_tfidf_index.
+      timestamps (list): Optional interaction time per user; articles released later are excluded.
+      articles_k (int): Number of articles to recommend.
+      batch_size (int): Users scored per sparse product, which bounds the dense score matrix.
+
+    Returns:
+      list with, per user, [(news_id, similarity)] best first (empty if no read article is known).
+    """
+    read_rows = [index.rows(read_article_ids) for read_article_ids in read_article_ids_list]
+
+    recommendations = []
+    for start in range(0, len(read_rows), batch_size):
+        batch_rows = read_rows[start:start + batch_size]
+        scores = index.scores(index.profiles(batch_rows))
+
+        for i, rows in enumerate(batch_rows):
+            if len(rows) == 0:
+                recommendations.append([])
+                continue
+
+            allowed = np.ones(len(index.news_ids), dtype=bool)
+            allowed[rows] = False
+            if timestamps is not None and index.release_dates is not None:
+                allowed &= ~(index.release_dates > np.datetime64(pd.Timestamp(timestamps[start + i])))
+
+            top = _top_k(scores[i], allowed, articles_k)
+            recommendations.append([(news_id, float(score)) for news_id, score in zip(index.news_ids[top], scores[i, top])])
+
+    return recommendations
+
+
+def recommend_articles_content_tfidf(read_article_ids, recommended_articles_ids, index, k=5):
+    """
+    Re-ranks the collaborative candidates recommended_articles_ids by TF-IDF similarity with the
+    user's read articles. Returns [(news_id, similarity)] best first.
+    """
+    read_rows = index.rows(read_article_ids)
+    if len(read_rows) == 0:
+        return []
+
+    # Only the candidates are scored, so the cost follows their number rather than the catalog size
+    candidate_rows = index.rows(recommended_articles_ids)
+    scores = index.scores(index.profiles([read_rows]), candidate_rows)[0]
+
+    top = _top_k(scores, np.ones(len(candidate_rows), dtype=bool), k)
+
+    return [(news_id, float(score)) for news_id, score in zip(index.news_ids[candidate_rows[top]], scores[top])]
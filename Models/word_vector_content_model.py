@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# One versioned matrix file per embedding model, e.g. doc_vectors_glove.npz
+DOCUMENT_VECTORS_FILE = "doc_vectors_{name}.npz"
+
+
+def load_glove_model(model_path):
+    """Loads a GloVe .txt file as a {word: vector} dict, as in the model notebooks (float32 vectors)."""
+    glove_model = {}
+    with open(model_path, "r", encoding="utf8") as file:
+        for line in file:
+            parts = line.rstrip().split(" ")
+            glove_model[parts[0]] = np.asarray(parts[1:], dtype=np.float32)
+
+    return glove_model
+
+
+def load_word2vec_model(model_path):
+    """Loads the Google News Word2Vec .bin file as gensim KeyedVectors."""
+    from gensim.models import KeyedVectors
+
+    return KeyedVectors.load_word2vec_format(model_path, binary=True)
+
+
+def model_version(model_path):
+    """Version string of an embedding model file; document vectors built from another version are rebuilt."""
+    stat = os.stat(model_path)
+
+    return f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class DocumentVectors:
+    """
+    Pooled (mean) word vector of every article's content for one embedding model.
+
+    news_ids: News ID per row
+    vectors: (n_articles, d) float32 mean of the article's in-vocabulary word vectors (zeros if none)
+    counts: number of in-vocabulary words behind each mean, so word-weighted user profiles can be rebuilt
+    content_hashes: hash of each article's 'Content' when its row was computed
+    model_version: version of the embedding model the rows were computed with
+    """
+
+    def __init__(self, news_ids, vectors, counts, content_hashes, model_version):
+
+        self.news_ids = np.asarray(news_ids, dtype=object)
+        self.index = pd.Index(self.news_ids)
+        self.vectors = vectors
+        self.counts = counts
+        self.content_hashes = content_hashes
+        self.model_version = model_version
+
+    def rows(self, news_ids):
+        """Unique rows of the given News IDs, skipping unknown ones."""
+        positions = self.index.get_indexer(pd.Index(news_ids).unique())
+
+        return np.unique(positions[positions >= 0])
+
+    def profile(self, read_article_ids):
+        """
+        Mean word vector over all words of the read articles, the interest embedding of the notebooks.
+        Returns None when none of the read articles has an in-vocabulary word.
+        """
+        rows = self.rows(read_article_ids)
+        total = self.counts[rows].sum()
+        if total == 0:
+            return None
+
+        return (self.counts[rows] @ self.vectors[rows]) / total
+
+    def recommend(self, read_article_ids, candidate_article_ids, k=5):
+        """
+        Ranks candidate articles by cosine similarity of their pooled vector with the user's profile.
+        Replaces create_previously_read_content / create_recommended_content plus
+        recommend_articles_content_glove (or _google) with two lookups and one matrix product.
+
+        Returns:
+          [(news_id, similarity)] best first, for candidates with at least one in-vocabulary word.
+        """
+        profile = self.profile(read_article_ids)
+        rows = self.rows(candidate_article_ids)
+        rows = rows[self.counts[rows] > 0]
+        if profile is None or len(rows) == 0:
+            return []
+
+        vectors = self.vectors[rows]
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(profile)
+        scores = (vectors @ profile) / np.where(norms > 0, norms, 1)
+
+        top = np.argsort(-scores, kind="stable")[:k]
+
+        return [(news_id, float(score)) for news_id, score in zip(self.news_ids[rows[top]], scores[top])]
+
+    def save(self, path):
+
+        np.savez(
+            path,
+            news_ids=self.news_ids.astype(str),
+            vectors=self.vectors,
+            counts=self.counts,
+            content_hashes=self.content_hashes,
+            model_version=np.array(self.model_version)
+        )
+
+
+def load_document_vectors(path):
+
+    with np.load(path) as data:
+        return DocumentVectors(
+            data["news_ids"].astype(object),
+            data["vectors"],
+            data["counts"],
+            data["content_hashes"],
+            str(data["model_version"])
+        )
+
+
+def content_hashes(news_df):
+    """64-bit hash of every article's 'Content', used to detect edited articles."""
+    return pd.util.hash_pandas_object(news_df["Content"].fillna(""), index=False).to_numpy()
+
+
+def _dimension(model):
+
+    if hasattr(model, "vector_size"):
+        return model.vector_size
+
+    return len(next(iter(model.values())))
+
+
+def _pool_word_vectors(contents, model):
+    # Tokenize every article once and look up every distinct word once
+    tokens = contents.fillna("").str.split()
+    lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    flat = pd.Series(np.concatenate(tokens.to_numpy()) if lengths.sum() else np.empty(0, dtype=object), dtype=object)
+
+    codes, words = pd.factorize(flat)
+    word_vectors = np.zeros((len(words), _dimension(model)), dtype=np.float32)
+    known = np.zeros(len(words), dtype=bool)
+
+    for i, word in enumerate(words):
+        # Exact word first, then its lowercase form (GloVe only has lowercase words)
+        for candidate in (word, word.lower()):
+            if candidate in model:
+                word_vectors[i] = model[candidate]
+                known[i] = True
+                break
+
+    # (articles x words) count matrix of the known words, times the word vectors, gives the sums
+    owners = np.repeat(np.arange(len(contents)), lengths)
+    keep = known[codes]
+    occurrences = sp.csr_matrix(
+        (np.ones(keep.sum(), dtype=np.float32), (owners[keep], codes[keep])),
+        shape=(len(contents), len(words))
+    )
+    counts = np.bincount(owners[keep], minlength=len(contents)).astype(np.int64)
+
+    return (occurrences @ word_vectors) / np.maximum(counts, 1)[:, None], counts
+
+
+def build_document_vectors(news_df, model, version, previous=None):
+    """
+    Pooled vectors of every article in news_df for one embedding model.
+
+    Rows of `previous` (an earlier DocumentVectors) are reused for articles whose Content hash is
+    unchanged, as long as it was built with the same model version; only new or edited articles
+    are tokenized and looked up.
+    """
+    hashes = content_hashes(news_df)
+    news_ids = news_df["News ID"].to_numpy(dtype=object)
+
+    reuse = np.zeros(len(news_df), dtype=bool)
+    if previous is not None and previous.model_version == version:
+        positions = previous.index.get_indexer(news_ids)
+        reuse = positions >= 0
+        reuse[reuse] = previous.content_hashes[positions[reuse]] == hashes[reuse]
+
+    stale = ~reuse
+    if stale.any():
+        fresh_vectors, fresh_counts = _pool_word_vectors(news_df["Content"][stale], model)
+        dimension = fresh_vectors.shape[1]
+    else:
+        dimension = previous.vectors.shape[1]
+
+    vectors = np.zeros((len(news_df), dimension), dtype=np.float32)
+    counts = np.zeros(len(news_df), dtype=np.int64)
+    if reuse.any():
+        vectors[reuse] = previous.vectors[positions[reuse]]
+        counts[reuse] = previous.counts[positions[reuse]]
+    if stale.any():
+        vectors[stale] = fresh_vectors
+        counts[stale] = fresh_counts
+
+    return DocumentVectors(news_ids, vectors, counts, hashes, version)
+
+
+def precompute_document_vectors(news_df, model, version, output_dir, name):
+    """
+    Offline job: brings output_dir/doc_vectors_<name>.npz up to date with news_df and the given model
+    version, recomputing only stale rows, and saves it.
+
+    Parameters:
+      news_df (DataFrame): Clean news with 'News ID' and 'Content'.
+      model: gensim KeyedVectors or {word: vector} dict (see load_word2vec_model / load_glove_model).
+      version (str): Model version, e.g. model_version(model_path).
+      output_dir (str): Folder of the matrix files.
+      name (str): Embedding model name, e.g. 'word2vec_google' or 'word2vec_glove'.
+    """
+    path = os.path.join(output_dir, DOCUMENT_VECTORS_FILE.format(name=name))
+    previous = load_document_vectors(path) if os.path.exists(path) else None
+
+    document_vectors = build_document_vectors(news_df, model, version, previous=previous)
+    os.makedirs(output_dir, exist_ok=True)
+    document_vectors.save(path)
+
+    return document_vectors
+
+
+def is_current(document_vectors, news_df, version):
+    """Whether document_vectors covers exactly news_df's articles and texts with the given model version."""
+    return (
+        document_vectors.model_version == version
+        and len(document_vectors.news_ids) == len(news_df)
+        and np.array_equal(document_vectors.news_ids, news_df["News ID"].to_numpy(dtype=object))
+        and np.array_equal(document_vectors.content_hashes, content_hashes(news_df))
+    )